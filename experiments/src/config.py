@@ -1,9 +1,67 @@
 import pathlib
 
 OLLAMA_HOST = "https://ollama-dev.ceos.ufsc.br/"
+# Ollama hosts shared by the extractions (see endpoints.py). Every extraction
+# goes to the healthy host with the model that has the fewest requests in
+# flight, preferring hosts with the model loaded. The hosts and their models
+# are checked every HEALTH_SECONDS, each check timing out after HEALTH_TIMEOUT
+# seconds. Empty uses OLLAMA_HOST alone.
+OLLAMA_HOSTS: list[str] = []
+# Servers with the OpenAI chat completions API, such as vLLM or the llama.cpp
+# server, for the experiments with backend "openai" (see backends.py). They are
+# reached at these base URLs and must serve the models under their Ollama
+# names.
+OPENAI_HOSTS: list[str] = ["http://localhost:8000/v1"]
+HEALTH_SECONDS = 30
+HEALTH_TIMEOUT = 5
+# Time limits of every extraction, in seconds, or None to wait forever. An
+# extraction that receives no chunk for FIRST_TOKEN_TIMEOUT seconds, the first
+# one included, or that has not finished after REQUEST_DEADLINE seconds is
+# cancelled, closing its stream so the host stops generating. A stalled
+# extraction fails as a transport error; one past its deadline is not retried
+# and does not count toward the circuit breaker, as a slow host is not down.
+FIRST_TOKEN_TIMEOUT = None
+REQUEST_DEADLINE = None
+# Number of extractions kept in flight across the hosts; the servers must be
+# started with OLLAMA_NUM_PARALLEL set to at least this value for them to run
+# in parallel. With ADAPTIVE_CONCURRENCY the limit adapts to the load of the
+# hosts (see concurrency.py), starting at MIN_CONCURRENT_REQUESTS: it grows by
+# one while extractions find it reached, wait at most
+# ADAPTIVE_FIRST_TOKEN_SECONDS for their first token and stream at least
+# ADAPTIVE_TOKENS_PER_SECOND, and is multiplied by ADAPTIVE_BACKOFF when they
+# do not or fail in transport. The limit is logged after every experiment.
+MAX_CONCURRENT_REQUESTS = 1
+ADAPTIVE_CONCURRENCY = False
+MIN_CONCURRENT_REQUESTS = 1
+ADAPTIVE_FIRST_TOKEN_SECONDS = 15
+ADAPTIVE_TOKENS_PER_SECOND = 5
+ADAPTIVE_BACKOFF = 0.7
+# Validate every answer as it streams (see incremental.py), cancelling it as
+# soon as a field fails its constraints, a string repeats a span of
+# REPETITION_MIN_CHARS to REPETITION_MAX_CHARS characters REPETITION_REPEATS
+# times in a row, or more than MAX_WHITESPACE whitespace characters come in a
+# row between the fields. A cancelled answer fails as one that fails
+# validation, without waiting for the rest of it.
+VALIDATE_STREAM = False
+REPETITION_REPEATS = 4
+REPETITION_MIN_CHARS = 10
+REPETITION_MAX_CHARS = 200
+MAX_WHITESPACE = 50
 OPTIONS = {
     "temperature": 0,
     "seed": 42,
 }
 PROMPTS_PATH = pathlib.Path("./resources/prompts")
 RESULTS_PATH = pathlib.Path("./resources/results")
+# Retries of the extractions (see retry.py and utils.backoff). Answers that
+# fail validation are attempted SCHEMA_ATTEMPTS times: with temperature 0 and a
+# seed another attempt repeats the answer. Every extraction earns
+# RETRY_BUDGET_RATIO retries, banked up to RETRY_BUDGET_CAPACITY. After
+# CIRCUIT_FAILURES consecutive transport errors the host is taken as down and
+# the experiment stops, instead of retrying for hours; a trial request goes
+# through again after CIRCUIT_SECONDS.
+SCHEMA_ATTEMPTS = 1
+RETRY_BUDGET_RATIO = 0.2
+RETRY_BUDGET_CAPACITY = 10
+CIRCUIT_FAILURES = 5
+CIRCUIT_SECONDS = 60
@@ -17,6 +17,11 @@ class LLMModel(StrEnum):
     DEEPSEEK_R1_70B = "deepseek-r1:70b"
 
 
+class Backend(StrEnum):
+    OLLAMA = "ollama"
+    OPENAI = "openai"
+
+
 class Shots(StrEnum):
     ZERO_SHOT = "zero_shot"
     ONE_SHOT = "one_shot"
@@ -50,6 +55,7 @@ class ExperimentConfig(BaseModel):
     shot: Shots
     rag_config: Optional[RagConfig]
     model: LLMModel
+    backend: Backend = Backend.OLLAMA
 
 
 def load_configurations(experiments):
@@ -79,6 +85,7 @@ def load_configurations(experiments):
                 shot=exp.get("shot", "zero_shot"),
                 rag_config=rag_config,
                 model=exp["model"],
+                backend=exp.get("backend", Backend.OLLAMA),
             )
         )
         ids.append(exp["id"])
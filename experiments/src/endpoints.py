@@ -0,0 +1,214 @@
+import asyncio
+import contextlib
+import threading
+import time
+from typing import AsyncIterator, Collection, Dict, Iterator, List, Optional, Set
+
+import backends
+import retry
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class NoEndpointError(ConnectionError):
+    """Raised when no healthy host has the model, retried as a transport error."""
+
+
+def _has(models: Set[str], model: str) -> bool:
+    # Ollama lists untagged models with the ":latest" tag.
+    return model in models or f"{model}:latest" in models
+
+
+class Endpoint:
+    """
+    An LLM server, with one backend for its requests and one for its health
+    checks. Their clients are created on first use, so every request to the
+    host shares their pooled connections. A request receiving nothing for
+    read_timeout seconds fails with a transport error.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        health_timeout: float,
+        read_timeout: Optional[float] = None,
+        backend: str = backends.OLLAMA,
+    ):
+        self.host = host
+        self.backend = backends.BACKENDS[backend](host, read_timeout)
+        self._probe = backends.BACKENDS[backend](host, health_timeout)
+        self.outstanding = 0
+        # None until the first health check.
+        self.healthy: Optional[bool] = None
+        # The models the host has, and those it keeps loaded in memory.
+        self.models: Set[str] = set()
+        self.loaded: Set[str] = set()
+
+    def _update(self, models: Set[str], loaded: Set[str]) -> None:
+        self.models, self.loaded = models, loaded
+        self.healthy = True
+
+    def mark_down(self, error: Exception) -> None:
+        """Leaves the host out until its next health check."""
+        if self.healthy is not False:
+            logger.warning(f"Host {self.host} is down: {error!r}")
+        self.healthy = False
+
+    def check(self) -> None:
+        """Checks the health and the models of the host."""
+        try:
+            self._update(*self._probe.models())
+        except Exception as error:
+            self.mark_down(error)
+
+    async def check_async(self) -> None:
+        try:
+            self._update(*await self._probe.models_async())
+        except Exception as error:
+            self.mark_down(error)
+
+
+class Pool:
+    """
+    Routes requests over several LLM servers.
+
+    Every request goes to the healthy host with the model that has the
+    fewest requests in flight from this process, preferring hosts with the
+    model already loaded on ties. Hosts are checked every health_seconds,
+    and a host failing a request in transport is left out until the next
+    check.
+    """
+
+    def __init__(
+        self,
+        hosts: List[str],
+        health_seconds: float,
+        health_timeout: float,
+        read_timeout: Optional[float] = None,
+        backend: str = backends.OLLAMA,
+    ):
+        """
+        Args:
+            hosts: The URLs of the servers.
+            health_seconds: Interval between health checks.
+            health_timeout: Timeout of a health check, in seconds.
+            read_timeout: Time a request may wait for its first or next
+                chunk, in seconds, or None to wait forever.
+            backend: The API of the servers, a key of backends.BACKENDS.
+        """
+        self.endpoints = [
+            Endpoint(host, health_timeout, read_timeout, backend) for host in hosts
+        ]
+        self.health_seconds = health_seconds
+        self._checked_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"Pool({[endpoint.host for endpoint in self.endpoints]})"
+
+    def _is_stale(self) -> bool:
+        return (
+            self._checked_at is None
+            or time.monotonic() - self._checked_at >= self.health_seconds
+        )
+
+    def check(self) -> None:
+        for endpoint in self.endpoints:
+            endpoint.check()
+        self._checked_at = time.monotonic()
+
+    async def check_async(self) -> None:
+        await asyncio.gather(*(endpoint.check_async() for endpoint in self.endpoints))
+        self._checked_at = time.monotonic()
+
+    def _choose(self, model: str, avoid: Collection[str] = ()) -> Optional[Endpoint]:
+        candidates = [
+            endpoint
+            for endpoint in self.endpoints
+            if endpoint.healthy
+            and _has(endpoint.models, model)
+            and endpoint.host not in avoid
+        ]
+        if not candidates:
+            return None
+        return min(
+            candidates,
+            key=lambda endpoint: (
+                endpoint.outstanding,
+                not _has(endpoint.loaded, model),
+            ),
+        )
+
+    def _take(self, model: str, avoid: Collection[str]) -> Endpoint:
+        with self._lock:
+            endpoint = self._choose(model, avoid)
+            if endpoint is None:
+                besides = f" besides {sorted(avoid)}" if avoid else ""
+                raise NoEndpointError(
+                    f"No healthy host has {model}{besides}: {self.status()}"
+                )
+            endpoint.outstanding += 1
+            return endpoint
+
+    def _release(self, endpoint: Endpoint, error: Optional[Exception]) -> None:
+        with self._lock:
+            endpoint.outstanding -= 1
+        if error is not None and retry.classify(error) == retry.TRANSPORT:
+            endpoint.mark_down(error)
+
+    @contextlib.contextmanager
+    def acquire(self, model: str, avoid: Collection[str] = ()) -> Iterator[Endpoint]:
+        """
+        Takes the host for a request while it is in flight.
+
+        Args:
+            model: The model of the request.
+            avoid: Hosts left out, such as those already running a duplicate
+                of the request.
+
+        Raises:
+            NoEndpointError: When no healthy host has the model.
+        """
+        if self._is_stale() or self._choose(model, avoid) is None:
+            self.check()
+        endpoint = self._take(model, avoid)
+        failure = None
+        try:
+            yield endpoint
+        except Exception as error:
+            failure = error
+            raise
+        finally:
+            self._release(endpoint, failure)
+
+    @contextlib.asynccontextmanager
+    async def acquire_async(
+        self, model: str, avoid: Collection[str] = ()
+    ) -> AsyncIterator[Endpoint]:
+        if self._is_stale() or self._choose(model, avoid) is None:
+            await self.check_async()
+        endpoint = self._take(model, avoid)
+        failure = None
+        try:
+            yield endpoint
+        except Exception as error:
+            failure = error
+            raise
+        finally:
+            self._release(endpoint, failure)
+
+    def status(self) -> Dict[str, str]:
+        """
+        Returns:
+            The state of every host: down, or its requests in flight and
+            loaded models.
+        """
+        return {
+            endpoint.host: (
+                f"{endpoint.outstanding} in flight, loaded {sorted(endpoint.loaded)}"
+                if endpoint.healthy
+                else "down"
+            )
+            for endpoint in self.endpoints
+        }
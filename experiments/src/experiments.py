@@ -1,12 +1,16 @@
+import concurrent.futures
 import json
 import time
 from typing import Dict, List
 
+import concurrency
 import config
+import endpoints
 import examples
+import incremental
 import metrics
-import ollama
 import rag
+import retry
 import utils
 import yaml
 from data import experiment
@@ -14,26 +18,80 @@ from logger import get_logger
 
 logger = get_logger(__name__)
 
+# Shared by every extraction, so the limit carries over between experiments.
+limiter = concurrency.Limiter(
+    config.MIN_CONCURRENT_REQUESTS
+    if config.ADAPTIVE_CONCURRENCY
+    else config.MAX_CONCURRENT_REQUESTS,
+    config.MAX_CONCURRENT_REQUESTS,
+    config.ADAPTIVE_FIRST_TOKEN_SECONDS,
+    config.ADAPTIVE_TOKENS_PER_SECOND,
+    config.ADAPTIVE_BACKOFF,
+)
+
 
 @utils.backoff(retries=100)
 def extract(client, prompts, experiment_config, key, task_id):
     logger.info(f"Task {task_id}: Starting extraction for document {key}")
     start_time = time.perf_counter()
+    deadline = config.REQUEST_DEADLINE
+    timed_out = False
+    aborted = None
+    validator = None
+    if config.VALIDATE_STREAM:
+        validator = incremental.Validator(
+            experiment_config.extraction_model,
+            False,
+            config.REPETITION_REPEATS,
+            config.REPETITION_MIN_CHARS,
+            config.REPETITION_MAX_CHARS,
+            config.MAX_WHITESPACE,
+        )
 
-    stream = client.chat(
-        model=experiment_config.model,
-        messages=prompts,
-        format=experiment_config.extraction_model.model_json_schema(),
-        options=config.OPTIONS,
-        stream=True,
-    )
+    with limiter.acquire() as measure:
+        with client.acquire(experiment_config.model) as endpoint:
+            stream = endpoint.backend.chat(
+                experiment_config.model,
+                prompts,
+                experiment_config.extraction_model.model_json_schema(),
+                config.OPTIONS,
+            )
 
-    content_parts: list[str] = []
-    for chunk in stream:
-        piece = chunk.get("message", {}).get("content")
-        if piece:
-            content_parts.append(piece)
-            print(piece, end="", flush=True)
+            content_parts: list[str] = []
+            for piece in stream:
+                measure.token()
+                content_parts.append(piece)
+                # Several streams in flight would be interleaved.
+                if config.MAX_CONCURRENT_REQUESTS == 1:
+                    print(piece, end="", flush=True)
+                # A stalled stream is cut by FIRST_TOKEN_TIMEOUT, between chunks.
+                elapsed = time.perf_counter() - measure.start
+                if deadline is not None and elapsed > deadline:
+                    # Closing the stream closes its connection.
+                    stream.close()
+                    timed_out = True
+                    break
+                if validator is not None:
+                    try:
+                        validator.feed(piece)
+                    except incremental.AbortedAnswer as error:
+                        stream.close()
+                        aborted = error
+                        break
+
+        # Raised outside the pool, as a slow answer does not mean the host is
+        # down, but seen by the limiter, as it may mean it is overloaded.
+        if timed_out:
+            raise retry.DeadlineExceeded(
+                f"Document {key} passed its deadline of {deadline} s"
+            )
+
+    # Attempted again as an answer that fails validation.
+    if aborted is not None:
+        logger.warning(
+            f"Task {task_id}: Aborted the answer for document {key}: {aborted}"
+        )
+        raise aborted
 
     full_content = "".join(content_parts)
 
@@ -42,10 +100,11 @@ def extract(client, prompts, experiment_config, key, task_id):
     )
 
     logger.info(
-        "Task %s: Finished extraction for document %s in %.2f s",
+        "Task %s: Finished extraction for document %s in %.2f s on %s",
         task_id,
         key,
         time.perf_counter() - start_time,
+        endpoint.host,
     )
     return extracted_data.dict()
 
@@ -124,15 +183,27 @@ def process_documents(client, experiment_config: experiment.ExperimentConfig):
     logger.info(f"Total documents to process: {len(sample)}")
     results = {}
 
-    for task_id, key in enumerate(sample):
-        prompts = process_prompts(
-            experiment_config, sample[key].titulo, sample[key].texto
-        )
-        result = extract(client, prompts, experiment_config, key, task_id)
-        if result is not None:
-            results[key] = result
+    # The limiter holds the extractions beyond its limit, so the pool only
+    # caps them at MAX_CONCURRENT_REQUESTS.
+    with concurrent.futures.ThreadPoolExecutor(config.MAX_CONCURRENT_REQUESTS) as pool:
+        futures = {}
+        for task_id, key in enumerate(sample):
+            prompts = process_prompts(
+                experiment_config, sample[key].titulo, sample[key].texto
+            )
+            futures[key] = pool.submit(
+                extract, client, prompts, experiment_config, key, task_id
+            )
+        # In the order of the sample, as before.
+        for key, future in futures.items():
+            result = future.result()
+            if result is not None:
+                results[key] = result
 
     logger.info("All extractions completed.")
+    logger.info(f"Retries: {dict(retry.counters)}")
+    retry.counters.clear()
+    logger.info(f"Concurrency: {limiter.status()}")
     return results
 
 
@@ -142,6 +213,13 @@ def run():
     best_per_field = {}
     scores = {}
     averages = {}
+    # One pool per backend for every experiment, so connections are reused
+    # across them.
+    hosts = {
+        experiment.Backend.OLLAMA: config.OLLAMA_HOSTS or [config.OLLAMA_HOST],
+        experiment.Backend.OPENAI: config.OPENAI_HOSTS,
+    }
+    pools = {}
     for file in config.PROMPTS_PATH.iterdir():
         if file.stat().st_size == 0:
             logger.info(f"Skipping empty file: {file}")
@@ -153,7 +231,6 @@ def run():
 
         with file.open() as f:
             experiments = yaml.safe_load(f)
-        client = ollama.Client(host=config.OLLAMA_HOST)
         experiment_configurations = experiment.load_configurations(experiments)
         for exp_config in experiment_configurations:
             output_path = (
@@ -164,7 +241,15 @@ def run():
                 with output_path.open("r") as f:
                     result = json.load(f)
             else:
-                result = process_documents(client, exp_config)
+                if exp_config.backend not in pools:
+                    pools[exp_config.backend] = endpoints.Pool(
+                        hosts[exp_config.backend],
+                        config.HEALTH_SECONDS,
+                        config.HEALTH_TIMEOUT,
+                        config.FIRST_TOKEN_TIMEOUT,
+                        exp_config.backend,
+                    )
+                result = process_documents(pools[exp_config.backend], exp_config)
                 output_path.parent.mkdir(parents=True, exist_ok=True)
                 with output_path.open("w") as f:
                     json.dump(result, f, indent=2, ensure_ascii=False)
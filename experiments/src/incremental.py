@@ -0,0 +1,262 @@
+import functools
+import json
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type, get_args
+
+import pydantic
+
+_WHITESPACE = " \t\r\n"
+
+
+class AbortedAnswer(ValueError):
+    """
+    Raised when a streamed answer goes wrong before its end.
+
+    Attributes:
+        content: The JSON of the part of the answer read so far that is
+            valid: the valid fields of a document, or the complete and valid
+            items of a batch, a looping string cut before its loop.
+    """
+
+    def __init__(self, reason: str, content: str):
+        super().__init__(reason)
+        self.content = content
+
+
+@functools.lru_cache
+def _field_model(model: Type[pydantic.BaseModel], field: str):
+    info = model.model_fields[field]
+    return pydantic.create_model(model.__name__, **{field: (info.annotation, info)})
+
+
+def is_valid(model: Type[pydantic.BaseModel], field: str, value: Any) -> bool:
+    """
+    Returns:
+        Whether the value passes the constraints of a field of the model.
+    """
+    try:
+        _field_model(model, field).model_validate_json(
+            json.dumps({field: value}), strict=True
+        )
+    except pydantic.ValidationError:
+        return False
+    return True
+
+
+def _decode(string: str) -> str:
+    # The content of a JSON string, escapes included, taken as it is when
+    # they are broken.
+    try:
+        return json.loads(f'"{string}"')
+    except json.JSONDecodeError:
+        return string
+
+
+def repeated(text: str, repeats: int, min_chars: int, max_chars: int) -> Optional[str]:
+    """
+    Returns:
+        The span of min_chars to max_chars characters that ends the text
+        repeated repeats times in a row, or None. Spans of a single character,
+        or without letters and digits, are not repetitions: gazettes fill
+        lines with leaders such as "____" or ". . . .".
+    """
+    for chars in range(min_chars, min(max_chars, len(text) // repeats) + 1):
+        span = text[-chars:]
+        if len(set(span)) == 1 or not any(char.isalnum() for char in span):
+            continue
+        if text.endswith(span * repeats):
+            return span
+    return None
+
+
+class Validator:
+    """
+    Parses a JSON answer as it streams and checks every field of the model as
+    soon as its value is complete, so a generation gone wrong is cut short.
+
+    An answer goes wrong when a field fails its constraints, such as an
+    invalid enum value or a broken pattern, when a string ends in a span
+    repeated repetition_repeats times, the LLM looping on a text, or when
+    more than max_whitespace whitespace characters come in a row outside the
+    strings, the LLM padding the JSON. Syntax errors are left to the
+    validation of the whole answer.
+    """
+
+    def __init__(
+        self,
+        model: Type[pydantic.BaseModel],
+        batch: bool,
+        repetition_repeats: int,
+        repetition_min_chars: int,
+        repetition_max_chars: int,
+        max_whitespace: int,
+        repair: Optional[Callable[[str, Any], Any]] = None,
+    ):
+        """
+        Args:
+            model: The model of the answer.
+            batch: Whether the model is that of a batch, with a single field
+                listing the items, whose fields are checked instead.
+            repair: Fixes an invalid value of a field, returning it as it is
+                when it cannot. Values it fixes are tolerated and kept as
+                they came, to be fixed with the whole answer.
+        """
+        self.model = model
+        self.items_key: Optional[str] = None
+        if batch:
+            ((self.items_key, info),) = model.model_fields.items()
+            self.model = get_args(info.annotation)[0]
+        self.repetition_repeats = repetition_repeats
+        self.repetition_min_chars = repetition_min_chars
+        self.repetition_max_chars = repetition_max_chars
+        self.max_whitespace = max_whitespace
+        self.repair = repair
+        # The valid fields of the document, or of every item by index, and
+        # the indexes of the complete items.
+        self.values: Dict[Any, Dict[str, Any]] = {}
+        self.complete: List[int] = []
+        # Open objects and arrays, with the key or index of their current
+        # value.
+        self._stack: List[Dict[str, Any]] = []
+        self._string: Optional[str] = None
+        self._escaped = False
+        self._checked = 0
+        self._literal = ""
+        self._whitespace = 0
+
+    def content(self) -> str:
+        """
+        Returns:
+            The JSON of the valid part of the answer read so far.
+        """
+        if self.items_key is None:
+            return json.dumps(self.values.get(None, {}), ensure_ascii=False)
+        items = [self.values.get(index, {}) for index in self.complete]
+        return json.dumps({self.items_key: items}, ensure_ascii=False)
+
+    def feed(self, piece: str) -> None:
+        """
+        Raises:
+            AbortedAnswer: When the answer goes wrong.
+        """
+        for char in piece:
+            if self._string is not None:
+                self._read_string(char)
+            elif char in _WHITESPACE:
+                self._end_literal()
+                self._whitespace += 1
+                if self._whitespace > self.max_whitespace:
+                    self._abort(f"{self._whitespace} whitespace characters in a row")
+            else:
+                self._whitespace = 0
+                self._read(char)
+
+    def _abort(self, reason: str) -> None:
+        raise AbortedAnswer(reason, self.content())
+
+    def _path(self) -> tuple:
+        return tuple(
+            container["index"] if container["array"] else container["key"]
+            for container in self._stack
+        )
+
+    def _read(self, char: str) -> None:
+        if char == '"':
+            self._string, self._checked = "", 0
+        elif char in "{[":
+            self._stack.append({"array": char == "[", "key": None, "index": 0})
+        elif char in "}]":
+            self._end_literal()
+            path = self._path()
+            self._stack.pop()
+            if self.items_key is not None and path[:1] == (self.items_key,):
+                if len(path) == 3 and isinstance(path[1], int):
+                    self.complete.append(path[1])
+        elif char == ",":
+            self._end_literal()
+            if self._stack and self._stack[-1]["array"]:
+                self._stack[-1]["index"] += 1
+            elif self._stack:
+                self._stack[-1]["key"] = None
+        elif char != ":":
+            self._literal += char
+
+    def _read_string(self, char: str) -> None:
+        if self._escaped:
+            self._escaped = False
+        elif char == "\\":
+            self._escaped = True
+        elif char == '"':
+            self._end_string()
+            return
+        self._string += char
+        if len(self._string) - self._checked >= self.repetition_min_chars:
+            self._checked = len(self._string)
+            span = repeated(
+                self._string,
+                self.repetition_repeats,
+                self.repetition_min_chars,
+                self.repetition_max_chars,
+            )
+            if span is not None:
+                # The value is kept with the span once, as the LLM wrote it
+                # before looping.
+                looping = self._string
+                end = len(looping) - (self.repetition_repeats - 1) * len(span)
+                location = self._location()
+                value = _decode(looping[:end])
+                if location is not None and self._is_valid(location[1], value):
+                    self._keep(location, value)
+                path = self._path()
+                self._abort(f"{path[-1] if path else 'answer'} repeats {span!r}")
+
+    def _end_string(self) -> None:
+        value = _decode(self._string)
+        self._string = None
+        top = self._stack[-1] if self._stack else None
+        if top is not None and not top["array"] and top["key"] is None:
+            top["key"] = value
+        else:
+            self._end_value(value)
+
+    def _end_literal(self) -> None:
+        if not self._literal:
+            return
+        literal, self._literal = self._literal, ""
+        try:
+            self._end_value(json.loads(literal))
+        except json.JSONDecodeError:
+            pass
+
+    def _location(self) -> Optional[Tuple[Any, str]]:
+        # The document, None unless in a batch, and the field of the current
+        # value, if it is a field of the model.
+        path = self._path()
+        if self.items_key is None and len(path) == 1:
+            document, field = None, path[0]
+        elif self.items_key is not None and len(path) == 3:
+            if path[0] != self.items_key or not isinstance(path[1], int):
+                return None
+            document, field = path[1], path[2]
+        else:
+            return None
+        if field not in self.model.model_fields:
+            return None
+        return document, field
+
+    def _is_valid(self, field: str, value: Any) -> bool:
+        return is_valid(self.model, field, value) or (
+            self.repair is not None
+            and is_valid(self.model, field, self.repair(field, value))
+        )
+
+    def _keep(self, location: Tuple[Any, str], value: Any) -> None:
+        document, field = location
+        self.values.setdefault(document, {})[field] = value
+
+    def _end_value(self, value: Any) -> None:
+        location = self._location()
+        if location is None:
+            return
+        if not self._is_valid(location[1], value):
+            self._abort(f"{location[1]} is invalid: {value!r}")
+        self._keep(location, value)
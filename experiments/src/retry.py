@@ -0,0 +1,304 @@
+import asyncio
+import collections
+import itertools
+import json
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, NamedTuple, Optional
+
+import httpx
+import incremental
+import pydantic
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# Errors of the connection or the server, worth another attempt after a while.
+TRANSPORT = "transport"
+# Answers that fail validation, worth another attempt only when sampling.
+SCHEMA = "schema"
+# Answers that passed their deadline. The endpoint is up but slow, so they
+# count neither for nor against its circuit, though a trial past its deadline
+# leaves the circuit open.
+DEADLINE = "deadline"
+
+# Calls, retries by kind, given up calls, retries denied by the budget and
+# calls refused by an open circuit, across the process.
+counters: Dict[str, int] = collections.Counter()
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an endpoint whose circuit is open."""
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when an answer is still streaming at its deadline."""
+
+
+class Policy(NamedTuple):
+    attempts: int
+    base_seconds: float
+    max_seconds: float
+
+    def delay(self, previous: float) -> float:
+        """
+        Returns:
+            The sleep before the next attempt, with decorrelated jitter: a
+            random value between the base and three times the previous sleep,
+            capped, so that clients failing together do not retry together.
+        """
+        upper = max(previous, self.base_seconds) * 3
+        return min(self.max_seconds, random.uniform(self.base_seconds, upper))
+
+
+def classify(error: BaseException) -> Optional[str]:
+    """
+    Returns:
+        TRANSPORT, SCHEMA, DEADLINE or None for errors that another attempt
+        cannot fix, such as an unknown model.
+    """
+    if isinstance(error, DeadlineExceeded):
+        return DEADLINE
+    error_types = (
+        pydantic.ValidationError,
+        json.JSONDecodeError,
+        incremental.AbortedAnswer,
+    )
+    if isinstance(error, error_types):
+        return SCHEMA
+    # ollama.ResponseError and the status errors of the optional openai
+    # package (see backends.py) carry the status code of the response.
+    status = getattr(error, "status_code", None)
+    if isinstance(status, int):
+        # Errors reported in the middle of an Ollama stream have no status
+        # code, given as -1.
+        return TRANSPORT if status < 0 or status >= 500 or status == 429 else None
+    if isinstance(error, (httpx.TransportError, ConnectionError, TimeoutError)):
+        return TRANSPORT
+    return None
+
+
+class Budget:
+    """
+    Bounds the retries to a share of the calls, so that a failing server is
+    not flooded with retries. Every call earns ratio retries, banked up to
+    capacity, and every retry spends one.
+    """
+
+    def __init__(self, ratio: float, capacity: float):
+        self.ratio = ratio
+        self.capacity = capacity
+        self._tokens = capacity
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class CircuitBreaker:
+    """
+    Fails fast on an endpoint that is down.
+
+    The circuit opens after failures consecutive transport errors, and
+    calls are refused while it is open. After reset_seconds one trial call
+    goes through: its success closes the circuit, its failure opens it again,
+    and so does a trial that ends without telling, past its deadline or
+    cancelled.
+    """
+
+    def __init__(self, failures: int, reset_seconds: float):
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self._consecutive = 0
+        self._opened_at: Optional[float] = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial or time.monotonic() - self._opened_at < self.reset_seconds:
+                return False
+            self._trial = True
+            return True
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def success(self) -> None:
+        with self._lock:
+            self._consecutive = 0
+            self._opened_at = None
+            self._trial = False
+
+    def failure(self) -> None:
+        with self._lock:
+            self._consecutive += 1
+            if self._trial or self._consecutive >= self.failures:
+                self._opened_at = time.monotonic()
+                self._trial = False
+
+    def abandon(self) -> None:
+        """
+        Records a call that neither succeeded nor failed, which opens the
+        circuit again if it was the trial, so that another trial follows.
+        """
+        with self._lock:
+            if self._trial:
+                self._opened_at = time.monotonic()
+                self._trial = False
+
+
+class Retrier:
+    """
+    Calls functions with retries, sharing a retry budget and one circuit
+    breaker per endpoint among all of them.
+    """
+
+    def __init__(
+        self,
+        budget: Budget,
+        circuit_failures: int,
+        circuit_reset_seconds: float,
+    ):
+        """
+        Args:
+            budget: The retry budget shared by every call.
+            circuit_failures: Consecutive transport errors that open the
+                circuit of an endpoint.
+            circuit_reset_seconds: Time an open circuit refuses calls.
+        """
+        self.budget = budget
+        self.circuit_failures = circuit_failures
+        self.circuit_reset_seconds = circuit_reset_seconds
+        self._breakers: Dict[Hashable, CircuitBreaker] = {}
+
+    def breaker(self, endpoint: Hashable) -> CircuitBreaker:
+        if endpoint not in self._breakers:
+            self._breakers[endpoint] = CircuitBreaker(
+                self.circuit_failures, self.circuit_reset_seconds
+            )
+        return self._breakers[endpoint]
+
+    def _enter(self, endpoint: Hashable, attempt: int) -> None:
+        if attempt == 1:
+            counters["calls"] += 1
+            self.budget.deposit()
+        if not self.breaker(endpoint).allow():
+            counters["circuit_open"] += 1
+            raise CircuitOpenError(f"The circuit of {endpoint} is open")
+
+    def _retry_delay(
+        self,
+        endpoint: Hashable,
+        policies: Dict[str, Policy],
+        error: Exception,
+        attempt: int,
+        previous: float,
+    ) -> Optional[float]:
+        # Records a failed attempt and returns the sleep before the next one,
+        # or None to give up.
+        kind = classify(error)
+        if kind == TRANSPORT:
+            self.breaker(endpoint).failure()
+            if self.breaker(endpoint).is_open:
+                counters["circuit_open"] += 1
+                raise CircuitOpenError(f"The circuit of {endpoint} is open") from error
+        elif kind == DEADLINE:
+            self.breaker(endpoint).abandon()
+        else:
+            # The endpoint answered, so it is up.
+            self.breaker(endpoint).success()
+        policy = policies.get(kind)
+        if policy is None or attempt >= policy.attempts:
+            counters["failures"] += 1
+            return None
+        if not self.budget.withdraw():
+            counters["budget_exhausted"] += 1
+            return None
+        counters[f"retries_{kind}"] += 1
+        return policy.delay(previous)
+
+    def call(
+        self,
+        endpoint: Hashable,
+        policies: Dict[str, Policy],
+        func: Callable[..., Any],
+        *args,
+        **kwargs,
+    ) -> Any:
+        """
+        Calls func until it succeeds or its error is not to be retried.
+
+        Args:
+            endpoint: The endpoint func talks to, for its circuit breaker.
+            policies: The policy of every kind of error that is retried.
+            func: The function to call with args and kwargs.
+
+        Returns:
+            The result of func.
+
+        Raises:
+            CircuitOpenError: When the circuit of the endpoint is open.
+            Exception: The last error of func.
+        """
+        delay = 0.0
+        for attempt in itertools.count(1):
+            self._enter(endpoint, attempt)
+            try:
+                result = func(*args, **kwargs)
+            except Exception as error:
+                delay = self._retry_delay(endpoint, policies, error, attempt, delay)
+                if delay is None:
+                    raise
+                logger.warning(
+                    f"Attempt {attempt} of {func.__name__} failed ({error!r}), "
+                    f"retrying in {delay:.1f} s"
+                )
+                time.sleep(delay)
+            else:
+                self.breaker(endpoint).success()
+                return result
+
+    async def call_async(
+        self,
+        endpoint: Hashable,
+        policies: Dict[str, Policy],
+        func: Callable[..., Any],
+        *args,
+        **kwargs,
+    ) -> Any:
+        """
+        Awaits the coroutine function func the way call calls a function.
+        """
+        delay = 0.0
+        for attempt in itertools.count(1):
+            self._enter(endpoint, attempt)
+            try:
+                result = await func(*args, **kwargs)
+            except asyncio.CancelledError:
+                self.breaker(endpoint).abandon()
+                raise
+            except Exception as error:
+                delay = self._retry_delay(endpoint, policies, error, attempt, delay)
+                if delay is None:
+                    raise
+                logger.warning(
+                    f"Attempt {attempt} of {func.__name__} failed ({error!r}), "
+                    f"retrying in {delay:.1f} s"
+                )
+                await asyncio.sleep(delay)
+            else:
+                self.breaker(endpoint).success()
+                return result
@@ -0,0 +1,77 @@
+import html
+import json
+import re
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Only this benchmark still imports bs4, for the reference cleaner, and it is no
+# longer a dependency of the project. Run it from experiments/ with
+# uv run --with beautifulsoup4 src/scripts/benchmark_clean_html.py
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from utils import clean_html_text  # noqa: E402
+
+data_path = Path(__file__).resolve().parents[2] / "resources/ground_truth_data.json"
+repeats = 5
+
+
+def legacy_clean_html_text(input_text: str) -> str:
+    # Previous implementation, kept here as the reference.
+    text_without_html = BeautifulSoup(input_text, "html.parser").get_text()
+    text_unescaped = html.unescape(text_without_html)
+    text_normalized_x00 = re.sub(r"\x00", "", text_unescaped)
+    text_normalized_fffd = re.sub(r"\uFFFD", "", text_normalized_x00)
+    text_normalized_new_lines = re.sub(r"\n{2, }", "\n\n", text_normalized_fffd)
+    text_normalized_spaces = re.sub(r" +", " ", text_normalized_new_lines)
+    return text_normalized_spaces.strip().strip("\n").strip("\r")
+
+
+def legacy_with_newline_fix(input_text: str) -> str:
+    # The legacy cleaner with "\n{2,}" in place of the "\n{2, }" typo, which
+    # is the only behaviour the new cleaner is meant to change.
+    text = html.unescape(BeautifulSoup(input_text, "html.parser").get_text())
+    text = re.sub(r"[\x00\uFFFD]", "", text)
+    text = re.sub(r"\n{2,}", "\n\n", text)
+    return re.sub(r" +", " ", text).strip()
+
+
+def measure(function, texts):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for text in texts:
+            function(text)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+documents = json.loads(data_path.read_text(encoding="utf-8"))
+texts = [html.unescape(item["texto"]) for item in documents]
+total_mb = sum(len(text.encode("utf-8")) for text in texts) / 1e6
+
+mismatches = [
+    item["codigo"]
+    for item, text in zip(documents, texts)
+    if clean_html_text(text) != legacy_with_newline_fix(text)
+]
+print(f"Documents: {len(texts)} ({total_mb:.1f} MB of HTML)")
+print(f"Outputs differing from the legacy cleaner (newline fix aside): {mismatches}")
+
+blank_line_runs = sum(
+    len(re.findall(r"\n{3,}", legacy_clean_html_text(text))) for text in texts
+)
+print(f"Runs of 3+ newlines left by the legacy cleaner: {blank_line_runs}")
+
+for name, function in [
+    ("legacy clean_html_text", legacy_clean_html_text),
+    ("clean_html_text", clean_html_text),
+]:
+    elapsed = measure(function, texts)
+    print(
+        f"{name:>24}: {elapsed * 1000:8.1f} ms, "
+        f"{len(texts) / elapsed:8.1f} docs/s, {total_mb / elapsed:6.1f} MB/s"
+    )
@@ -3,18 +3,25 @@ import functools
 import html
 import json
 import re
-import time
 from collections import Counter
+from html.parser import HTMLParser
 from pathlib import Path
 from typing import Any, Dict, Union
 
+import config
 import logger
-from bs4 import BeautifulSoup
+import retry
 from data.models import GroundTruth, Sample
-from pydantic import ValidationError
 
 logger = logger.get_logger(__name__)
 
+# Shared by every function decorated with backoff.
+retrier = retry.Retrier(
+    retry.Budget(config.RETRY_BUDGET_RATIO, config.RETRY_BUDGET_CAPACITY),
+    config.CIRCUIT_FAILURES,
+    config.CIRCUIT_SECONDS,
+)
+
 
 def read_json_to_dict_of_samples(
     file_path: Path = Path("./resources/ground_truth_data.json"),
@@ -91,6 +98,80 @@ def list_models(client: Any) -> None:
         yield model.model, model.details.parameter_size
 
 
+_INVISIBLE_TAGS = frozenset({"script", "style", "template"})
+_PRESERVE_WHITESPACE_TAGS = frozenset({"pre", "textarea"})
+_ASCII_SPACES = re.compile(r"[ \t\n\r\f]*")
+_REMOVED_CHARS = str.maketrans({"\x00": None, "\ufffd": None})
+_NEW_LINES = re.compile(r"\n{2,}")
+_SPACES = re.compile(r" +")
+
+
+class _TextExtractor(HTMLParser):
+    """
+    Collects the visible text of an HTML document in a single pass, the same
+    way BeautifulSoup(text, "html.parser").get_text() does, without building
+    a tree.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._data = []
+        self._invisible = 0
+        self._preserve_whitespace = 0
+
+    def _end_data(self):
+        if not self._data:
+            return
+        data = "".join(self._data)
+        self._data = []
+        if self._invisible:
+            return
+        # Like BeautifulSoup, a run of whitespace between two tags becomes a
+        # single newline or space.
+        if not self._preserve_whitespace and _ASCII_SPACES.fullmatch(data):
+            data = "\n" if "\n" in data else " "
+        self.parts.append(data)
+
+    def handle_starttag(self, tag, attrs):
+        self._end_data()
+        if tag in _INVISIBLE_TAGS:
+            self._invisible += 1
+        elif tag in _PRESERVE_WHITESPACE_TAGS:
+            self._preserve_whitespace += 1
+
+    def handle_startendtag(self, tag, attrs):
+        self._end_data()
+
+    def handle_endtag(self, tag):
+        self._end_data()
+        if tag in _INVISIBLE_TAGS and self._invisible:
+            self._invisible -= 1
+        elif tag in _PRESERVE_WHITESPACE_TAGS and self._preserve_whitespace:
+            self._preserve_whitespace -= 1
+
+    def handle_data(self, data):
+        self._data.append(data)
+
+    def handle_comment(self, data):
+        self._end_data()
+
+    def handle_decl(self, decl):
+        self._end_data()
+
+    def handle_pi(self, data):
+        self._end_data()
+
+    def unknown_decl(self, data):
+        self._end_data()
+        if data.startswith("CDATA["):
+            self.parts.append(data[len("CDATA[") :])
+
+    def close(self):
+        super().close()
+        self._end_data()
+
+
 def clean_html_text(input_text: str) -> str:
     """
     Cleans HTML text by removing tags and normalizing whitespace.
@@ -101,13 +182,16 @@ def clean_html_text(input_text: str) -> str:
     Returns:
         The cleaned text.
     """
-    text_without_html = BeautifulSoup(input_text, "html.parser").get_text()
-    text_unescaped = html.unescape(text_without_html)
-    text_normalized_x00 = re.sub(r"\x00", "", text_unescaped)
-    text_normalized_fffd = re.sub(r"\uFFFD", "", text_normalized_x00)
-    text_normalized_new_lines = re.sub(r"\n{2, }", "\n\n", text_normalized_fffd)
-    text_normalized_spaces = re.sub(r" +", " ", text_normalized_new_lines)
-    return text_normalized_spaces.strip().strip("\n").strip("\r")
+    parser = _TextExtractor()
+    parser.feed(input_text)
+    parser.close()
+    text = "".join(parser.parts)
+    if "&" in text:
+        text = html.unescape(text)
+    text = text.translate(_REMOVED_CHARS)
+    text = _NEW_LINES.sub("\n\n", text)
+    text = _SPACES.sub(" ", text)
+    return text.strip()
 
 
 def serialize_experiment(
@@ -154,28 +238,35 @@ def serialize_experiment(
     return data
 
 
-def backoff(delay=2, retries=3, max_delay=64):
+def backoff(delay=2, retries=3, max_delay=64, endpoint="ollama"):
+    """
+    Retries a function with the retrier of the process, see retry.py.
+
+    Transport errors are attempted retries times, sleeping a decorrelated
+    jitter between delay and max_delay seconds. Answers that fail validation
+    are attempted config.SCHEMA_ATTEMPTS times without sleeping. The
+    circuit breaker of endpoint covers all the hosts of the endpoint pool,
+    which sends every attempt to the best host at the time.
+
+    Returns:
+        The decorated function, which returns None when it gives up and
+        raises retry.CircuitOpenError while the endpoint is down.
+    """
+    policies = {
+        retry.TRANSPORT: retry.Policy(retries, delay, max_delay),
+        retry.SCHEMA: retry.Policy(config.SCHEMA_ATTEMPTS, 0, 0),
+    }
+
     def decorator(func):
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            current_delay = delay
-            for attempt in range(1, retries + 1):
-                try:
-                    return func(*args, **kwargs)
-                except ValidationError as e:
-                    return None
-                except Exception as e:
-                    if attempt == retries:
-                        return None
-                    logger.warning(
-                        f"Attempt {attempt} failed for '{func.__name__}'. "
-                        f"Retrying in {current_delay} seconds... Error: {e}"
-                    )
-                    time.sleep(current_delay)
-                    current_delay *= 2
-                    if current_delay > max_delay:
-                        current_delay = max_delay
-            return None
+            try:
+                return retrier.call(endpoint, policies, func, *args, **kwargs)
+            except retry.CircuitOpenError:
+                raise
+            except Exception as e:
+                logger.warning(f"Giving up '{func.__name__}': {e!r}")
+                return None
 
         return wrapper
 
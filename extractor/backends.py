@@ -0,0 +1,248 @@
+import os
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Set, Tuple
+
+import ollama
+
+OLLAMA = "ollama"
+OPENAI = "openai"
+
+# Ollama options with an equivalent in the chat completions API of
+# OpenAI-compatible servers; the others are left to the server.
+_OPENAI_OPTIONS = {
+    "temperature": "temperature",
+    "seed": "seed",
+    "top_p": "top_p",
+    "num_predict": "max_tokens",
+    "stop": "stop",
+}
+
+
+def _names(response) -> Set[str]:
+    return {model["model"] for model in response["models"]}
+
+
+class OllamaBackend:
+    """
+    An Ollama server, constraining answers with its format parameter.
+
+    Every backend streams the pieces of an answer with chat and chat_async,
+    closing the stream when the iterator is closed, and lists the models it
+    serves with models and models_async.
+    """
+
+    def __init__(self, host: str, timeout: Optional[float] = None):
+        """
+        Args:
+            host: The URL of the server.
+            timeout: Time a request may wait for its first or next chunk, in
+                seconds, or None to wait forever.
+        """
+        self.host = host
+        self.timeout = timeout
+        self._client: Optional[ollama.Client] = None
+        self._async_client: Optional[ollama.AsyncClient] = None
+
+    @property
+    def client(self) -> ollama.Client:
+        if self._client is None:
+            self._client = ollama.Client(host=self.host, timeout=self.timeout)
+        return self._client
+
+    @property
+    def async_client(self) -> ollama.AsyncClient:
+        if self._async_client is None:
+            self._async_client = ollama.AsyncClient(
+                host=self.host, timeout=self.timeout
+            )
+        return self._async_client
+
+    def chat(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        schema: Dict[str, Any],
+        options: Dict[str, Any],
+    ) -> Iterator[str]:
+        stream = self.client.chat(
+            model=model, messages=messages, format=schema, options=options, stream=True
+        )
+        try:
+            for chunk in stream:
+                piece = chunk.get("message", {}).get("content")
+                if piece:
+                    yield piece
+        finally:
+            stream.close()
+
+    async def chat_async(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        schema: Dict[str, Any],
+        options: Dict[str, Any],
+    ) -> AsyncIterator[str]:
+        stream = await self.async_client.chat(
+            model=model, messages=messages, format=schema, options=options, stream=True
+        )
+        try:
+            async for chunk in stream:
+                piece = chunk.get("message", {}).get("content")
+                if piece:
+                    yield piece
+        finally:
+            await stream.aclose()
+
+    def models(self) -> Tuple[Set[str], Set[str]]:
+        """
+        Returns:
+            The models the server has and those it keeps loaded in memory.
+        """
+        return _names(self.client.list()), _names(self.client.ps())
+
+    async def models_async(self) -> Tuple[Set[str], Set[str]]:
+        client = self.async_client
+        return _names(await client.list()), _names(await client.ps())
+
+
+class OpenAIBackend:
+    """
+    A server with the OpenAI chat completions API, such as vLLM or the
+    llama.cpp server, constraining answers with a JSON schema response_format.
+    Such servers keep their models loaded, so every model is taken as loaded.
+
+    Requires the openai package; its retries are disabled, as retry.py does
+    them, and its connection errors are translated to those retry.py
+    classifies. The key of the API is read from OPENAI_API_KEY, and servers
+    started without one take any.
+    """
+
+    def __init__(self, host: str, timeout: Optional[float] = None):
+        """
+        Args:
+            host: The base URL of the API, usually ending in /v1.
+            timeout: Time a request may wait for its first or next chunk, in
+                seconds, or None to wait forever.
+
+        Raises:
+            ImportError: When the openai package is not installed.
+        """
+        # Checked here, so a missing package fails the run instead of the
+        # health checks of its hosts.
+        self._openai()
+        self.host = host
+        self.timeout = timeout
+        self._client = None
+        self._async_client = None
+
+    @staticmethod
+    def _openai():
+        try:
+            import openai
+        except ImportError as error:
+            raise ImportError(
+                'BACKEND = "openai" requires openai: uv sync --extra openai'
+            ) from error
+        return openai
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self._openai().OpenAI(
+                base_url=self.host,
+                api_key=os.environ.get("OPENAI_API_KEY", "EMPTY"),
+                timeout=self.timeout,
+                max_retries=0,
+            )
+        return self._client
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            self._async_client = self._openai().AsyncOpenAI(
+                base_url=self.host,
+                api_key=os.environ.get("OPENAI_API_KEY", "EMPTY"),
+                timeout=self.timeout,
+                max_retries=0,
+            )
+        return self._async_client
+
+    def _request(self, model, messages, schema, options) -> Dict[str, Any]:
+        request = {
+            "model": model,
+            "messages": messages,
+            "response_format": {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": schema.get("title", "answer"),
+                    "schema": schema,
+                },
+            },
+            "stream": True,
+        }
+        for option, value in options.items():
+            if option in _OPENAI_OPTIONS:
+                request[_OPENAI_OPTIONS[option]] = value
+        return request
+
+    def _translate(self, error: Exception) -> Exception:
+        # The connection errors of openai do not derive from those of httpx.
+        if isinstance(error, self._openai().APITimeoutError):
+            return TimeoutError(f"{self.host}: {error}")
+        return ConnectionError(f"{self.host}: {error}")
+
+    def chat(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        schema: Dict[str, Any],
+        options: Dict[str, Any],
+    ) -> Iterator[str]:
+        openai = self._openai()
+        try:
+            stream = self.client.chat.completions.create(
+                **self._request(model, messages, schema, options)
+            )
+            with stream:
+                for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+        except openai.APIConnectionError as error:
+            raise self._translate(error) from error
+
+    async def chat_async(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        schema: Dict[str, Any],
+        options: Dict[str, Any],
+    ) -> AsyncIterator[str]:
+        openai = self._openai()
+        try:
+            stream = await self.async_client.chat.completions.create(
+                **self._request(model, messages, schema, options)
+            )
+            async with stream:
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+        except openai.APIConnectionError as error:
+            raise self._translate(error) from error
+
+    def models(self) -> Tuple[Set[str], Set[str]]:
+        openai = self._openai()
+        try:
+            models = {model.id for model in self.client.models.list()}
+        except openai.APIConnectionError as error:
+            raise self._translate(error) from error
+        return models, models
+
+    async def models_async(self) -> Tuple[Set[str], Set[str]]:
+        openai = self._openai()
+        try:
+            models = {model.id async for model in self.async_client.models.list()}
+        except openai.APIConnectionError as error:
+            raise self._translate(error) from error
+        return models, models
+
+
+BACKENDS = {OLLAMA: OllamaBackend, OPENAI: OpenAIBackend}
@@ -0,0 +1,161 @@
+import functools
+import json
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import pydantic
+
+import models
+import prompt
+import window
+
+
+class Document(NamedTuple):
+    codigo: str
+    titulo: str
+    data: str
+    body: Optional[str]
+    fields: Tuple[str, ...]
+    prefilled: Dict[str, Any]
+    # Result of a near duplicate whose diff is in body, see dedup.py.
+    reference: Optional[Dict[str, Any]] = None
+
+
+def _contexto(document: Document) -> str:
+    return f"""## Documento {document.codigo}
+### Nome do Documento
+{document.titulo}
+
+### Texto do Documento
+{document.body}
+"""
+
+
+@functools.lru_cache
+def _prompt_tokens(fields: Tuple[str, ...]) -> int:
+    return window.count_tokens(prompt.build_batch_prompt(fields))
+
+
+def document_tokens(document: Document) -> int:
+    """
+    Estimates the tokens a document adds to a batch prompt.
+
+    Args:
+        document: The prepared document.
+
+    Returns:
+        The estimated number of tokens of its section of the # Contexto.
+    """
+    return window.count_tokens(_contexto(document))
+
+
+def create_batch_prompt(documents: List[Document]) -> List[Dict[str, str]]:
+    """
+    Builds the prompt asking for the fields of several documents at once.
+
+    Args:
+        documents: Documents asking for the same fields.
+
+    Returns:
+        The chat messages of the request.
+    """
+    template = prompt.build_batch_prompt(documents[0].fields)
+    contexto = "# Contexto\n" + "\n".join(_contexto(document) for document in documents)
+    return [{"role": "system", "content": template.replace("{CONTEXTO}", contexto)}]
+
+
+def parse_batch(content: str, documents: List[Document]) -> Dict[str, Dict[str, Any]]:
+    """
+    Validates the response to a batch document by document.
+
+    A malformed item only costs its own document, which is left out of the
+    result to be extracted again on its own.
+
+    Args:
+        content: The JSON returned by the LLM.
+        documents: The documents of the batch.
+
+    Returns:
+        The extracted fields of every valid item, by codigo.
+    """
+    try:
+        items = json.loads(content).get("licitacoes")
+    except (json.JSONDecodeError, AttributeError):
+        return {}
+    if not isinstance(items, list):
+        return {}
+
+    expected = {document.codigo for document in documents}
+    extraction_model = models.partial_model(documents[0].fields)
+    results = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        codigo = str(item.pop("codigo", None))
+        if codigo not in expected or codigo in results:
+            continue
+        try:
+            extracted = extraction_model.model_validate_json(
+                json.dumps(item), strict=True
+            )
+        except pydantic.ValidationError:
+            continue
+        results[codigo] = extracted.model_dump()
+    return results
+
+
+class Packer:
+    """
+    Packs short documents into batches that share one request.
+
+    Only documents asking for the same fields go into the same batch. A
+    batch is released when the next document would exceed the token budget
+    or max_documents. Documents too long to share a request and near
+    duplicates carrying a diff are released alone.
+    """
+
+    def __init__(self, budget: Optional[int], max_documents: int):
+        """
+        Args:
+            budget: Maximum estimated tokens of a batch prompt, or None to
+                release every document alone.
+            max_documents: Maximum number of documents in a batch.
+        """
+        self.budget = budget
+        self.max_documents = max_documents
+        self._pending: Dict[Tuple[str, ...], Tuple[List[Document], int]] = {}
+
+    def add(self, document: Document) -> List[List[Document]]:
+        """
+        Adds a document to the batch of its fields.
+
+        Returns:
+            The batches ready to be extracted, possibly none.
+        """
+        if self.budget is None or document.reference is not None:
+            return [[document]]
+        available = self.budget - _prompt_tokens(document.fields)
+        tokens = document_tokens(document)
+        if tokens > available // 2:
+            return [[document]]
+
+        ready = []
+        batch, used = self._pending.pop(document.fields, ([], 0))
+        if batch and (used + tokens > available or len(batch) >= self.max_documents):
+            ready.append(batch)
+            batch, used = [], 0
+        self._pending[document.fields] = (batch + [document], used + tokens)
+        return ready
+
+    def pending(self) -> bool:
+        return bool(self._pending)
+
+    def flush(self) -> List[List[Document]]:
+        """
+        Releases the batches still being filled.
+
+        Returns:
+            The pending batches.
+        """
+        ready = [batch for batch, _ in self._pending.values()]
+        self._pending.clear()
+        return ready
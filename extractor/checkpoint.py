@@ -0,0 +1,174 @@
+import glob
+import json
+import os
+import pathlib
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import config
+import log
+import sinks
+
+logger = log.get_logger(__name__)
+
+
+class Checkpoint:
+    """
+    Append-only log of the extractions of one input source.
+
+    Every result is written as a JSON line as soon as it is available, so a
+    crash only loses the documents that were still in flight. On restart the
+    codigos already in the log are exposed in `done` and can be skipped.
+    `finalize` turns the log into the usual `{codigo: result}` JSON output,
+    in the order of the input: results are logged as they finish, so every
+    entry keeps the position of its publication in the input.
+
+    In sharded mode every worker appends to a log of its own shard and reads
+    the logs of all shards to know what is done, so a run can be resumed with
+    a different number of workers. The output is finalized once, from every
+    log of the input.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        directory: pathlib.Path = config.OUTPUT_PATH,
+        fsync_every: int = config.CHECKPOINT_FSYNC_EVERY,
+        shard: Optional[int] = None,
+        output_format: str = config.OUTPUT_FORMAT,
+    ):
+        self.name = name
+        self.directory = directory
+        suffix = ".jsonl" if shard is None else f".shard{shard}.jsonl"
+        self.log_path = directory / f"{name}{suffix}"
+        self.output_path = directory / f"{name}{sinks.SUFFIXES[output_format]}"
+        self.output_format = output_format
+        self.fsync_every = fsync_every
+        self.done: Set[str] = set()
+        # Positions in the input of the publications read and not yet logged.
+        self._positions: Dict[str, int] = {}
+        self._file = None
+        self._unsynced = 0
+
+    def is_finalized(self) -> bool:
+        return self.output_path.exists() and not self._log_paths()
+
+    def _log_paths(self) -> List[pathlib.Path]:
+        paths = self.directory.glob(f"{glob.escape(self.name)}.shard*.jsonl")
+        main_log = self.directory / f"{self.name}.jsonl"
+        return sorted(paths) + ([main_log] if main_log.exists() else [])
+
+    def __enter__(self):
+        self.done = set(self._read_log(self.log_path, truncate=True))
+        for path in self._log_paths():
+            if path != self.log_path:
+                self.done.update(self._read_log(path))
+        if self.done:
+            logger.info(
+                f"Resuming from {self.log_path}: {len(self.done)} documents already done"
+            )
+        self._file = self.log_path.open("a", encoding="utf-8")
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def track(
+        self, publications: Iterable[Any], shard: Optional[Tuple[int, int]] = None
+    ) -> Iterator[Any]:
+        """
+        Yields the publications read from the input, noting the position of
+        those not done yet for their log entries.
+
+        Args:
+            publications: The publications, in the order of the input.
+            shard: The (index, count) pair they were read with, if any.
+        """
+        start, step = shard or (0, 1)
+        for i, publication in enumerate(publications):
+            if publication.codigo not in self.done:
+                self._positions[publication.codigo] = start + i * step
+            yield publication
+
+    def discard(self, codigo: str) -> None:
+        """
+        Forgets a publication read from the input that will not be logged.
+        """
+        self._positions.pop(codigo, None)
+
+    def append(
+        self, codigo: str, result: Dict[str, Any], data: Optional[str] = None
+    ) -> None:
+        entry = {
+            "codigo": codigo,
+            "data": data,
+            "result": result,
+            "position": self._positions.pop(codigo, None),
+        }
+        line = json.dumps(entry, ensure_ascii=False)
+        self._file.write(line + "\n")
+        self._file.flush()
+        self.done.add(codigo)
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every:
+            self.sync()
+
+    def sync(self) -> None:
+        if self._unsynced:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def close(self) -> None:
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    def finalize(self) -> None:
+        """
+        Writes the output from the logs of the input and removes them.
+
+        The output is written in `output_format` by sinks.write, so it is
+        either complete or absent.
+        """
+        self.close()
+        paths = self._log_paths()
+        entries = {}
+        for path in paths:
+            entries.update(self._read_log(path))
+        # Entries of logs written before positions were kept go last.
+        ordered = sorted(
+            entries.values(),
+            key=lambda entry: (entry.get("position") is None, entry.get("position")),
+        )
+        sinks.write(self.output_path, ordered, self.output_format)
+        for path in paths:
+            path.unlink(missing_ok=True)
+
+    @staticmethod
+    def _read_log(
+        path: pathlib.Path, truncate: bool = False
+    ) -> Dict[str, Dict[str, Any]]:
+        results = {}
+        if not path.exists():
+            return results
+
+        # Only the owner of a log truncates it: the logs of other shards may
+        # still be written to.
+        with path.open("rb+" if truncate else "rb") as file:
+            good_size = 0
+            for line in file:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                results[entry["codigo"]] = entry
+                good_size += len(line)
+
+            # A crash can leave a partial last line; cut it so that new
+            # entries start on a line of their own.
+            if truncate and good_size < file.seek(0, os.SEEK_END):
+                logger.warning(f"Truncating partial entry at the end of {path}")
+                file.truncate(good_size)
+        return results
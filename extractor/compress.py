@@ -0,0 +1,250 @@
+import collections
+import json
+import pathlib
+import re
+from typing import Iterable, List, NamedTuple, Optional, Set, Tuple
+
+import municipios
+import window
+
+# Lines that may carry an extracted field are never stripped: labels, the
+# lines window.py deems relevant and the cargo of the signatário.
+_CARGO = re.compile(
+    r"prefeit|secretari|president|pregoeir|diretor|gerente|coordenador|"
+    r"superintendente|ordenador|agente de contrata|comissao|vereador|responsavel"
+)
+_LETTERS = re.compile(r"[^\W\d_]")
+_PREFIX_WORDS = 2
+# Longer lines are sentences, e.g. the objeto, and only match whole.
+_PREFIX_MAX_WORDS = 8
+
+# An item table starts at a header naming the item and at least two of the
+# other usual columns, on one line or one column per line.
+_TABLE_COLUMNS = re.compile(
+    r"\b(produto|especificacao|descricao|unidade|unid|marca|qtd|qtde|quantidade|"
+    r"valor unitario|valor total)\b"
+)
+_TABLE_END = re.compile(
+    r"^total (do|da|geral|fornecedor|participante|lote)\b", re.IGNORECASE
+)
+_ITEM_NUMBER = re.compile(r"^\d{1,4}\s*$|^\d{1,4}\s+(?=[^\W\d_])")
+# Lines after a total that show the table goes on with another supplier.
+_TABLE_CONTINUES = re.compile(r"^(participante|fornecedor|vencedor|\d+ )")
+# Non-table lines after a total that end the table.
+_TABLE_GAP = 3
+# A description stops at its unit, quantity or price.
+_DESCRIPTION_END = re.compile(
+    r"\s+(?:UN|UND|UNID\w*|KG|CX|PCT|LT|M|M2|M3|R\$|\d[\d.,]*)(?:\s|$)"
+)
+_MONEY = re.compile(r"^R\$\s*[\d.,]+$")
+_SUMMARY_ITEMS = 5
+_SUMMARY_CHARS = 300
+
+
+class Compressed(NamedTuple):
+    text: str
+    tokens_saved: int
+    boilerplate_lines: int
+    item_tables: int
+
+
+def _key(line: str) -> str:
+    # Words with digits are codes, numbers and dates, which change from one
+    # publication to the next.
+    words = municipios.normalize(line).split()
+    return " ".join("0" if any(c.isdigit() for c in word) else word for word in words)
+
+
+def line_keys(line: str) -> List[str]:
+    """
+    Returns:
+        The keys of a line: the whole normalized line and, for short lines,
+        its first words followed by "...", so that headers such as
+        "Emitido por <name> em <date>" share a key. Prefixes with numbers
+        are left out, as they are too common.
+    """
+    key = _key(line)
+    words = key.split()
+    prefix = words[:_PREFIX_WORDS]
+    if _PREFIX_WORDS < len(words) <= _PREFIX_MAX_WORDS and "0" not in prefix:
+        return [key, " ".join(prefix) + " ..."]
+    return [key]
+
+
+def is_protected(line: str) -> bool:
+    return (
+        len(_LETTERS.findall(line)) < 3
+        or line.rstrip().endswith(":")
+        or _CARGO.search(municipios.normalize(line)) is not None
+        or window.RELEVANT.search(line) is not None
+    )
+
+
+def learn(texts: Iterable[str], min_share: float, min_documents: int) -> Set[str]:
+    """
+    Learns the boilerplate of a corpus: the keys of unprotected lines found
+    in many of its documents.
+
+    Args:
+        texts: The cleaned texts of the corpus.
+        min_share: Minimum share of the documents with a boilerplate key.
+        min_documents: Minimum number of documents with a boilerplate key.
+
+    Returns:
+        The boilerplate keys.
+    """
+    frequency: collections.Counter = collections.Counter()
+    documents = 0
+    for text in texts:
+        documents += 1
+        keys = set()
+        for line in text.splitlines():
+            if line.strip() and not is_protected(line):
+                keys.update(line_keys(line))
+        frequency.update(keys)
+    minimum = max(min_documents, min_share * documents)
+    return {key for key, count in frequency.items() if count >= minimum}
+
+
+def save(path: pathlib.Path, keys: Set[str]) -> None:
+    path.write_text(json.dumps(sorted(keys), indent=2, ensure_ascii=False))
+
+
+def load(path: pathlib.Path) -> Set[str]:
+    return set(json.loads(path.read_text(encoding="utf-8")))
+
+
+def _is_table_header(lines: List[str], i: int) -> int:
+    # Returns the number of header lines starting at i, or 0.
+    if not municipios.normalize(lines[i]).startswith("item"):
+        return 0
+    header = ""
+    for size in range(1, 9):
+        if i + size > len(lines):
+            break
+        header += " " + municipios.normalize(lines[i + size - 1])
+        if len(set(_TABLE_COLUMNS.findall(header))) >= 2:
+            return size
+        if size > 1 and len(lines[i + size - 1].split()) > 3:
+            break
+    return 0
+
+
+def _describe(lines: List[str]) -> List[str]:
+    descriptions = []
+    parts = None
+    for line in lines:
+        stripped = line.strip()
+        number = _ITEM_NUMBER.match(stripped)
+        if number is not None:
+            parts = []
+            stripped = stripped[number.end() :]
+        if parts is None or not stripped:
+            continue
+        # A description may span lines, up to its unit, quantity or price.
+        description, *rest = _DESCRIPTION_END.split(f" {stripped}", maxsplit=1)
+        parts.append(description.strip())
+        if rest:
+            description = " ".join(filter(None, parts)).strip(" .-–")
+            if len(_LETTERS.findall(description)) >= 3:
+                descriptions.append(description[:_SUMMARY_CHARS])
+            parts = None
+    return list(dict.fromkeys(descriptions))
+
+
+def _table_end(lines: List[str], start: int) -> Optional[int]:
+    # Page breaks repeat the header and every supplier has its own total, so
+    # the table runs to the last total that is followed, within a few lines,
+    # by another header or supplier.
+    end = None
+    gap = None
+    for j in range(start, len(lines)):
+        stripped = lines[j].strip()
+        if not stripped:
+            continue
+        if _TABLE_END.match(stripped):
+            end, gap = j, 0
+        elif gap == 0 and _MONEY.match(stripped):
+            # The value of a total may be on the next line.
+            end = j
+        elif gap is not None:
+            if _is_table_header(lines, j) or _TABLE_CONTINUES.match(
+                municipios.normalize(stripped)
+            ):
+                gap = None
+            else:
+                gap += 1
+                if gap > _TABLE_GAP:
+                    break
+    return end
+
+
+def collapse_tables(lines: List[str]) -> Tuple[List[str], int]:
+    """
+    Replaces every item table, from its header to its last total, by a
+    summary with its first item descriptions, which may be the objeto.
+
+    Returns:
+        The lines and the number of collapsed tables.
+    """
+    result = []
+    tables = 0
+    i = 0
+    while i < len(lines):
+        size = _is_table_header(lines, i) if lines[i].strip() else 0
+        end = size and _table_end(lines, i + size)
+        if not end:
+            result.append(lines[i])
+            i += 1
+            continue
+        descriptions = _describe(lines[i + size : end])
+        summary = "; ".join(descriptions[:_SUMMARY_ITEMS])
+        if len(descriptions) > _SUMMARY_ITEMS:
+            summary += f"; e mais {len(descriptions) - _SUMMARY_ITEMS}"
+        result.append(
+            f"[Tabela de itens: {summary}]\n" if summary else "[Tabela de itens]\n"
+        )
+        tables += 1
+        i = end + 1
+    return result, tables
+
+
+class Compressor:
+    """
+    Removes the parts of a cleaned text that do not help the extraction.
+    """
+
+    def __init__(self, boilerplate: Optional[Set[str]], collapse_item_tables: bool):
+        """
+        Args:
+            boilerplate: Keys of the lines to strip, learned by learn.
+            collapse_item_tables: Whether to collapse item tables.
+        """
+        self.boilerplate = boilerplate or set()
+        self.collapse_item_tables = collapse_item_tables
+
+    def compress(self, text: str) -> Compressed:
+        """
+        Collapses the item tables, then strips the boilerplate lines.
+
+        Returns:
+            The compressed text, the estimated tokens saved, the number of
+            boilerplate lines stripped and of item tables collapsed.
+        """
+        lines = text.splitlines(keepends=True)
+        tables = 0
+        if self.collapse_item_tables:
+            lines, tables = collapse_tables(lines)
+        kept = [
+            line
+            for line in lines
+            if not line.strip()
+            or self.boilerplate.isdisjoint(line_keys(line))
+            or is_protected(line)
+        ]
+        dropped = len(lines) - len(kept)
+        if not dropped and not tables:
+            return Compressed(text, 0, 0, 0)
+        compressed = "".join(kept)
+        saved = window.count_tokens(text) - window.count_tokens(compressed)
+        return Compressed(compressed, saved, dropped, tables)
@@ -0,0 +1,172 @@
+import asyncio
+import contextlib
+import threading
+import time
+from typing import AsyncIterator, Dict, Iterator, Optional
+
+import log
+import retry
+
+logger = log.get_logger(__name__)
+
+
+class Measure:
+    """
+    The timings of a request, fed with every token of its stream.
+    """
+
+    def __init__(self, saturated: bool):
+        # Whether the request took the last slot, so the limit was reached.
+        self.saturated = saturated
+        self.start = time.perf_counter()
+        self.first: Optional[float] = None
+        self.tokens = 0
+
+    def token(self) -> None:
+        if self.first is None:
+            self.first = time.perf_counter()
+        self.tokens += 1
+
+    def first_token_seconds(self) -> Optional[float]:
+        return None if self.first is None else self.first - self.start
+
+    def tokens_per_second(self) -> Optional[float]:
+        # Ollama streams one token per chunk; the first only waits for the
+        # prompt, so the rate is measured after it.
+        if self.first is None or self.tokens < 2:
+            return None
+        return (self.tokens - 1) / max(time.perf_counter() - self.first, 1e-9)
+
+
+class Limiter:
+    """
+    Bounds the requests in flight with additive increase and multiplicative
+    decrease (AIMD).
+
+    A healthy request that found the limit reached raises it by 1 / limit, so
+    the limit grows by one slot per limit requests. A request that waited
+    more than max_first_token_seconds for its first token, streamed fewer than
+    min_tokens_per_second or failed in transport multiplies it by backoff,
+    once per congestion: requests started before the last decrease do not
+    decrease it again.
+    """
+
+    def __init__(
+        self,
+        minimum: int,
+        maximum: int,
+        max_first_token_seconds: float,
+        min_tokens_per_second: float,
+        backoff: float,
+    ):
+        """
+        Args:
+            minimum: The initial and lowest limit.
+            maximum: The highest limit.
+            max_first_token_seconds: Highest healthy time to first token.
+            min_tokens_per_second: Lowest healthy tokens per second.
+            backoff: Factor of the limit on a decrease.
+        """
+        self.minimum = minimum
+        self.maximum = maximum
+        self.max_first_token_seconds = max_first_token_seconds
+        self.min_tokens_per_second = min_tokens_per_second
+        self.backoff = backoff
+        self.limit = float(minimum)
+        self.in_flight = 0
+        self.counters: Dict[str, int] = {"increases": 0, "decreases": 0}
+        self._decreased_at = float("-inf")
+        self._condition = threading.Condition()
+        self._async_condition: Optional[asyncio.Condition] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _try_take(self) -> Optional[Measure]:
+        with self._condition:
+            if self.in_flight >= int(self.limit):
+                return None
+            self.in_flight += 1
+            return Measure(saturated=self.in_flight >= int(self.limit))
+
+    def _is_healthy(self, measure: Measure) -> bool:
+        first_token_seconds = measure.first_token_seconds()
+        tokens_per_second = measure.tokens_per_second()
+        return (
+            first_token_seconds is None
+            or first_token_seconds <= self.max_first_token_seconds
+        ) and (
+            tokens_per_second is None or tokens_per_second >= self.min_tokens_per_second
+        )
+
+    def _release(self, measure: Measure, error: Optional[BaseException]) -> None:
+        with self._condition:
+            self.in_flight -= 1
+            previous = int(self.limit)
+            if error is not None:
+                # A cancelled request, such as the loser of a hedge, tells
+                # nothing; one past its deadline may mean the host is
+                # overloaded.
+                congested = retry.classify(error) in (retry.TRANSPORT, retry.DEADLINE)
+            else:
+                congested = not self._is_healthy(measure)
+                if not congested and measure.saturated:
+                    self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            if congested and measure.start > self._decreased_at:
+                self.limit = max(self.minimum, self.limit * self.backoff)
+                self._decreased_at = time.perf_counter()
+            if int(self.limit) != previous:
+                change = "increases" if int(self.limit) > previous else "decreases"
+                self.counters[change] += 1
+                logger.debug(f"Concurrency limit {previous} -> {int(self.limit)}")
+            self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def acquire(self) -> Iterator[Measure]:
+        """
+        Waits for a slot and holds it while the request is in flight.
+
+        Yields:
+            The measure of the request, to be fed with its tokens.
+        """
+        with self._condition:
+            while (measure := self._try_take()) is None:
+                self._condition.wait()
+        failure = None
+        try:
+            yield measure
+        except BaseException as error:
+            failure = error
+            raise
+        finally:
+            self._release(measure, failure)
+
+    def _condition_async(self) -> asyncio.Condition:
+        # A condition belongs to the event loop it was first used in.
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop, self._async_condition = loop, asyncio.Condition()
+        return self._async_condition
+
+    @contextlib.asynccontextmanager
+    async def acquire_async(self) -> AsyncIterator[Measure]:
+        condition = self._condition_async()
+        async with condition:
+            while (measure := self._try_take()) is None:
+                await condition.wait()
+        failure = None
+        try:
+            yield measure
+        except BaseException as error:
+            failure = error
+            raise
+        finally:
+            self._release(measure, failure)
+            async with condition:
+                condition.notify_all()
+
+    def status(self) -> Dict[str, int]:
+        """
+        Returns:
+            The current limit, the requests in flight and the number of
+            increases and decreases of the limit.
+        """
+        return {"limit": int(self.limit), "in_flight": self.in_flight, **self.counters}
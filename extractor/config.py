@@ -6,5 +6,196 @@ OPTIONS = {
     "temperature": 0,
     "seed": 42,
 }
+# Directory of JSON array or JSON Lines files, or "-" to read a single stream from stdin.
 INPUT_PATH = pathlib.Path("./resources/input")
 OUTPUT_PATH = pathlib.Path("./resources/output")
+# Ollama hosts shared by the requests (see endpoints.py). Every request goes to
+# the healthy host with MODEL that has the fewest requests in flight, preferring
+# hosts with MODEL loaded. The hosts and their models are checked every
+# HEALTH_SECONDS, each check timing out after HEALTH_TIMEOUT seconds. Empty
+# uses OLLAMA_HOST alone.
+OLLAMA_HOSTS: list[str] = []
+# The API of the LLM servers (see backends.py): "ollama", or "openai" for
+# servers with the OpenAI chat completions API, such as vLLM or the llama.cpp
+# server, which batch concurrent requests. These are reached at the base URLs
+# of OPENAI_HOSTS instead of OLLAMA_HOSTS, must serve MODEL under that name
+# and need the openai package (uv sync --extra openai).
+BACKEND = "ollama"
+OPENAI_HOSTS: list[str] = ["http://localhost:8000/v1"]
+HEALTH_SECONDS = 30
+HEALTH_TIMEOUT = 5
+# Time limits of every LLM request, in seconds, or None to wait forever. A
+# request that receives no chunk for FIRST_TOKEN_TIMEOUT seconds, the first
+# one included, or that has not finished after REQUEST_DEADLINE seconds is
+# cancelled, closing its stream so the host stops generating. A stalled
+# request fails as a transport error; one past its deadline raises
+# retry.DeadlineExceeded, is not retried and does not count toward the
+# circuit breaker, as a slow host is not down.
+FIRST_TOKEN_TIMEOUT = None
+REQUEST_DEADLINE = None
+# Hedged requests, with MAX_CONCURRENT_REQUESTS above 1 and several hosts (see
+# hedging.py). A request still running after the HEDGE_PERCENTILE percentile
+# of the latencies of the last HEDGE_WINDOW requests of its kind (single
+# document or batch) is sent again to another host, and the first answer is
+# kept; OPTIONS fix the temperature and the seed, so both are the same. No
+# request is hedged before HEDGE_MIN_SAMPLES latencies are known. None
+# disables hedging.
+HEDGE_PERCENTILE = None
+HEDGE_WINDOW = 200
+HEDGE_MIN_SAMPLES = 20
+# Number of requests kept in flight across the hosts. Values above 1 switch
+# to the async client; the server must be started with OLLAMA_NUM_PARALLEL set
+# to at least this value for requests to actually run in parallel.
+MAX_CONCURRENT_REQUESTS = 1
+# Adapt the requests in flight to the load of the hosts (see concurrency.py),
+# between MIN_CONCURRENT_REQUESTS, where it starts, and MAX_CONCURRENT_REQUESTS.
+# The limit grows by one while the requests find it reached, wait at most
+# ADAPTIVE_FIRST_TOKEN_SECONDS for their first token and stream at least
+# ADAPTIVE_TOKENS_PER_SECOND, and is multiplied by ADAPTIVE_BACKOFF when they
+# do not or fail in transport. The limit is in the summary of every input,
+# and its changes are logged at debug level.
+ADAPTIVE_CONCURRENCY = False
+MIN_CONCURRENT_REQUESTS = 1
+ADAPTIVE_FIRST_TOKEN_SECONDS = 15
+ADAPTIVE_TOKENS_PER_SECOND = 5
+ADAPTIVE_BACKOFF = 0.7
+# Extractions are appended to OUTPUT_PATH/<input>.jsonl as they finish and the
+# log is fsynced every CHECKPOINT_FSYNC_EVERY documents.
+CHECKPOINT_FSYNC_EVERY = 16
+# Fill the fields that follow fixed patterns (numbers, modalidade, dates, ...)
+# with rules.py and ask the LLM only for the rest.
+USE_RULES = False
+# Resolve the municipio from the DOM metadata and the text with municipios.py,
+# which drops the 295-name enum from the prompt and the format schema.
+RESOLVE_MUNICIPIO = False
+# Maximum estimated tokens of the prompt. Longer publications keep their head
+# and tail and lose the least relevant middle lines (see window.py). None sends
+# every publication whole.
+CONTEXT_TOKEN_BUDGET = None
+# Pack short publications asking for the same fields into one request of at
+# most BATCH_TOKEN_BUDGET estimated tokens and BATCH_MAX_DOCUMENTS documents, so
+# the instructions are sent once per batch. None sends one request per document.
+BATCH_TOKEN_BUDGET = None
+BATCH_MAX_DOCUMENTS = 8
+# SQLite index of the extracted publications, kept across runs (see dedup.py).
+# Exact duplicates of an indexed publication reuse its result. Near duplicates,
+# with an estimated similarity of at least DEDUP_THRESHOLD, are logged, flagged
+# in the index and handled by DEDUP_NEAR_POLICY: "extract" extracts them as
+# usual, "diff" sends only the changed lines and the similar publication's
+# result, and "skip" reuses that result. None disables the index.
+DEDUP_PATH = None
+DEDUP_THRESHOLD = 0.9
+DEDUP_NEAR_POLICY = "extract"
+# Number of extraction processes. Above 1 every input is split into WORKERS
+# shards of interleaved records, each extracted by its own process into
+# OUTPUT_PATH/<input>.shard<i>.jsonl, and the shard logs are merged into the
+# usual output at the end. Reading from stdin always uses a single process.
+WORKERS = 1
+# Ollama hosts assigned to the workers in turn, one each. Empty gives every
+# worker a pool of all the hosts.
+SHARD_HOSTS: list[str] = []
+# Format of the final output of each input: "json" writes OUTPUT_PATH/<input>.json
+# and "parquet" a dataset directory OUTPUT_PATH/<input>.parquet partitioned by
+# publication date, with dictionary-encoded enum columns (requires pyarrow).
+OUTPUT_FORMAT = "json"
+PARQUET_COMPRESSION = "zstd"
+PARQUET_BATCH_SIZE = 1024
+# SQLite job queue shared by extractor workers on one or more hosts (see
+# jobs.py). When set, every run enqueues the inputs and works on the queue
+# until it is empty, leasing JOBS_LEASE_SIZE publications at a time for
+# JOBS_LEASE_SECONDS; expired leases are taken over by other workers and a
+# publication is given up after JOBS_MAX_ATTEMPTS. Use journal mode "DELETE"
+# when the file is on a network filesystem.
+JOBS_PATH = None
+JOBS_LEASE_SIZE = 8
+JOBS_LEASE_SECONDS = 600
+JOBS_MAX_ATTEMPTS = 3
+JOBS_JOURNAL_MODE = "WAL"
+# Run each input through a pipeline of stages joined by bounded queues (see
+# pipeline.py): cleaning and rules in PIPELINE_WORKERS processes (None uses
+# every core), MAX_CONCURRENT_REQUESTS LLM requests and a writer thread.
+# Stage occupancy is logged every PIPELINE_REPORT_SECONDS.
+PIPELINE = False
+PIPELINE_WORKERS = None
+PIPELINE_QUEUE_SIZE = 32
+PIPELINE_REPORT_SECONDS = 30
+# Decode input records into slotted records.Publication objects instead of
+# pydantic RawPublication models. Both accept and reject the same records;
+# the slotted ones take less memory while they wait in the pipeline queues.
+FAST_RECORDS = False
+# Keep publications that cannot yield a Licitacao away from the LLM (see
+# relevance.py): those with an empty or image-only texto, a categoria outside
+# RELEVANT_CATEGORIAS (empty accepts any) or, when their titulo names no
+# procurement act, a score of the RELEVANCE_MODEL_PATH classifier below
+# RELEVANCE_THRESHOLD. "skip" leaves them out of the output and "log" only logs
+# what would be skipped; both log a summary per input. None disables the
+# filter. Train the classifier with scripts/train_relevance.py.
+RELEVANCE_FILTER = None
+RELEVANT_CATEGORIAS = ["Licitações"]
+RELEVANCE_MODEL_PATH = None
+RELEVANCE_THRESHOLD = 0.2
+# Shrink the text before prompting (see compress.py): strip the boilerplate
+# lines (page numbers, system banners, ...) learned across the corpus by
+# scripts/learn_boilerplate.py into BOILERPLATE_PATH, and collapse item tables
+# into a line with their first item descriptions. The estimated tokens saved
+# are logged per document. Rules and municipio resolution see the full text.
+BOILERPLATE_PATH = None
+COLLAPSE_ITEM_TABLES = False
+# Templates of the layouts of the publishing systems, with field wrappers
+# induced from past outputs by scripts/induce_templates.py (see templates.py).
+# A publication whose labels are at least TEMPLATE_SIMILARITY similar to a
+# template gets the fields of its wrappers with a confidence of at least
+# TEMPLATE_MIN_CONFIDENCE, and the LLM is asked for the rest only, or not at
+# all. Measure them with scripts/evaluate_templates.py. None disables them.
+TEMPLATES_PATH = None
+TEMPLATE_SIMILARITY = 0.5
+TEMPLATE_MIN_CONFIDENCE = 0.9
+# Keep the valid fields of the answer for a document extracted on its own
+# request and ask again, in a second request, only for the fields that are
+# invalid or whose copied value (numbers, dates, site, names, objeto) is not
+# found in the text sent (see reextract.py). The second request carries their
+# schema alone and the lines relevant to them within REEXTRACT_TOKEN_BUDGET
+# estimated tokens; nullable fields still failing become null. Documents a
+# batch extracted validly are not checked.
+REEXTRACT_FIELDS = False
+REEXTRACT_TOKEN_BUDGET = 1500
+# Repair almost valid answers before their validation (see repair.py): JSON
+# in code fences, wrapped in text or with trailing commas, enum values spelled
+# without accents or with extra words ("Pregão Eletrônico"), dates with seconds
+# or in dd/mm/yyyy, numbers with prefixes and null written as text. Only
+# invalid fields are touched, and every repair is logged.
+REPAIR_ANSWERS = False
+# Validate every answer as it streams (see incremental.py), cancelling it as
+# soon as a field fails its constraints, beyond what REPAIR_ANSWERS fixes, a
+# string repeats a span of REPETITION_MIN_CHARS to REPETITION_MAX_CHARS
+# characters REPETITION_REPEATS times in a row, or more than MAX_WHITESPACE
+# whitespace characters come in a row between the fields. The valid fields
+# read until then are kept, a looping string cut before its loop: with
+# REEXTRACT_FIELDS the others are asked again, and without it the answer fails
+# validation as any invalid one. A batch keeps its complete documents and
+# extracts the rest one by one.
+VALIDATE_STREAM = False
+REPETITION_REPEATS = 4
+REPETITION_MIN_CHARS = 10
+REPETITION_MAX_CHARS = 200
+MAX_WHITESPACE = 50
+# Retries of the LLM requests that fail in transport (see retry.py): up to
+# RETRY_ATTEMPTS attempts, sleeping a decorrelated jitter between
+# RETRY_BASE_SECONDS and RETRY_MAX_SECONDS. Every request earns
+# RETRY_BUDGET_RATIO retries, banked up to RETRY_BUDGET_CAPACITY, so a failing
+# host is not flooded. RETRY_CIRCUIT_FAILURES consecutive transport errors of a
+# host open its circuit: its requests fail at once, stopping the run, until a
+# trial request after RETRY_CIRCUIT_SECONDS succeeds. Retries are counted in
+# the summary of every input.
+RETRY_ATTEMPTS = 3
+RETRY_BASE_SECONDS = 2
+RETRY_MAX_SECONDS = 64
+RETRY_BUDGET_RATIO = 0.2
+RETRY_BUDGET_CAPACITY = 10
+RETRY_CIRCUIT_FAILURES = 5
+RETRY_CIRCUIT_SECONDS = 60
+# Answers of a document that fail validation, after REPAIR_ANSWERS, are
+# attempted SCHEMA_ATTEMPTS times without sleeping: with the temperature and
+# the seed of OPTIONS another attempt repeats the answer. A document still
+# invalid is left without a result, to be tried again by the next run.
+SCHEMA_ATTEMPTS = 1
@@ -0,0 +1,231 @@
+import collections
+import difflib
+import hashlib
+import json
+import pathlib
+import random
+import sqlite3
+import threading
+import zlib
+from array import array
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import municipios
+
+_SHINGLE_SIZE = 5
+_BANDS = 16
+_ROWS = 4
+_PRIME = (1 << 61) - 1
+_RANDOM = random.Random(42)
+# Publications looked up and not yet added, kept for add. Those that are never
+# added, such as failed extractions, are dropped beyond this many.
+_MAX_PENDING = 10000
+_PERMUTATIONS = [
+    (_RANDOM.randrange(1, _PRIME), _RANDOM.randrange(_PRIME))
+    for _ in range(_BANDS * _ROWS)
+]
+
+
+class Match(NamedTuple):
+    codigo: str
+    similarity: float
+    texto: str
+    result: Dict[str, Any]
+    # Whether the words are the same, as the similarity is only an estimate
+    # and may be 1.0 for a near duplicate.
+    exact: bool
+
+
+def _hash(value: bytes, size: int = 8) -> int:
+    return int.from_bytes(hashlib.blake2b(value, digest_size=size).digest(), "little")
+
+
+def fingerprint(titulo: str, texto: str) -> Tuple[str, List[int]]:
+    """
+    Computes the exact digest and the MinHash signature of a publication.
+
+    Both are computed over the normalized words of the titulo and the
+    cleaned texto, so differences in accents, case, punctuation and
+    whitespace do not matter.
+
+    Args:
+        titulo: The titulo of the publication.
+        texto: The cleaned text of the publication.
+
+    Returns:
+        The hex digest and the signature, one minimum per permutation.
+    """
+    words = municipios.normalize(f"{titulo}\n{texto}").split()
+    digest = hashlib.sha256(" ".join(words).encode()).hexdigest()
+    size = min(_SHINGLE_SIZE, len(words)) or 1
+    hashes = {
+        _hash(" ".join(words[i : i + size]).encode()) % _PRIME
+        for i in range(max(len(words) - size + 1, 1))
+    }
+    signature = [min((a * x + b) % _PRIME for x in hashes) for a, b in _PERMUTATIONS]
+    return digest, signature
+
+
+def similarity(first: List[int], second: List[int]) -> float:
+    """
+    Estimates the Jaccard similarity of two publications from their signatures.
+    """
+    return sum(a == b for a, b in zip(first, second)) / len(first)
+
+
+def changed_lines(old: str, new: str) -> str:
+    """
+    Lists the lines that differ between two texts.
+
+    Returns:
+        The removed lines prefixed with "-" and the added ones with "+".
+    """
+    diff = difflib.unified_diff(old.splitlines(), new.splitlines(), lineterm="", n=0)
+    return "\n".join(line for line in diff if not line.startswith(("---", "+++", "@@")))
+
+
+def _buckets(signature: List[int]) -> List[Tuple[int, int]]:
+    return [
+        (band, _hash(array("Q", signature[band * _ROWS : (band + 1) * _ROWS]), 7))
+        for band in range(_BANDS)
+    ]
+
+
+class Index:
+    """
+    Index of the publications already extracted, kept across runs in SQLite.
+
+    Every publication is stored with the digest of its words, its MinHash
+    signature, its text and its result. Candidates for near duplicates are
+    found through locality-sensitive hashing: the signature is split into
+    bands and publications sharing any band bucket are compared.
+
+    An Index can be shared by threads, e.g. the pipeline writer.
+    """
+
+    def __init__(self, path: pathlib.Path, threshold: float):
+        """
+        Args:
+            path: The SQLite database file.
+            threshold: Minimum estimated similarity of a near duplicate.
+        """
+        self.threshold = threshold
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._pending: collections.OrderedDict[
+            str, Tuple[str, List[int], str, Optional[Match]]
+        ] = collections.OrderedDict()
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                codigo TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                signature BLOB NOT NULL,
+                texto BLOB NOT NULL,
+                result TEXT NOT NULL,
+                near_duplicate_of TEXT,
+                similarity REAL);
+            CREATE INDEX IF NOT EXISTS documents_digest ON documents (digest);
+            CREATE TABLE IF NOT EXISTS bands (
+                band INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                codigo TEXT NOT NULL,
+                PRIMARY KEY (band, bucket, codigo)) WITHOUT ROWID;
+        """)
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def _match(self, codigo: str, value: float, exact: bool = False) -> Match:
+        texto, result = self._connection.execute(
+            "SELECT texto, result FROM documents WHERE codigo = ?", (codigo,)
+        ).fetchone()
+        texto = zlib.decompress(texto).decode()
+        return Match(codigo, value, texto, json.loads(result), exact)
+
+    def lookup(self, codigo: str, titulo: str, texto: str) -> Optional[Match]:
+        """
+        Looks up a publication before it is extracted.
+
+        Args:
+            codigo: The codigo of the publication.
+            titulo: The titulo of the publication.
+            texto: The cleaned text of the publication.
+
+        Returns:
+            The most similar indexed publication, exact for a publication
+            with the same words, or None when none reaches the threshold.
+        """
+        digest, signature = fingerprint(titulo, texto)
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT codigo FROM documents WHERE digest = ? LIMIT 1", (digest,)
+            ).fetchone()
+            if row is not None:
+                match = self._match(row[0], 1.0, exact=True)
+            else:
+                match = self._nearest(signature)
+            self._pending[codigo] = (digest, signature, texto, match)
+            self._pending.move_to_end(codigo)
+            while len(self._pending) > _MAX_PENDING:
+                self._pending.popitem(last=False)
+        return match
+
+    def discard(self, codigo: str) -> None:
+        """
+        Forgets a publication passed to lookup that will not be added, such
+        as one whose extraction failed.
+        """
+        with self._lock:
+            self._pending.pop(codigo, None)
+
+    def _nearest(self, signature: List[int]) -> Optional[Match]:
+        candidates = set()
+        for band, bucket in _buckets(signature):
+            rows = self._connection.execute(
+                "SELECT codigo FROM bands WHERE band = ? AND bucket = ?",
+                (band, bucket),
+            )
+            candidates.update(row[0] for row in rows)
+
+        best, best_value = None, self.threshold
+        for candidate in sorted(candidates):
+            (stored,) = self._connection.execute(
+                "SELECT signature FROM documents WHERE codigo = ?", (candidate,)
+            ).fetchone()
+            value = similarity(signature, array("Q", stored).tolist())
+            if value >= best_value:
+                best, best_value = candidate, value
+        return None if best is None else self._match(best, best_value)
+
+    def add(self, codigo: str, result: Dict[str, Any]) -> None:
+        """
+        Stores the result of a publication previously passed to lookup.
+
+        Args:
+            codigo: The codigo of the publication.
+            result: Its extracted fields.
+        """
+        with self._lock:
+            pending = self._pending.pop(codigo, None)
+            if pending is None:
+                return
+            digest, signature, texto, match = pending
+            if match is not None and match.codigo == codigo:
+                return
+            self._connection.execute(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    codigo,
+                    digest,
+                    array("Q", signature).tobytes(),
+                    zlib.compress(texto.encode()),
+                    json.dumps(result, ensure_ascii=False),
+                    match and match.codigo,
+                    match and match.similarity,
+                ),
+            )
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO bands VALUES (?, ?, ?)",
+                [(band, bucket, codigo) for band, bucket in _buckets(signature)],
+            )
+            self._connection.commit()
@@ -0,0 +1,98 @@
+import asyncio
+import collections
+import math
+from typing import Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Hedges sent and hedges that answered first, across the process.
+counters: Dict[str, int] = collections.Counter()
+
+
+class Latencies:
+    """
+    Keeps the latencies of the last window requests.
+    """
+
+    def __init__(self, window: int, min_samples: int):
+        """
+        Args:
+            window: Number of latencies kept.
+            min_samples: Number of latencies needed for a percentile.
+        """
+        self.min_samples = min_samples
+        self._samples: Deque[float] = collections.deque(maxlen=window)
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """
+        Returns:
+            The latency below which percent of the kept ones fall, or None
+            while fewer than min_samples are kept.
+        """
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        rank = math.ceil(percent / 100 * len(ordered))
+        return ordered[min(max(rank, 1), len(ordered)) - 1]
+
+
+async def hedge(
+    start: Callable[[bool], Awaitable[T]],
+    delay: Optional[float],
+    ready: Optional[asyncio.Event] = None,
+) -> T:
+    """
+    Awaits a request and, when it has not answered after delay seconds, a
+    duplicate of it, keeping the first answer and cancelling the other
+    request. A request that fails waits for the other one.
+
+    Args:
+        start: Starts the request, or its duplicate when given True.
+        delay: Time before the duplicate is sent, or None to send none.
+        ready: Set when the request is sent, if it may first wait, such as
+            for a slot of the concurrency limiter. The delay runs from then,
+            as the latencies it comes from do.
+
+    Returns:
+        The first answer.
+
+    Raises:
+        Exception: The error of the request when both fail.
+    """
+    first = asyncio.ensure_future(start(False))
+    if delay is None:
+        return await first
+    tasks = [first]
+    try:
+        if ready is not None:
+            waiting = asyncio.ensure_future(ready.wait())
+            tasks.append(waiting)
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            tasks.remove(waiting)
+            waiting.cancel()
+            if first.done():
+                return first.result()
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            return first.result()
+        counters["sent"] += 1
+        tasks.append(asyncio.ensure_future(start(True)))
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is None:
+                    if task is not first:
+                        counters["won"] += 1
+                    return task.result()
+        # Both failed, so the error of the request is raised.
+        return first.result()
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
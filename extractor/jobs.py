@@ -0,0 +1,315 @@
+import contextlib
+import itertools
+import json
+import pathlib
+import sqlite3
+import time
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+import config
+import models
+import records
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+# Rows inserted per transaction by enqueue, so other workers can lease and
+# report between them while an input is read.
+_ENQUEUE_CHUNK = 1000
+
+
+class Job(NamedTuple):
+    codigo: str
+    source: str
+    attempts: int
+    publication: models.RawPublication
+
+
+class JobQueue:
+    """
+    Queue of publications to extract, shared by workers through SQLite.
+
+    Every publication is a job in one of the states pending, leased, done or
+    failed. A worker leases a batch of jobs for lease_seconds; a lease that
+    expires (the worker died or hung) makes its jobs leasable again. A job
+    that fails max_attempts times is left failed.
+
+    Leasing and reporting are single short transactions, so many workers,
+    on this host or on others sharing the file, can use the same queue.
+    """
+
+    def __init__(
+        self,
+        path: pathlib.Path,
+        lease_seconds: float,
+        max_attempts: int,
+        journal_mode: str = "WAL",
+    ):
+        """
+        Args:
+            path: The SQLite database file.
+            lease_seconds: How long a lease lasts unless renewed.
+            max_attempts: Attempts of a job before it is left failed.
+            journal_mode: SQLite journal mode. WAL lets readers run alongside
+                the writer but needs shared memory, so it only works when all
+                workers see the file through a local filesystem; use
+                "DELETE" on network filesystems.
+        """
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # Transactions are managed explicitly so that leases are taken under
+        # BEGIN IMMEDIATE, which holds the write lock from the first read.
+        self._connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self._connection.execute(f"PRAGMA journal_mode = {journal_mode}")
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                codigo TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                data TEXT,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_owner TEXT,
+                lease_expires REAL,
+                result TEXT,
+                error TEXT,
+                updated_at REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, lease_expires);
+            CREATE INDEX IF NOT EXISTS jobs_source ON jobs (source, state);
+            CREATE TABLE IF NOT EXISTS exports (
+                source TEXT PRIMARY KEY,
+                exported_at REAL NOT NULL,
+                owner TEXT,
+                finished INTEGER NOT NULL DEFAULT 1);
+        """)
+        # Queues created before claims had an owner; their exports finished.
+        columns = {
+            row[1] for row in self._connection.execute("PRAGMA table_info(exports)")
+        }
+        if "owner" not in columns:
+            self._connection.executescript("""
+                ALTER TABLE exports ADD COLUMN owner TEXT;
+                ALTER TABLE exports ADD COLUMN finished INTEGER NOT NULL DEFAULT 1;
+            """)
+
+    def close(self) -> None:
+        self._connection.close()
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield self._connection
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+
+    def _fail_expired(self, connection: sqlite3.Connection, now: float) -> None:
+        # Jobs whose last attempt was abandoned can no longer be leased.
+        connection.execute(
+            f"""
+            UPDATE jobs SET state = '{FAILED}', error = 'lease expired',
+                lease_owner = NULL, lease_expires = NULL, updated_at = ?
+            WHERE state = '{LEASED}' AND lease_expires < ? AND attempts >= ?
+            """,
+            (now, now, self.max_attempts),
+        )
+
+    def enqueue(
+        self, source: str, publications: Iterable[models.RawPublication]
+    ) -> int:
+        """
+        Adds the publications of an input source as pending jobs.
+
+        Publications already in the queue are left as they are, so every
+        worker can enqueue the same inputs. They are committed in chunks, so
+        the write lock is not held while the whole input is read.
+
+        Returns:
+            The number of new jobs.
+        """
+        now = time.time()
+        rows = (
+            (p.codigo, source, p.data, records.dump_publication(p), now)
+            for p in publications
+        )
+        added = 0
+        while chunk := list(itertools.islice(rows, _ENQUEUE_CHUNK)):
+            with self._transaction() as connection:
+                cursor = connection.executemany(
+                    "INSERT OR IGNORE INTO jobs (codigo, source, data, payload,"
+                    f" state, updated_at) VALUES (?, ?, ?, ?, '{PENDING}', ?)",
+                    chunk,
+                )
+                if cursor.rowcount:
+                    # New jobs reopen a source that was already exported.
+                    connection.execute(
+                        "DELETE FROM exports WHERE source = ?", (source,)
+                    )
+            added += cursor.rowcount
+        return added
+
+    def lease(self, owner: str, limit: int) -> List[Job]:
+        """
+        Leases up to limit jobs that are pending or whose lease expired.
+
+        Args:
+            owner: Unique name of the worker, e.g. host and pid.
+            limit: Maximum number of jobs.
+
+        Returns:
+            The leased jobs, in insertion order.
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            self._fail_expired(connection, now)
+            rows = connection.execute(
+                f"""
+                SELECT codigo, source, attempts, payload FROM jobs
+                WHERE (state = '{PENDING}'
+                       OR (state = '{LEASED}' AND lease_expires < ?))
+                  AND attempts < ?
+                ORDER BY rowid LIMIT ?
+                """,
+                (now, self.max_attempts, limit),
+            ).fetchall()
+            connection.executemany(
+                f"""
+                UPDATE jobs SET state = '{LEASED}', attempts = attempts + 1,
+                    lease_owner = ?, lease_expires = ?, updated_at = ?
+                WHERE codigo = ?
+                """,
+                [(owner, now + self.lease_seconds, now, row[0]) for row in rows],
+            )
+        return [
+            Job(
+                codigo,
+                source,
+                attempts + 1,
+                # The payload was stored with its texto already unescaped.
+                records.decode_publication(json.loads(payload), unescape_texto=False)
+                if config.FAST_RECORDS
+                else models.RawPublication.model_validate_json(payload),
+            )
+            for codigo, source, attempts, payload in rows
+        ]
+
+    def renew(self, owner: str, codigos: List[str]) -> None:
+        """
+        Extends the leases of jobs still being worked on.
+        """
+        now = time.time()
+        self._connection.executemany(
+            f"UPDATE jobs SET lease_expires = ?, updated_at = ? "
+            f"WHERE codigo = ? AND state = '{LEASED}' AND lease_owner = ?",
+            [(now + self.lease_seconds, now, codigo, owner) for codigo in codigos],
+        )
+
+    def complete(self, owner: str, codigo: str, result: Dict[str, Any]) -> bool:
+        """
+        Stores the result of a leased job.
+
+        Returns:
+            False when the lease was lost to another worker, whose result
+            is then kept instead.
+        """
+        cursor = self._connection.execute(
+            f"""
+            UPDATE jobs SET state = '{DONE}', result = ?, error = NULL,
+                lease_owner = NULL, lease_expires = NULL, updated_at = ?
+            WHERE codigo = ? AND state = '{LEASED}' AND lease_owner = ?
+            """,
+            (json.dumps(result, ensure_ascii=False), time.time(), codigo, owner),
+        )
+        return cursor.rowcount == 1
+
+    def fail(self, owner: str, codigo: str, error: str) -> None:
+        """
+        Releases a leased job after an error, leaving it failed once it used
+        all its attempts.
+        """
+        self._connection.execute(
+            f"""
+            UPDATE jobs SET
+                state = CASE WHEN attempts >= ? THEN '{FAILED}' ELSE '{PENDING}' END,
+                error = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ?
+            WHERE codigo = ? AND state = '{LEASED}' AND lease_owner = ?
+            """,
+            (self.max_attempts, error, time.time(), codigo, owner),
+        )
+
+    def progress(self, source: Optional[str] = None) -> Dict[str, int]:
+        """
+        Counts the jobs in each state, for one source or for the whole queue.
+        """
+        query = "SELECT state, COUNT(*) FROM jobs"
+        parameters = ()
+        if source is not None:
+            query += " WHERE source = ?"
+            parameters = (source,)
+        counts = dict.fromkeys([PENDING, LEASED, DONE, FAILED], 0)
+        counts.update(self._connection.execute(query + " GROUP BY state", parameters))
+        return counts
+
+    def claim_export(self, owner: str, source: str) -> bool:
+        """
+        Claims the export of a source whose jobs are all done or failed.
+
+        A claim that is not finished with finish_export within lease_seconds,
+        as its worker died, can be taken over by another worker.
+
+        Returns:
+            True for exactly one worker at a time, once the source is finished.
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            self._fail_expired(connection, now)
+            unfinished = connection.execute(
+                f"SELECT 1 FROM jobs WHERE source = ? "
+                f"AND state IN ('{PENDING}', '{LEASED}') LIMIT 1",
+                (source,),
+            ).fetchone()
+            if unfinished is not None:
+                return False
+            cursor = connection.execute(
+                """
+                INSERT INTO exports VALUES (?, ?, ?, 0)
+                ON CONFLICT (source) DO UPDATE SET
+                    exported_at = excluded.exported_at, owner = excluded.owner
+                WHERE NOT finished AND exported_at < ?
+                """,
+                (source, now, owner, now - self.lease_seconds),
+            )
+        return cursor.rowcount == 1
+
+    def finish_export(self, owner: str, source: str) -> None:
+        """
+        Marks the export of a source claimed with claim_export as written.
+        """
+        self._connection.execute(
+            "UPDATE exports SET finished = 1 WHERE source = ? AND owner = ?",
+            (source, owner),
+        )
+
+    def results(self, source: str) -> Iterator[Dict[str, Any]]:
+        """
+        Yields the done jobs of a source with a result as checkpoint entries.
+        """
+        rows = self._connection.execute(
+            f"SELECT codigo, data, result FROM jobs WHERE source = ? "
+            f"AND state = '{DONE}' AND result != 'null' ORDER BY rowid",
+            (source,),
+        )
+        for codigo, data, result in rows:
+            yield {"codigo": codigo, "data": data, "result": json.loads(result)}
+
+    def sources(self) -> List[str]:
+        return [
+            row[0]
+            for row in self._connection.execute(
+                "SELECT DISTINCT source FROM jobs ORDER BY source"
+            )
+        ]
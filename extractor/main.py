@@ -1,52 +1,545 @@
-import html
+import asyncio
+import collections
+import concurrent.futures
+import functools
+import itertools
 import json
+import multiprocessing
+import os
+import socket
 import time
-from typing import Dict, List
+from typing import Any, Dict, List, Optional, Tuple
 
+import pydantic
+
+import backends
+import batching
+import checkpoint
+import compress
+import concurrency
 import config
+import dedup
+import endpoints
+import hedging
+import incremental
+import jobs
 import log
 import models
-import ollama
+import municipios
+import pipeline
 import prompt
+import reader
+import reextract
+import relevance
+import repair
+import retry
+import rules
+import sinks
+import templates
 import utils
+import window
 
 logger = log.get_logger(__name__)
 
+ALL_FIELDS = tuple(models.Licitacao.model_fields)
+
+# How the publications of the current input were resolved, by prepare.
+resolutions: Dict[str, int] = collections.Counter()
+
+
+def endpoint_pool(hosts: Optional[List[str]] = None) -> endpoints.Pool:
+    """
+    Returns:
+        The pool of the given hosts of BACKEND, by default OPENAI_HOSTS for
+        OpenAI-compatible servers and else OLLAMA_HOSTS or OLLAMA_HOST.
+    """
+    if config.BACKEND == backends.OPENAI:
+        default_hosts = config.OPENAI_HOSTS
+    else:
+        default_hosts = config.OLLAMA_HOSTS or [config.OLLAMA_HOST]
+    return endpoints.Pool(
+        hosts or default_hosts,
+        config.HEALTH_SECONDS,
+        config.HEALTH_TIMEOUT,
+        config.FIRST_TOKEN_TIMEOUT,
+        config.BACKEND,
+    )
+
+
+@functools.lru_cache
+def retrier() -> retry.Retrier:
+    return retry.Retrier(
+        retry.Budget(config.RETRY_BUDGET_RATIO, config.RETRY_BUDGET_CAPACITY),
+        config.RETRY_CIRCUIT_FAILURES,
+        config.RETRY_CIRCUIT_SECONDS,
+    )
+
+
+@functools.lru_cache
+def retry_policies() -> Dict[str, retry.Policy]:
+    # Answers past their deadline are not retried, as they would pass it
+    # again, and answers that fail validation are attempted without sleeping.
+    return {
+        retry.TRANSPORT: retry.Policy(
+            config.RETRY_ATTEMPTS, config.RETRY_BASE_SECONDS, config.RETRY_MAX_SECONDS
+        ),
+        retry.SCHEMA: retry.Policy(config.SCHEMA_ATTEMPTS, 0, 0),
+    }
+
+
+@functools.lru_cache
+def concurrency_limiter() -> concurrency.Limiter:
+    """
+    Returns:
+        The limiter of the requests in flight of the process, adaptive with
+        ADAPTIVE_CONCURRENCY and else fixed at MAX_CONCURRENT_REQUESTS.
+    """
+    minimum = (
+        config.MIN_CONCURRENT_REQUESTS
+        if config.ADAPTIVE_CONCURRENCY
+        else config.MAX_CONCURRENT_REQUESTS
+    )
+    return concurrency.Limiter(
+        minimum,
+        config.MAX_CONCURRENT_REQUESTS,
+        config.ADAPTIVE_FIRST_TOKEN_SECONDS,
+        config.ADAPTIVE_TOKENS_PER_SECOND,
+        config.ADAPTIVE_BACKOFF,
+    )
+
+
+@functools.lru_cache
+def latencies(batch: bool) -> hedging.Latencies:
+    return hedging.Latencies(config.HEDGE_WINDOW, config.HEDGE_MIN_SAMPLES)
+
+
+def answer_validator(model, batch) -> Optional[incremental.Validator]:
+    """
+    Returns:
+        A validator of the answer streamed for the model with
+        VALIDATE_STREAM, tolerating the values that repair.py fixes when
+        REPAIR_ANSWERS is set, or None.
+    """
+    if not config.VALIDATE_STREAM:
+        return None
+    return incremental.Validator(
+        model,
+        batch,
+        config.REPETITION_REPEATS,
+        config.REPETITION_MIN_CHARS,
+        config.REPETITION_MAX_CHARS,
+        config.MAX_WHITESPACE,
+        repair.coerce_value if config.REPAIR_ANSWERS else None,
+    )
+
+
+def chat(client, prompts, key, task_id, model, batch=False, parse=None):
+    """
+    Streams an answer from the hosts of the endpoint pool client, retrying
+    transport errors and, with parse, invalid answers. The circuit breaker
+    covers the whole pool, and every attempt goes to the best host at the
+    time.
 
-def extract(client, prompts, key, task_id):
+    Args:
+        model: The model of the answer, whose JSON schema constrains it.
+        batch: Whether the answer is for a batch of documents.
+        parse: Turns the answer into the result, raising
+            pydantic.ValidationError when it is invalid.
+
+    Returns:
+        The answer, or its result with parse.
+    """
+
+    def answer():
+        content = stream_chat(client, prompts, key, task_id, model, batch)
+        return content if parse is None else parse(content)
+
+    return retrier().call(client, retry_policies(), answer)
+
+
+async def chat_async(client, prompts, key, task_id, model, batch=False, parse=None):
+    async def answer():
+        content = await hedged_chat_async(client, prompts, key, task_id, model, batch)
+        return content if parse is None else parse(content)
+
+    return await retrier().call_async(client, retry_policies(), answer)
+
+
+async def hedged_chat_async(client, prompts, key, task_id, model, batch) -> str:
+    """
+    Streams an answer, hedged with a duplicate request to another host when
+    HEDGE_PERCENTILE is set and the answer takes longer than that percentile
+    of the latencies of its kind.
+    """
+    delay = None
+    if config.HEDGE_PERCENTILE is not None and len(client.endpoints) > 1:
+        delay = latencies(batch).percentile(config.HEDGE_PERCENTILE)
+    # The hosts running the request, left out by its duplicate.
+    hosts: List[str] = []
+    # Set once the request has a slot of the limiter, as the latencies are
+    # measured from then and a request still waiting adds no load to hedge.
+    sent = asyncio.Event()
+
+    def start(duplicate: bool):
+        if duplicate:
+            logger.info(f"Task {task_id}: Hedging document {key} after {delay:.2f} s")
+            return stream_chat_async(client, prompts, key, task_id, model, batch, hosts)
+        return stream_chat_async(
+            client, prompts, key, task_id, model, batch, hosts, sent
+        )
+
+    return await hedging.hedge(start, delay, sent)
+
+
+def aborted(key, task_id, error: incremental.AbortedAnswer) -> str:
+    """
+    Logs an answer aborted by its validator.
+
+    Returns:
+        Its valid part, left to repair.py and reextract.py as any answer.
+    """
+    logger.warning(f"Task {task_id}: Aborted the answer for document {key}: {error}")
+    return error.content
+
+
+def stream_chat(client, prompts, key, task_id, model, batch=False) -> str:
     logger.info(f"Task {task_id}: Starting extraction for document {key}")
     start_time = time.perf_counter()
+    deadline = config.REQUEST_DEADLINE
+    timed_out = False
+    validator = answer_validator(model, batch)
+
+    with concurrency_limiter().acquire() as measure:
+        with client.acquire(config.MODEL) as endpoint:
+            stream = endpoint.backend.chat(
+                config.MODEL, prompts, model.model_json_schema(), config.OPTIONS
+            )
+
+            content_parts: list[str] = []
+            for piece in stream:
+                measure.token()
+                content_parts.append(piece)
+                print(piece, end="", flush=True)
+                if validator is not None:
+                    try:
+                        validator.feed(piece)
+                    except incremental.AbortedAnswer as error:
+                        stream.close()
+                        return aborted(key, task_id, error)
+                # A stalled stream is cut by FIRST_TOKEN_TIMEOUT, between chunks.
+                elapsed = time.perf_counter() - measure.start
+                if deadline is not None and elapsed > deadline:
+                    # Closing the stream closes its connection.
+                    stream.close()
+                    timed_out = True
+                    break
+
+        # Raised outside the pool, as a slow answer does not mean the host is
+        # down, but seen by the limiter, as it may mean it is overloaded.
+        if timed_out:
+            raise retry.DeadlineExceeded(
+                f"Document {key} passed its deadline of {deadline} s"
+            )
 
-    stream = client.chat(
-        model=config.MODEL,
-        messages=prompts,
-        format=models.Licitacao.model_json_schema(),
-        options=config.OPTIONS,
-        stream=True,
+    logger.info(
+        "Task %s: Finished extraction for document %s in %.2f s on %s",
+        task_id,
+        key,
+        time.perf_counter() - start_time,
+        endpoint.host,
     )
+    return "".join(content_parts)
+
 
-    content_parts: list[str] = []
-    for chunk in stream:
-        piece = chunk.get("message", {}).get("content")
-        if piece:
-            content_parts.append(piece)
-            print(piece, end="", flush=True)
+async def stream_chat_async(
+    client, prompts, key, task_id, model, batch=False, hosts=None, sent=None
+) -> str:
+    """
+    Args:
+        batch: Whether the request is for a batch, whose latencies are kept
+            apart from those of single documents.
+        hosts: The hosts already running the request, which are avoided and
+            to which the chosen host is added.
+        sent: An event set once the limiter lets the request go.
+    """
+    logger.info(f"Task {task_id}: Starting extraction for document {key}")
+    start_time = time.perf_counter()
+    hosts = [] if hosts is None else hosts
+    validator = answer_validator(model, batch)
 
-    full_content = "".join(content_parts)
+    # The deadline runs from the moment the limiter lets the request go.
+    async with concurrency_limiter().acquire_async() as measure:
+        if sent is not None:
+            sent.set()
+        # Passing the deadline cancels the request, which closes its
+        # connection. The host is not marked down, as a slow answer does not
+        # mean it is.
+        deadline = asyncio.timeout(config.REQUEST_DEADLINE)
+        try:
+            async with deadline:
+                async with client.acquire_async(config.MODEL, tuple(hosts)) as endpoint:
+                    hosts.append(endpoint.host)
+                    stream = endpoint.backend.chat_async(
+                        config.MODEL,
+                        prompts,
+                        model.model_json_schema(),
+                        config.OPTIONS,
+                    )
 
-    extracted_data = models.Licitacao.model_validate_json(full_content, strict=True)
+                    # Pieces are not echoed here: with several streams in
+                    # flight the output would be interleaved and unreadable.
+                    content_parts: list[str] = []
+                    async for piece in stream:
+                        measure.token()
+                        content_parts.append(piece)
+                        if validator is not None:
+                            try:
+                                validator.feed(piece)
+                            except incremental.AbortedAnswer as error:
+                                # Not a latency: the answer was cut short.
+                                await stream.aclose()
+                                return aborted(key, task_id, error)
+        except TimeoutError as error:
+            if not deadline.expired():
+                raise
+            raise retry.DeadlineExceeded(
+                f"Document {key} passed its deadline of {config.REQUEST_DEADLINE} s"
+            ) from error
 
+    latencies(batch).add(time.perf_counter() - measure.start)
     logger.info(
-        "Task %s: Finished extraction for document %s in %.2f s",
+        "Task %s: Finished extraction for document %s in %.2f s on %s",
         task_id,
         key,
         time.perf_counter() - start_time,
+        endpoint.host,
+    )
+    return "".join(content_parts)
+
+
+def repaired(content, fields, key, batch=False) -> str:
+    """
+    Repairs an answer with repair.py, if enabled, logging every repair.
+    """
+    if not config.REPAIR_ANSWERS:
+        return content
+    repair_answer = repair.repair_batch if batch else repair.repair
+    content, repairs = repair_answer(content, fields)
+    for description in repairs:
+        logger.info(f"Document {key}: repaired {description}")
+    return content
+
+
+def parser(fields, key):
+    """
+    Returns:
+        A function that validates an answer for the fields, once repaired,
+        into the extracted fields.
+    """
+    extraction_model = models.partial_model(fields)
+
+    def parse(content):
+        content = repaired(content, fields, key)
+        return extraction_model.model_validate_json(content, strict=True).model_dump()
+
+    return parse
+
+
+def extract(client, prompts, key, task_id, fields=ALL_FIELDS):
+    extraction_model = models.partial_model(fields)
+    parse = parser(fields, key)
+    return chat(client, prompts, key, task_id, extraction_model, parse=parse)
+
+
+async def extract_async(client, prompts, key, task_id, fields=ALL_FIELDS):
+    extraction_model = models.partial_model(fields)
+    parse = parser(fields, key)
+    return await chat_async(
+        client, prompts, key, task_id, extraction_model, parse=parse
     )
-    return extracted_data.model_dump()
 
 
-def create_prompt(title: str, body: str) -> List[Dict[str, str]]:
-    body = utils.clean_html_text(body)
+def check_answer(document, content, fields) -> reextract.Checked:
+    checked = reextract.check(content, fields, f"{document.titulo}\n{document.body}")
+    if checked.invalid or checked.ungrounded:
+        logger.info(
+            f"Document {document.codigo}: invalid fields {list(checked.invalid)}, "
+            f"fields not found in the text {list(checked.ungrounded)}"
+        )
+    return checked
+
+
+def reextract_prompt(document, fields) -> List[Dict[str, str]]:
+    body = reextract.focus(document.body, fields, config.REEXTRACT_TOKEN_BUDGET)
+    return create_prompt(document.titulo, body, fields)
+
+
+def validate_settled(document, values, task_id) -> Optional[Dict[str, Any]]:
+    """
+    Validates the fields of a document settled after its re-extraction.
+
+    Returns:
+        The extracted fields, or None when a required field is still invalid,
+        leaving the document without a result.
+    """
+    extraction_model = models.partial_model(document.fields)
+    try:
+        extracted = extraction_model.model_validate_json(
+            json.dumps(values), strict=True
+        )
+    except pydantic.ValidationError as error:
+        logger.error(
+            f"Task {task_id}: Re-extraction of document {document.codigo} left "
+            f"invalid fields, leaving it without a result: {error}"
+        )
+        return None
+    return extracted.model_dump()
+
+
+def extract_document(client, document, task_id):
+    """
+    Extracts a document on its own request.
+
+    With REEXTRACT_FIELDS, the valid fields of the answer are kept and the
+    invalid ones, or those whose value is not in the text, are asked again
+    in a second request with their schema alone and the text lines relevant
+    to them.
+
+    Returns:
+        The extracted fields, or None when a required field is still invalid
+        after the second request.
+    """
+    prompts = document_prompt(document)
+    fields = document.fields
+    if not config.REEXTRACT_FIELDS or document.reference is not None:
+        return extract(client, prompts, document.codigo, task_id, fields)
+
+    model = models.partial_model(fields)
+    content = chat(client, prompts, document.codigo, task_id, model)
+    content = repaired(content, fields, document.codigo)
+    checked = check_answer(document, content, fields)
+    failing = checked.failing(fields)
+    values = {f: v for f, v in checked.valid.items() if f not in failing}
+    if failing:
+        prompts = reextract_prompt(document, failing)
+        model = models.partial_model(failing)
+        content = chat(client, prompts, document.codigo, task_id, model)
+        content = repaired(content, failing, document.codigo)
+        values.update(reextract.settle(check_answer(document, content, failing)))
+    return validate_settled(document, values, task_id)
+
+
+async def extract_document_async(client, document, task_id):
+    prompts = document_prompt(document)
+    fields = document.fields
+    if not config.REEXTRACT_FIELDS or document.reference is not None:
+        return await extract_async(client, prompts, document.codigo, task_id, fields)
+
+    model = models.partial_model(fields)
+    content = await chat_async(client, prompts, document.codigo, task_id, model)
+    content = repaired(content, fields, document.codigo)
+    checked = check_answer(document, content, fields)
+    failing = checked.failing(fields)
+    values = {f: v for f, v in checked.valid.items() if f not in failing}
+    if failing:
+        prompts = reextract_prompt(document, failing)
+        model = models.partial_model(failing)
+        content = await chat_async(client, prompts, document.codigo, task_id, model)
+        content = repaired(content, failing, document.codigo)
+        values.update(reextract.settle(check_answer(document, content, failing)))
+    return validate_settled(document, values, task_id)
+
+
+def batch_key(documents: List[batching.Document]) -> str:
+    return ", ".join(document.codigo for document in documents)
+
+
+def log_batch(documents, results, task_id):
+    missing = [d.codigo for d in documents if d.codigo not in results]
+    if missing:
+        logger.warning(
+            f"Task {task_id}: Batch returned no valid extraction for {missing}, "
+            "extracting them one by one"
+        )
+
+
+def extract_batch(client, documents, task_id):
+    """
+    Extracts a batch of documents with a single request, falling back to one
+    request per document for those the batch did not extract.
+
+    A request past REQUEST_DEADLINE is not retried: a batch falls back to its
+    documents, and a document is left without a result, as is a document
+    whose answer fails validation, so one bad answer does not stop the run.
+
+    Returns:
+        (document, result) pairs for every document of the batch.
+    """
+    results = {}
+    if len(documents) > 1:
+        model = models.batch_model(documents[0].fields)
+        prompts = batching.create_batch_prompt(documents)
+        try:
+            content = chat(client, prompts, batch_key(documents), task_id, model, True)
+        except retry.DeadlineExceeded as error:
+            logger.warning(f"Task {task_id}: {error}")
+        else:
+            content = repaired(content, documents[0].fields, batch_key(documents), True)
+            results = batching.parse_batch(content, documents)
+        log_batch(documents, results, task_id)
+
+    for document in documents:
+        extracted = results.get(document.codigo)
+        if extracted is None:
+            try:
+                extracted = extract_document(client, document, task_id)
+            except retry.DeadlineExceeded as error:
+                logger.error(f"Task {task_id}: {error}, leaving it without a result")
+            except pydantic.ValidationError as error:
+                logger.error(
+                    f"Task {task_id}: Invalid answer for document {document.codigo}, "
+                    f"leaving it without a result: {error}"
+                )
+        yield document, merge(document.prefilled, extracted)
+
+
+async def extract_batch_async(client, documents, task_id):
+    results = {}
+    if len(documents) > 1:
+        model = models.batch_model(documents[0].fields)
+        prompts = batching.create_batch_prompt(documents)
+        try:
+            content = await chat_async(
+                client, prompts, batch_key(documents), task_id, model, batch=True
+            )
+        except retry.DeadlineExceeded as error:
+            logger.warning(f"Task {task_id}: {error}")
+        else:
+            content = repaired(content, documents[0].fields, batch_key(documents), True)
+            results = batching.parse_batch(content, documents)
+        log_batch(documents, results, task_id)
+
+    pairs = []
+    for document in documents:
+        extracted = results.get(document.codigo)
+        if extracted is None:
+            try:
+                extracted = await extract_document_async(client, document, task_id)
+            except retry.DeadlineExceeded as error:
+                logger.error(f"Task {task_id}: {error}, leaving it without a result")
+            except pydantic.ValidationError as error:
+                logger.error(
+                    f"Task {task_id}: Invalid answer for document {document.codigo}, "
+                    f"leaving it without a result: {error}"
+                )
+        pairs.append((document, merge(document.prefilled, extracted)))
+    return pairs
+
+
+def create_prompt(
+    title: str, body: str, fields: Tuple[str, ...] = ALL_FIELDS
+) -> List[Dict[str, str]]:
+    template = prompt.PROMPT if fields == ALL_FIELDS else prompt.build_prompt(fields)
     contexto = f"""# Contexto
 ## Nome do Documento
 {title}
@@ -55,37 +548,512 @@ def create_prompt(title: str, body: str) -> List[Dict[str, str]]:
 {body}
 """
     prompts = [
-        {"role": "system", "content": prompt.PROMPT.replace("{CONTEXTO}", contexto)},
+        {"role": "system", "content": template.replace("{CONTEXTO}", contexto)},
     ]
     return prompts
 
 
-def process_publications():
-    client = ollama.Client(host=config.OLLAMA_HOST)
-    for file in config.INPUT_PATH.iterdir():
-        publications = json.loads(file.read_text(encoding="utf-8"))
-        raw_publications = {
-            item["codigo"]: models.RawPublication(
-                **{**item, "texto": html.unescape(item["texto"])}
+def create_diff_prompt(document: batching.Document) -> List[Dict[str, str]]:
+    template = prompt.build_diff_prompt(document.fields)
+    reference = json.dumps(document.reference, indent=2, ensure_ascii=False)
+    contexto = f"""# Contexto
+## Nome do Documento
+{document.titulo}
+
+## Entidades do Documento Semelhante
+{reference}
+
+## Linhas Alteradas
+{document.body}
+"""
+    return [{"role": "system", "content": template.replace("{CONTEXTO}", contexto)}]
+
+
+def document_prompt(document: batching.Document) -> List[Dict[str, str]]:
+    if document.reference is not None:
+        return create_diff_prompt(document)
+    return create_prompt(document.titulo, document.body, document.fields)
+
+
+@functools.lru_cache
+def prompt_tokens(fields: Tuple[str, ...]) -> int:
+    return window.count_tokens(create_prompt("", "", fields)[0]["content"])
+
+
+def fit_body(publication: models.RawPublication, body: str, fields) -> str:
+    budget = (
+        config.CONTEXT_TOKEN_BUDGET
+        - prompt_tokens(fields)
+        - window.count_tokens(publication.titulo)
+    )
+    fitted = window.fit(body, max(budget, 0))
+    if fitted.dropped_tokens:
+        logger.info(
+            f"Document {publication.codigo}: dropped ~{fitted.dropped_tokens} "
+            f"tokens at lines {fitted.dropped_lines} to fit the context budget"
+        )
+    return fitted.text
+
+
+@functools.lru_cache
+def compressor() -> Optional[compress.Compressor]:
+    if config.BOILERPLATE_PATH is None and not config.COLLAPSE_ITEM_TABLES:
+        return None
+    boilerplate = None
+    if config.BOILERPLATE_PATH is not None:
+        boilerplate = compress.load(config.BOILERPLATE_PATH)
+    return compress.Compressor(boilerplate, config.COLLAPSE_ITEM_TABLES)
+
+
+def compress_body(publication: models.RawPublication, body: str) -> str:
+    compressed = compressor().compress(body)
+    if compressed.tokens_saved:
+        logger.info(
+            f"Document {publication.codigo}: saved ~{compressed.tokens_saved} tokens "
+            f"({compressed.boilerplate_lines} boilerplate lines, "
+            f"{compressed.item_tables} item tables)"
+        )
+    return compressed.text
+
+
+@functools.lru_cache
+def template_wrappers() -> Optional[templates.Wrappers]:
+    if config.TEMPLATES_PATH is None:
+        return None
+    return templates.Wrappers(
+        templates.load(config.TEMPLATES_PATH),
+        config.TEMPLATE_SIMILARITY,
+        config.TEMPLATE_MIN_CONFIDENCE,
+    )
+
+
+def analyze(publication: models.RawPublication) -> Tuple[str, Dict[str, Any]]:
+    """
+    Runs the CPU-side work on a publication: cleans its text, fills the
+    fields resolved by rules and template wrappers and compresses the text
+    for the prompt.
+
+    Returns:
+        The cleaned text and the prefilled fields.
+    """
+    body = utils.clean_html_text(publication.texto)
+    prefilled = rules.apply(publication, body) if config.USE_RULES else {}
+    if template_wrappers() is not None:
+        template, filled = template_wrappers().extract(publication.titulo, body)
+        if filled:
+            logger.info(
+                f"Document {publication.codigo} matches template {template}: "
+                f"filled {sorted(filled)}"
             )
-            for item in publications
-        }
-        results = {}
+        prefilled = {**filled, **prefilled}
+    if config.RESOLVE_MUNICIPIO:
+        municipio = municipios.resolve(publication, body)
+        if municipio is not None:
+            prefilled["municipio"] = municipio
+    if compressor() is not None:
+        body = compress_body(publication, body)
+    return body, prefilled
+
+
+@functools.lru_cache
+def relevance_filter() -> Optional[relevance.Filter]:
+    if config.RELEVANCE_FILTER is None:
+        return None
+    model = None
+    if config.RELEVANCE_MODEL_PATH is not None:
+        model = relevance.load(config.RELEVANCE_MODEL_PATH)
+    return relevance.Filter(
+        config.RELEVANT_CATEGORIAS, model, config.RELEVANCE_THRESHOLD
+    )
+
+
+def is_irrelevant(publication: models.RawPublication, body: str) -> bool:
+    """
+    Checks a publication with the relevance filter, if enabled.
+
+    Returns:
+        Whether the publication must be skipped.
+    """
+    publication_filter = relevance_filter()
+    if publication_filter is None:
+        return False
+    reason = publication_filter.check(publication, body)
+    if reason is None:
+        return False
+    if config.RELEVANCE_FILTER == "log":
+        logger.info(f"Document {publication.codigo} would be skipped: {reason}")
+        return False
+    logger.info(f"Document {publication.codigo} skipped: {reason}")
+    return True
+
+
+def log_summary(name: str) -> None:
+    """
+    Logs how the publications of an input were resolved since the last
+    summary, the share of them that needed the LLM, the retries, the hedged
+    requests and the concurrency limit.
+    """
+    publication_filter = relevance_filter()
+    if publication_filter is not None and publication_filter.skipped:
+        logger.info(f"Irrelevant publications in {name}: {publication_filter.skipped}")
+        publication_filter.skipped.clear()
+    if retry.counters:
+        logger.info(f"Retries in {name}: {dict(retry.counters)}")
+        retry.counters.clear()
+    if hedging.counters:
+        logger.info(f"Hedged requests in {name}: {dict(hedging.counters)}")
+        hedging.counters.clear()
+    if config.ADAPTIVE_CONCURRENCY:
+        limiter = concurrency_limiter()
+        logger.info(f"Concurrency of {name}: {limiter.status()}")
+    total = sum(resolutions.values())
+    if total:
+        logger.info(
+            f"Publications of {name}: {dict(resolutions)}, "
+            f"LLM hit rate {resolutions['llm'] / total:.0%}"
+        )
+        resolutions.clear()
+
+
+def prepare(
+    publication: models.RawPublication,
+    index: Optional[dedup.Index] = None,
+    analyzed: Optional[Tuple[str, Dict[str, Any]]] = None,
+) -> batching.Document:
+    """
+    Resolves what can be resolved without the LLM and cleans the text for
+    the remaining fields.
+
+    Args:
+        publication: The publication to prepare.
+        index: The dedup index, if enabled.
+        analyzed: The result of analyze, when it already ran elsewhere.
+
+    Returns:
+        The prepared Document. Its body is None when no LLM call is needed,
+        and then its prefilled fields are the final result, None for an
+        irrelevant publication.
+    """
+    codigo, titulo = publication.codigo, publication.titulo
+    body, prefilled = analyzed or analyze(publication)
+    if is_irrelevant(publication, body):
+        resolutions["irrelevant"] += 1
+        return batching.Document(codigo, titulo, publication.data, None, (), None)
+    match = index.lookup(codigo, titulo, body) if index is not None else None
+    if match is not None:
+        kind = "an exact" if match.exact else f"a {match.similarity:.0%}"
+        logger.info(f"Document {codigo} is {kind} match of {match.codigo}")
+        if match.exact or config.DEDUP_NEAR_POLICY == "skip":
+            resolutions["duplicate"] += 1
+            result = merge(match.result, {})
+            return batching.Document(codigo, titulo, publication.data, None, (), result)
 
-        for task_id, key in enumerate(raw_publications):
-            prompts = create_prompt(
-                raw_publications[key].titulo, raw_publications[key].texto
+    fields = rules.missing_fields(prefilled)
+    if prefilled and rules.is_complete(prefilled):
+        logger.info(f"Document {codigo} resolved without the LLM")
+        resolutions["resolved"] += 1
+        result = merge({**dict.fromkeys(fields), **prefilled}, {})
+        return batching.Document(codigo, titulo, publication.data, None, (), result)
+    resolutions["llm"] += 1
+    if match is not None and config.DEDUP_NEAR_POLICY == "diff":
+        reference = {field: match.result[field] for field in fields}
+        diff = dedup.changed_lines(match.texto, body)
+        return batching.Document(
+            codigo, titulo, publication.data, diff, fields, prefilled, reference
+        )
+    if config.CONTEXT_TOKEN_BUDGET is not None:
+        body = fit_body(publication, body, fields)
+    return batching.Document(codigo, titulo, publication.data, body, fields, prefilled)
+
+
+def merge(prefilled, extracted):
+    if not prefilled or extracted is None:
+        return extracted
+    return models.Licitacao.model_validate({**prefilled, **extracted}).model_dump()
+
+
+def create_packer() -> batching.Packer:
+    return batching.Packer(config.BATCH_TOKEN_BUDGET, config.BATCH_MAX_DOCUMENTS)
+
+
+def open_index() -> Optional[dedup.Index]:
+    if config.DEDUP_PATH is None:
+        return None
+    return dedup.Index(config.DEDUP_PATH, config.DEDUP_THRESHOLD)
+
+
+def save(output, index, document, result):
+    if result is None:
+        output.discard(document.codigo)
+        if index is not None:
+            index.discard(document.codigo)
+        return
+    output.append(document.codigo, result, document.data)
+    if index is not None:
+        index.add(document.codigo, result)
+
+
+def process_publications(shard=None, hosts=None):
+    client = endpoint_pool(hosts)
+    index = open_index()
+    for name, stream in reader.iter_sources(config.INPUT_PATH):
+        output = checkpoint.Checkpoint(name, shard=shard and shard[0])
+        if output.is_finalized():
+            logger.info(f"Skipping {name} because it exists")
+            continue
+
+        with output:
+            packer = create_packer()
+            publications = output.track(reader.iter_publications(stream, shard), shard)
+            for task_id, publication in enumerate(publications):
+                if publication.codigo in output.done:
+                    continue
+                document = prepare(publication, index)
+                if document.body is None:
+                    save(output, index, document, document.prefilled)
+                    continue
+                for documents in packer.add(document):
+                    for item, result in extract_batch(client, documents, task_id):
+                        save(output, index, item, result)
+
+            for documents in packer.flush():
+                for item, result in extract_batch(client, documents, task_id):
+                    save(output, index, item, result)
+            log_summary(name)
+        if shard is None:
+            output.finalize()
+    if index is not None:
+        index.close()
+
+
+async def process_publications_async(shard=None, hosts=None):
+    client = endpoint_pool(hosts)
+    semaphore = asyncio.Semaphore(config.MAX_CONCURRENT_REQUESTS)
+    index = open_index()
+
+    async def bounded_extract(output, documents, task_id):
+        try:
+            for item, result in await extract_batch_async(client, documents, task_id):
+                save(output, index, item, result)
+        finally:
+            semaphore.release()
+
+    async def dispatch(output, batches, task_id, tasks):
+        for documents in batches:
+            await semaphore.acquire()
+            tasks.append(
+                asyncio.create_task(bounded_extract(output, documents, task_id))
             )
-            result = extract(client, prompts, key, task_id)
 
-            if result is not None:
-                results[key] = result
-        output_path = config.OUTPUT_PATH / f"{file.stem}.json"
-        output_path.write_text(json.dumps(results, indent=2, ensure_ascii=False))
+    for name, stream in reader.iter_sources(config.INPUT_PATH):
+        output = checkpoint.Checkpoint(name, shard=shard and shard[0])
+        if output.is_finalized():
+            logger.info(f"Skipping {name} because it exists")
+            continue
+
+        with output:
+            publications = output.track(reader.iter_publications(stream, shard), shard)
+            packer = create_packer()
+            tasks = []
+            for task_id in itertools.count():
+                # Reading waits for a free slot in dispatch, so besides the
+                # batch being filled at most MAX_CONCURRENT_REQUESTS batches are
+                # held in memory. Reading happens in a thread to keep a slow stdin
+                # from stalling the streams.
+                publication = await asyncio.to_thread(next, publications, None)
+                if publication is None:
+                    break
+                if publication.codigo in output.done:
+                    continue
+                document = prepare(publication, index)
+                if document.body is None:
+                    save(output, index, document, document.prefilled)
+                    continue
+                await dispatch(output, packer.add(document), task_id, tasks)
+            await dispatch(output, packer.flush(), task_id, tasks)
+            await asyncio.gather(*tasks)
+            log_summary(name)
+        if shard is None:
+            output.finalize()
+    if index is not None:
+        index.close()
+
+
+def extract_jobs(client, queue, owner, leased, index):
+    packer = create_packer()
+    batches = []
+    for job in leased:
+        document = prepare(job.publication, index)
+        if document.body is None:
+            result = document.prefilled
+            if queue.complete(owner, document.codigo, result) and index is not None:
+                index.add(document.codigo, result)
+            continue
+        batches.extend(packer.add(document))
+    batches.extend(packer.flush())
+
+    for task_id, documents in enumerate(batches):
+        pending = {document.codigo for document in documents}
+        queue.renew(owner, list(pending))
+        try:
+            for item, result in extract_batch(client, documents, task_id):
+                pending.discard(item.codigo)
+                if result is None:
+                    # Past its deadline or invalid: tried again until it runs
+                    # out of attempts.
+                    queue.fail(owner, item.codigo, "Extracted without a result")
+                    if index is not None:
+                        index.discard(item.codigo)
+                elif queue.complete(owner, item.codigo, result) and index is not None:
+                    index.add(item.codigo, result)
+        except retry.CircuitOpenError:
+            # The host is down: the leases expire and other workers take over.
+            raise
+        except Exception as error:
+            logger.exception(f"Task {task_id}: Extraction of {sorted(pending)} failed")
+            for codigo in pending:
+                queue.fail(owner, codigo, repr(error))
+                if index is not None:
+                    index.discard(codigo)
+
+
+def process_queue(hosts=None):
+    """
+    Runs a worker of the shared job queue in JOBS_PATH.
+
+    The inputs are enqueued (publications already in the queue are left as
+    they are) and jobs are leased JOBS_LEASE_SIZE at a time until none is
+    left. Any number of workers, on this host or others sharing JOBS_PATH,
+    can run at once; the worker that sees an input finished writes its output.
+    """
+    queue = jobs.JobQueue(
+        config.JOBS_PATH,
+        config.JOBS_LEASE_SECONDS,
+        config.JOBS_MAX_ATTEMPTS,
+        config.JOBS_JOURNAL_MODE,
+    )
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    for name, stream in reader.iter_sources(config.INPUT_PATH):
+        added = queue.enqueue(name, reader.iter_publications(stream))
+        logger.info(f"Enqueued {added} new publications from {name}")
+
+    client = endpoint_pool(hosts)
+    index = open_index()
+    while leased := queue.lease(owner, config.JOBS_LEASE_SIZE):
+        extract_jobs(client, queue, owner, leased, index)
+        logger.info(f"Queue progress: {queue.progress()}")
+    log_summary(str(config.JOBS_PATH))
+
+    suffix = sinks.SUFFIXES[config.OUTPUT_FORMAT]
+    for source in queue.sources():
+        if queue.claim_export(owner, source):
+            path = config.OUTPUT_PATH / f"{source}{suffix}"
+            sinks.write(path, queue.results(source), config.OUTPUT_FORMAT)
+            queue.finish_export(owner, source)
+            logger.info(f"Wrote {path}: {queue.progress(source)}")
+    if index is not None:
+        index.close()
+    queue.close()
+
+
+async def process_pipeline(shard=None, hosts=None):
+    client = endpoint_pool(hosts)
+    index = open_index()
+
+    def prepare_analyzed(publication, analyzed):
+        return prepare(publication, index, analyzed)
+
+    async def extract(documents, task_id):
+        return await extract_batch_async(client, documents, task_id)
+
+    workers = config.PIPELINE_WORKERS or os.cpu_count()
+    with (
+        concurrent.futures.ProcessPoolExecutor(workers) as pool,
+        concurrent.futures.ThreadPoolExecutor(1) as writer,
+    ):
+        for name, stream in reader.iter_sources(config.INPUT_PATH):
+            output = checkpoint.Checkpoint(name, shard=shard and shard[0])
+            if output.is_finalized():
+                logger.info(f"Skipping {name} because it exists")
+                continue
+
+            with output:
+                stages = pipeline.Pipeline(
+                    analyze,
+                    prepare_analyzed,
+                    extract,
+                    functools.partial(save, output, index),
+                    create_packer(),
+                    pool,
+                    writer,
+                    analyze_workers=workers,
+                    llm_workers=config.MAX_CONCURRENT_REQUESTS,
+                    queue_size=config.PIPELINE_QUEUE_SIZE,
+                )
+                await stages.run(
+                    output.track(reader.iter_publications(stream, shard), shard),
+                    output.done,
+                    config.PIPELINE_REPORT_SECONDS,
+                )
+                logger.info(f"Pipeline of {name} finished: {stages.occupancy()}")
+                log_summary(name)
+            if shard is None:
+                output.finalize()
+    if index is not None:
+        index.close()
+
+
+def run(shard=None, hosts=None):
+    if config.PIPELINE:
+        asyncio.run(process_pipeline(shard, hosts))
+    elif config.MAX_CONCURRENT_REQUESTS > 1:
+        asyncio.run(process_publications_async(shard, hosts))
+    else:
+        process_publications(shard, hosts)
+
+
+def process_sharded(workers: int):
+    """
+    Runs one extraction process per shard and merges their outputs.
+
+    Worker i takes every workers-th record of each input starting at record
+    i, so all inputs are spread over all workers. Every worker talks to the
+    i-th of SHARD_HOSTS (round robin) or, when it is empty, to its own pool of
+    all the hosts. Outputs are finalized only when every worker succeeded;
+    otherwise the shard logs are kept for the next run to resume.
+    """
+    hosts = [[host] for host in config.SHARD_HOSTS] or [None]
+    processes = [
+        multiprocessing.Process(
+            target=run,
+            args=((shard, workers), hosts[shard % len(hosts)]),
+            name=f"shard{shard}",
+        )
+        for shard in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    failed = [process.name for process in processes if process.exitcode != 0]
+    if failed:
+        logger.error(f"Shards {failed} failed, outputs were not finalized")
+        raise SystemExit(1)
+
+    for name, _ in reader.iter_sources(config.INPUT_PATH):
+        output = checkpoint.Checkpoint(name)
+        if not output.is_finalized():
+            output.finalize()
 
 
 def main():
-    process_publications()
+    if config.JOBS_PATH is not None:
+        process_queue()
+    elif config.WORKERS > 1 and str(config.INPUT_PATH) != "-":
+        process_sharded(config.WORKERS)
+    else:
+        run()
 
 
 if __name__ == "__main__":
@@ -1,8 +1,9 @@
+import functools
 from datetime import datetime
 from enum import StrEnum
-from typing import Optional
+from typing import List, Optional, Tuple, Type
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, create_model
 
 
 class RawPublication(BaseModel):
@@ -368,3 +369,33 @@ class Licitacao(BaseModel):
     site_do_edital: Optional[str]
     signatario: Optional[str]
     cargo_do_signatario: Optional[str]
+
+
+def _field_definitions(fields: Tuple[str, ...]) -> dict:
+    return {
+        field: (Licitacao.model_fields[field].annotation, Licitacao.model_fields[field])
+        for field in fields
+    }
+
+
+@functools.lru_cache
+def partial_model(fields: Tuple[str, ...]) -> Type[BaseModel]:
+    """
+    Builds a model with only some of the Licitacao fields, keeping their
+    types and constraints, so the LLM is asked for the missing fields only.
+    """
+    if fields == tuple(Licitacao.model_fields):
+        return Licitacao
+    return create_model("Licitacao", **_field_definitions(fields))
+
+
+@functools.lru_cache
+def batch_model(fields: Tuple[str, ...]) -> Type[BaseModel]:
+    """
+    Builds the response model of a batch of documents: a list with the given
+    Licitacao fields of every document, tagged by its codigo.
+    """
+    item = create_model(
+        "LicitacaoDoDocumento", codigo=(str, ...), **_field_definitions(fields)
+    )
+    return create_model("Lote", licitacoes=(List[item], ...))
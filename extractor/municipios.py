@@ -0,0 +1,129 @@
+import re
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+import models
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+# Words that introduce a municipality name in the text. Many names are also
+# common words ("Modelo", "Ouro", "Paraíso"), so a name found in the text is
+# only trusted right after one of these or right before "SC".
+_CONTEXT_BEFORE = {"municipio de", "prefeitura municipal de", "prefeitura de"}
+_CONTEXT_AFTER = "sc"
+
+
+def normalize(text: str) -> str:
+    """
+    Normalizes a text for accent- and case-insensitive comparison.
+
+    Args:
+        text: The text to normalize.
+
+    Returns:
+        The text without accents, casefolded and with punctuation turned into
+        single spaces.
+    """
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return _NON_WORD.sub(" ", stripped.casefold()).strip()
+
+
+_BY_NAME: Dict[str, models.Municipio] = {
+    normalize(municipio.value): municipio for municipio in models.Municipio
+}
+
+
+def _build_trie() -> dict:
+    trie: dict = {}
+    for name, municipio in _BY_NAME.items():
+        node = trie
+        for token in name.split():
+            node = node.setdefault(token, {})
+        node[None] = municipio
+    return trie
+
+
+_TRIE = _build_trie()
+
+
+def find_all(text: str) -> List[Tuple[int, int, models.Municipio]]:
+    """
+    Finds the municipality names in a text in a single pass over its words.
+
+    At each word the longest name starting there wins, so "São José do
+    Cedro" is not also reported as "São José".
+
+    Args:
+        text: The text to search.
+
+    Returns:
+        A list of (first word, end word, Municipio) over the normalized words.
+    """
+    tokens = normalize(text).split()
+    matches = []
+    position = 0
+    while position < len(tokens):
+        node = _TRIE
+        found = None
+        for end in range(position, len(tokens)):
+            node = node.get(tokens[end])
+            if node is None:
+                break
+            if None in node:
+                found = (position, end + 1, node[None])
+        if found is None:
+            position += 1
+        else:
+            matches.append(found)
+            position = found[1]
+    return matches
+
+
+def _unique(municipios: List[models.Municipio]) -> Optional[models.Municipio]:
+    distinct = set(municipios)
+    if len(distinct) == 1:
+        return distinct.pop()
+    return None
+
+
+def _from_text(text: str) -> Optional[models.Municipio]:
+    tokens = normalize(text).split()
+    candidates = []
+    for start, end, municipio in find_all(text):
+        before = " ".join(tokens[max(0, start - 3) : start])
+        after = tokens[end] if end < len(tokens) else ""
+        if after == _CONTEXT_AFTER or any(
+            before.endswith(context) for context in _CONTEXT_BEFORE
+        ):
+            candidates.append(municipio)
+    return _unique(candidates)
+
+
+def resolve(
+    publication: models.RawPublication, texto: str
+) -> Optional[models.Municipio]:
+    """
+    Resolves the municipio of a publication without the LLM.
+
+    The municipio informed by the DOM is tried first, then the name of the
+    entidade, and then the titulo and text, where a name is only taken when
+    it is the only one cited as a municipality.
+
+    Args:
+        publication: The publication being extracted.
+        texto: The cleaned text of the publication.
+
+    Returns:
+        The Municipio, or None when it cannot be told without ambiguity.
+    """
+    if publication.municipio:
+        municipio = _BY_NAME.get(normalize(publication.municipio))
+        if municipio is not None:
+            return municipio
+
+    municipio = _unique([match[2] for match in find_all(publication.entidade)])
+    if municipio is not None:
+        return municipio
+
+    return _from_text(f"{publication.titulo}\n{texto}")
@@ -0,0 +1,195 @@
+import asyncio
+import concurrent.futures
+import itertools
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set
+
+import batching
+import log
+import models
+
+logger = log.get_logger(__name__)
+
+_END = object()
+_FLUSH_SECONDS = 0.1
+
+
+class Stage:
+    """
+    Occupancy of a pipeline stage: its busy workers and the items waiting in
+    its bounded input queue.
+    """
+
+    def __init__(self, name: str, workers: int, queue_size: int):
+        self.name = name
+        self.workers = workers
+        self.queue: asyncio.Queue = asyncio.Queue(queue_size)
+        self.busy = 0
+        self.processed = 0
+
+    def occupancy(self) -> Dict[str, int]:
+        return {
+            "busy": self.busy,
+            "workers": self.workers,
+            "queued": self.queue.qsize(),
+            "capacity": self.queue.maxsize,
+            "processed": self.processed,
+        }
+
+    def __str__(self) -> str:
+        return (
+            f"{self.name}: {self.busy}/{self.workers} busy, "
+            f"{self.queue.qsize()}/{self.queue.maxsize} queued"
+        )
+
+
+class Pipeline:
+    """
+    Extracts the publications of an input through stages connected by
+    bounded queues:
+
+    - analyze: cleaning and rules (`analyze`) in a process pool, then the
+      dedup lookup and prompt preparation (`prepare`) on the event loop;
+    - pack: groups the prepared documents into batches;
+    - llm: `llm_workers` concurrent LLM requests (`extract`);
+    - write: checkpoint and index writes (`save`) in a dedicated thread.
+
+    A full queue blocks the stage that feeds it, so memory stays bounded and
+    the slowest stage sets the pace. Since the analyze stage works ahead of
+    the LLM, requests are not delayed by preprocessing.
+    """
+
+    def __init__(
+        self,
+        analyze: Callable[[models.RawPublication], Any],
+        prepare: Callable[[models.RawPublication, Any], batching.Document],
+        extract: Callable[[List[batching.Document], int], Any],
+        save: Callable[[batching.Document, Dict[str, Any]], None],
+        packer: batching.Packer,
+        process_pool: concurrent.futures.Executor,
+        writer: concurrent.futures.Executor,
+        analyze_workers: int,
+        llm_workers: int,
+        queue_size: int,
+    ):
+        self.analyze = analyze
+        self.prepare = prepare
+        self.extract = extract
+        self.save = save
+        self.packer = packer
+        self.process_pool = process_pool
+        self.writer = writer
+        self.stages = {
+            "analyze": Stage("analyze", analyze_workers, queue_size),
+            "pack": Stage("pack", 1, queue_size),
+            "llm": Stage("llm", llm_workers, queue_size),
+            "write": Stage("write", 1, queue_size),
+        }
+        self._task_ids = itertools.count()
+
+    def occupancy(self) -> Dict[str, Dict[str, int]]:
+        """
+        Returns:
+            The occupancy of every stage, by stage name.
+        """
+        return {name: stage.occupancy() for name, stage in self.stages.items()}
+
+    async def run(
+        self,
+        publications: Iterator[models.RawPublication],
+        skip: Set[str],
+        report_seconds: float,
+    ) -> None:
+        """
+        Runs the pipeline until every publication is written.
+
+        Args:
+            publications: The publications of the input.
+            skip: Codigos already extracted.
+            report_seconds: Interval of the occupancy log lines.
+        """
+        stages = self.stages
+        reporter = asyncio.create_task(self._report(report_seconds))
+        try:
+            async with asyncio.TaskGroup() as group:
+                group.create_task(self._read(publications, skip))
+                group.create_task(
+                    self._run_stage(stages["analyze"], self._analyze, stages["pack"])
+                )
+                group.create_task(
+                    self._run_stage(stages["pack"], self._pack, stages["llm"])
+                )
+                group.create_task(
+                    self._run_stage(stages["llm"], self._extract, stages["write"])
+                )
+                group.create_task(self._run_stage(stages["write"], self._write))
+        finally:
+            reporter.cancel()
+
+    async def _report(self, seconds: float) -> None:
+        while True:
+            await asyncio.sleep(seconds)
+            logger.info(" | ".join(str(stage) for stage in self.stages.values()))
+
+    async def _read(self, publications, skip) -> None:
+        analyze = self.stages["analyze"]
+        # Reading happens in a thread to keep a slow stdin from stalling the loop.
+        while (
+            publication := await asyncio.to_thread(next, publications, None)
+        ) is not None:
+            if publication.codigo not in skip:
+                await analyze.queue.put(publication)
+        for _ in range(analyze.workers):
+            await analyze.queue.put(_END)
+
+    async def _run_stage(
+        self, stage: Stage, work, downstream: Optional[Stage] = None
+    ) -> None:
+        async def worker():
+            while (item := await stage.queue.get()) is not _END:
+                stage.busy += 1
+                try:
+                    await work(item)
+                finally:
+                    stage.busy -= 1
+                stage.processed += 1
+
+        await asyncio.gather(*(worker() for _ in range(stage.workers)))
+        if downstream is not None:
+            if stage.name == "pack":
+                for documents in self.packer.flush():
+                    await downstream.queue.put(documents)
+            for _ in range(downstream.workers):
+                await downstream.queue.put(_END)
+
+    async def _analyze(self, publication: models.RawPublication) -> None:
+        loop = asyncio.get_running_loop()
+        analyzed = await loop.run_in_executor(
+            self.process_pool, self.analyze, publication
+        )
+        document = self.prepare(publication, analyzed)
+        await self.stages["pack"].queue.put(document)
+
+    async def _pack(self, document: batching.Document) -> None:
+        if document.body is None:
+            await self.stages["write"].queue.put((document, document.prefilled))
+            return
+        for documents in self.packer.add(document):
+            await self.stages["llm"].queue.put(documents)
+        # A batch still being filled is sent as soon as a request slot idles
+        # with nothing else to do.
+        llm, pack = self.stages["llm"], self.stages["pack"]
+        while pack.queue.empty() and self.packer.pending():
+            if llm.busy < llm.workers and llm.queue.empty():
+                for documents in self.packer.flush():
+                    await llm.queue.put(documents)
+                break
+            await asyncio.sleep(_FLUSH_SECONDS)
+
+    async def _extract(self, documents: List[batching.Document]) -> None:
+        pairs = await self.extract(documents, next(self._task_ids))
+        for pair in pairs:
+            await self.stages["write"].queue.put(pair)
+
+    async def _write(self, pair) -> None:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.writer, self.save, *pair)
@@ -1,18 +1,22 @@
-PROMPT = """
+ENTIDADES = {
+    "tipo_do_documento": r"""- Tipo do documento [enum] ^(Apostilamento|Anulação|Ata de Registro de Preços|Ata de Recebimento e Abertura|Adjucação|Aviso de Licitação|Aviso de Suspensão|Aviso de Cancelamento|Contrato|Edital|Errata|Homologação|Aditivo|Julgamento|Resultado|Ratificação)$""",
+    "numero_do_processo_licitatorio": r"""- Número do processo administrativo [string] ^\d+/\d+$""",
+    "municipio": r"""- Município [enum] ^(Abdon Batista|Abelardo Luz|Agrolândia|Agronômica|Água Doce|Águas de Chapecó|Águas Frias|Águas Mornas|Alfredo Wagner|Alto Bela Vista|Anchieta|Angelina|Anita Garibaldi|Anitápolis|Antônio Carlos|Apiúna|Arabutã|Araquari|Araranguá|Armazém|Arroio Trinta|Arvoredo|Ascurra|Atalanta|Aurora|Balneário Arroio do Silva|Balneário Barra do Sul|Balneário Camboriú|Balneário Gaivota|Balneário Piçarras|Balneário Rincão|Bandeirante|Barra Bonita|Barra Velha|Bela Vista do Toldo|Belmonte|Benedito Novo|Biguaçu|Blumenau|Bocaina do Sul|Bom Jardim da Serra|Bom Jesus|Bom Jesus do Oeste|Bom Retiro|Bombinhas|Botuverá|Braço do Norte|Braço do Trombudo|Brunópolis|Brusque|Caçador|Caibi|Calmon|Camboriú|Campo Alegre|Campo Belo do Sul|Campo Erê|Campos Novos|Canelinha|Canoinhas|Capão Alto|Capinzal|Capivari de Baixo|Catanduvas|Caxambu do Sul|Celso Ramos|Cerro Negro|Chapadão do Lageado|Chapecó|Cocal do Sul|Concórdia|Cordilheira Alta|Coronel Freitas|Coronel Martins|Correia Pinto|Corupá|Criciúma|Cunha Porã|Cunhataí|Curitibanos|Descanso|Dionísio Cerqueira|Dona Emma|Doutor Pedrinho|Entre Rios|Ermo|Erval Velho|Faxinal dos Guedes|Flor do Sertão|Florianópolis|Formosa do Sul|Forquilhinha|Fraiburgo|Frei Rogério|Galvão|Garopaba|Garuva|Gaspar|Governador Celso Ramos|Grão-Pará|Gravatal|Guabiruba|Guaraciaba|Guaramirim|Guarujá do Sul|Guatambu|Herval d'Oeste|Ibiam|Ibicaré|Ibirama|Içara|Ilhota|Imaruí|Imbituba|Imbuia|Indaial|Iomerê|Ipira|Iporã do Oeste|Ipuaçu|Ipumirim|Iraceminha|Irani|Irati|Irineópolis|Itá|Itaiópolis|Itajaí|Itapema|Itapiranga|Itapoá|Ituporanga|Jaborá|Jacinto Machado|Jaguaruna|Jaraguá do Sul|Jardinópolis|Joaçaba|Joinville|José Boiteux|Jupiá|Lacerdópolis|Lages|Laguna|Lajeado Grande|Laurentino|Lauro Müller|Lebon Régis|Leoberto Leal|Lindóia do Sul|Lontras|Luiz Alves|Luzerna|Macieira|Mafra|Major Gercino|Major Vieira|Maracajá|Maravilha|Marema|Massaranduba|Matos Costa|Meleiro|Mirim Doce|Modelo|Mondaí|Monte Carlo|Monte Castelo|Morro da Fumaça|Morro Grande|Navegantes|Nova Erechim|Nova Itaberaba|Nova Trento|Nova Veneza|Novo Horizonte|Orleans|Otacílio Costa|Ouro|Ouro Verde|Paial|Painel|Palhoça|Palma Sola|Palmeira|Palmitos|Papanduva|Paraíso|Passo de Torres|Passos Maia|Paulo Lopes|Pedras Grandes|Penha|Peritiba|Pescaria Brava|Petrolândia|Pinhalzinho|Pinheiro Preto|Piratuba|Planalto Alegre|Pomerode|Ponte Alta|Ponte Alta do Norte|Ponte Serrada|Porto Belo|Porto União|Pouso Redondo|Praia Grande|Presidente Castello Branco|Presidente Getúlio|Presidente Nereu|Princesa|Quilombo|Rancho Queimado|Rio das Antas|Rio do Campo|Rio do Oeste|Rio do Sul|Rio dos Cedros|Rio Fortuna|Rio Negrinho|Rio Rufino|Riqueza|Rodeio|Romelândia|Salete|Saltinho|Salto Veloso|Sangão|Santa Cecília|Santa Helena|Santa Rosa de Lima|Santa Rosa do Sul|Santa Terezinha|Santa Terezinha do Progresso|Santiago do Sul|Santo Amaro da Imperatriz|São Bento do Sul|São Bernardino|São Bonifácio|São Carlos|São Cristóvão do Sul|São Domingos|São Francisco do Sul|São João Batista|São João do Itaperiú|São João do Oeste|São João do Sul|São Joaquim|São José|São José do Cedro|São José do Cerrito|São Lourenço do Oeste|São Ludgero|São Martinho|São Miguel da Boa Vista|São Miguel do Oeste|São Pedro de Alcântara|Saudades|Schroeder|Seara|Serra Alta|Siderópolis|Sombrio|Sul Brasil|Taió|Tangará|Tigrinhos|Tijucas|Timbé do Sul|Timbó|Timbó Grande|Três Barras|Treviso|Treze de Maio|Treze Tílias|Trombudo Central|Tubarão|Tunápolis|Turvo|União do Oeste|Urubici|Urupema|Urussanga|Vargeão|Vargem|Vargem Bonita|Vidal Ramos|Videira|Vitor Meireles|Witmarsum|Xanxerê|Xavantina|Xaxim|Zortéa)$""",
+    "modalidade": r"""- Modalidade [enum] ^(Concorrência|Concurso|Convite|Credenciamento|Diálogo Competitivo|Dispensa de Licitação|Inexigibilidade|Leilão|Regime Diferenciado de Contratações|Pregão|Tomada de Preços)$""",
+    "formato_da_modalidade": r"""- Formato da modalidade [enum|null] ^(Presencial|Eletrônico)$""",
+    "numero_da_modalidade": r"""- Número da modalidade [string] ^\d+/\d+$""",
+    "objeto": r"""- Descrição do Objeto [string] ^.+$""",
+    "data_de_abertura": r"""- Data de abertura [string|null] \d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}$""",
+    "site_do_edital": r"""- Site do edital [string|null] ^(https?:\/\/|www\.)[^\s]+$""",
+    "signatario": r"""- Nome do Signatário [string|null] ^.+$""",
+    "cargo_do_signatario": r"""- Cargo do signatário [string|null] ^.+$""",
+}
+
+TEMPLATE = """
 Você é um especialista em licitação brasileira.
 
 Extraia as seguintes entidades do documento de licitação no # Contexto
-- Tipo do documento [enum] ^(Apostilamento|Anulação|Ata de Registro de Preços|Ata de Recebimento e Abertura|Adjucação|Aviso de Licitação|Aviso de Suspensão|Aviso de Cancelamento|Contrato|Edital|Errata|Homologação|Aditivo|Julgamento|Resultado|Ratificação)$
-- Número do processo administrativo [string] ^\d+/\d+$
-- Município [enum] ^(Abdon Batista|Abelardo Luz|Agrolândia|Agronômica|Água Doce|Águas de Chapecó|Águas Frias|Águas Mornas|Alfredo Wagner|Alto Bela Vista|Anchieta|Angelina|Anita Garibaldi|Anitápolis|Antônio Carlos|Apiúna|Arabutã|Araquari|Araranguá|Armazém|Arroio Trinta|Arvoredo|Ascurra|Atalanta|Aurora|Balneário Arroio do Silva|Balneário Barra do Sul|Balneário Camboriú|Balneário Gaivota|Balneário Piçarras|Balneário Rincão|Bandeirante|Barra Bonita|Barra Velha|Bela Vista do Toldo|Belmonte|Benedito Novo|Biguaçu|Blumenau|Bocaina do Sul|Bom Jardim da Serra|Bom Jesus|Bom Jesus do Oeste|Bom Retiro|Bombinhas|Botuverá|Braço do Norte|Braço do Trombudo|Brunópolis|Brusque|Caçador|Caibi|Calmon|Camboriú|Campo Alegre|Campo Belo do Sul|Campo Erê|Campos Novos|Canelinha|Canoinhas|Capão Alto|Capinzal|Capivari de Baixo|Catanduvas|Caxambu do Sul|Celso Ramos|Cerro Negro|Chapadão do Lageado|Chapecó|Cocal do Sul|Concórdia|Cordilheira Alta|Coronel Freitas|Coronel Martins|Correia Pinto|Corupá|Criciúma|Cunha Porã|Cunhataí|Curitibanos|Descanso|Dionísio Cerqueira|Dona Emma|Doutor Pedrinho|Entre Rios|Ermo|Erval Velho|Faxinal dos Guedes|Flor do Sertão|Florianópolis|Formosa do Sul|Forquilhinha|Fraiburgo|Frei Rogério|Galvão|Garopaba|Garuva|Gaspar|Governador Celso Ramos|Grão-Pará|Gravatal|Guabiruba|Guaraciaba|Guaramirim|Guarujá do Sul|Guatambu|Herval d'Oeste|Ibiam|Ibicaré|Ibirama|Içara|Ilhota|Imaruí|Imbituba|Imbuia|Indaial|Iomerê|Ipira|Iporã do Oeste|Ipuaçu|Ipumirim|Iraceminha|Irani|Irati|Irineópolis|Itá|Itaiópolis|Itajaí|Itapema|Itapiranga|Itapoá|Ituporanga|Jaborá|Jacinto Machado|Jaguaruna|Jaraguá do Sul|Jardinópolis|Joaçaba|Joinville|José Boiteux|Jupiá|Lacerdópolis|Lages|Laguna|Lajeado Grande|Laurentino|Lauro Müller|Lebon Régis|Leoberto Leal|Lindóia do Sul|Lontras|Luiz Alves|Luzerna|Macieira|Mafra|Major Gercino|Major Vieira|Maracajá|Maravilha|Marema|Massaranduba|Matos Costa|Meleiro|Mirim Doce|Modelo|Mondaí|Monte Carlo|Monte Castelo|Morro da Fumaça|Morro Grande|Navegantes|Nova Erechim|Nova Itaberaba|Nova Trento|Nova Veneza|Novo Horizonte|Orleans|Otacílio Costa|Ouro|Ouro Verde|Paial|Painel|Palhoça|Palma Sola|Palmeira|Palmitos|Papanduva|Paraíso|Passo de Torres|Passos Maia|Paulo Lopes|Pedras Grandes|Penha|Peritiba|Pescaria Brava|Petrolândia|Pinhalzinho|Pinheiro Preto|Piratuba|Planalto Alegre|Pomerode|Ponte Alta|Ponte Alta do Norte|Ponte Serrada|Porto Belo|Porto União|Pouso Redondo|Praia Grande|Presidente Castello Branco|Presidente Getúlio|Presidente Nereu|Princesa|Quilombo|Rancho Queimado|Rio das Antas|Rio do Campo|Rio do Oeste|Rio do Sul|Rio dos Cedros|Rio Fortuna|Rio Negrinho|Rio Rufino|Riqueza|Rodeio|Romelândia|Salete|Saltinho|Salto Veloso|Sangão|Santa Cecília|Santa Helena|Santa Rosa de Lima|Santa Rosa do Sul|Santa Terezinha|Santa Terezinha do Progresso|Santiago do Sul|Santo Amaro da Imperatriz|São Bento do Sul|São Bernardino|São Bonifácio|São Carlos|São Cristóvão do Sul|São Domingos|São Francisco do Sul|São João Batista|São João do Itaperiú|São João do Oeste|São João do Sul|São Joaquim|São José|São José do Cedro|São José do Cerrito|São Lourenço do Oeste|São Ludgero|São Martinho|São Miguel da Boa Vista|São Miguel do Oeste|São Pedro de Alcântara|Saudades|Schroeder|Seara|Serra Alta|Siderópolis|Sombrio|Sul Brasil|Taió|Tangará|Tigrinhos|Tijucas|Timbé do Sul|Timbó|Timbó Grande|Três Barras|Treviso|Treze de Maio|Treze Tílias|Trombudo Central|Tubarão|Tunápolis|Turvo|União do Oeste|Urubici|Urupema|Urussanga|Vargeão|Vargem|Vargem Bonita|Vidal Ramos|Videira|Vitor Meireles|Witmarsum|Xanxerê|Xavantina|Xaxim|Zortéa)$
-- Modalidade [enum] ^(Concorrência|Concurso|Convite|Credenciamento|Diálogo Competitivo|Dispensa de Licitação|Inexigibilidade|Leilão|Regime Diferenciado de Contratações|Pregão|Tomada de Preços)$
-- Formato da modalidade [enum|null] ^(Presencial|Eletrônico)$
-- Número da modalidade [string] ^\d+/\d+$
-- Descrição do Objeto [string] ^.+$
-- Data de abertura [string|null] \d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}$
-- Site do edital [string|null] ^(https?:\/\/|www\.)[^\s]+$
-- Nome do Signatário [string|null] ^.+$
-- Cargo do signatário [string|null] ^.+$
+{ENTIDADES}
 
 # Regras
 - Sem inferência: extraia apenas informações explícitas. Não deduza, interprete ou complete.
@@ -71,3 +75,64 @@ Retorne no formato JSON.
 
 {CONTEXTO}
 """
+
+
+def build_prompt(fields) -> str:
+    """
+    Builds the extraction prompt asking only for the given fields.
+
+    Args:
+        fields: Names of the Licitacao fields to be extracted.
+
+    Returns:
+        The prompt with the {CONTEXTO} placeholder still to be filled.
+    """
+    return TEMPLATE.replace(
+        "{ENTIDADES}", "\n".join(ENTIDADES[field] for field in fields)
+    )
+
+
+BATCH_RULES = """# Vários documentos
+O # Contexto traz vários documentos, cada um identificado pelo seu código.
+- Extraia as entidades de cada documento separadamente, sem misturar informações entre eles.
+- Retorne um objeto JSON com a lista "licitacoes", com um item por documento, na mesma ordem do # Contexto.
+- Cada item deve trazer o "codigo" do documento de onde as entidades foram extraídas.
+"""
+
+
+def build_batch_prompt(fields) -> str:
+    """
+    Builds the prompt for extracting the given fields of several documents
+    in a single request.
+
+    Args:
+        fields: Names of the Licitacao fields to be extracted.
+
+    Returns:
+        The prompt with the {CONTEXTO} placeholder still to be filled.
+    """
+    return build_prompt(fields).replace("{CONTEXTO}", BATCH_RULES + "\n{CONTEXTO}")
+
+
+DIFF_RULES = """# Documento semelhante
+O documento do # Contexto é quase idêntico a um documento já extraído. O # Contexto traz as entidades do documento semelhante e apenas as linhas que mudaram: linhas iniciadas por "-" foram removidas e linhas iniciadas por "+" foram adicionadas.
+- Mantenha as entidades que não foram afetadas pelas linhas alteradas.
+- Corrija apenas as entidades afetadas pelas linhas alteradas.
+"""
+
+
+def build_diff_prompt(fields) -> str:
+    """
+    Builds the prompt for updating the fields of a near duplicate from the
+    lines that changed.
+
+    Args:
+        fields: Names of the Licitacao fields to be extracted.
+
+    Returns:
+        The prompt with the {CONTEXTO} placeholder still to be filled.
+    """
+    return build_prompt(fields).replace("{CONTEXTO}", DIFF_RULES + "\n{CONTEXTO}")
+
+
+PROMPT = build_prompt(ENTIDADES)
@@ -0,0 +1,124 @@
+import itertools
+import json
+import pathlib
+import re
+import sys
+from typing import Any, Dict, Iterator, Optional, TextIO, Tuple, Union
+
+import config
+import models
+import records
+
+_DECODER = json.JSONDecoder()
+_SEPARATORS = re.compile(r"[\s,]*")
+_CHUNK_SIZE = 1 << 16
+
+
+def iter_sources(path: pathlib.Path) -> Iterator[Tuple[str, TextIO]]:
+    """
+    Yields the input streams to be processed, one per input file.
+
+    Args:
+        path: Directory with the input files, or "-" to read from stdin.
+
+    Returns:
+        An iterator of (name, stream) pairs, where name is used for the output file.
+    """
+    if str(path) == "-":
+        yield "stdin", sys.stdin
+        return
+
+    for file in sorted(path.iterdir()):
+        if not file.is_file():
+            continue
+        with file.open(encoding="utf-8") as stream:
+            yield file.stem, stream
+
+
+def iter_records(
+    stream: TextIO, chunk_size: int = _CHUNK_SIZE
+) -> Iterator[Dict[str, Any]]:
+    """
+    Incrementally decodes the records of a JSON array or of a JSON Lines stream.
+
+    Only the record being decoded is kept in memory, so the memory used does not
+    depend on the size of the stream.
+
+    Args:
+        stream: A text stream holding a JSON array of objects or one object per line.
+        chunk_size: Number of characters read from the stream at a time.
+
+    Returns:
+        An iterator over the decoded records.
+    """
+    buffer = ""
+    position = 0
+    read_size = chunk_size
+    is_array = None
+    eof = False
+
+    while True:
+        position = _SEPARATORS.match(buffer, position).end()
+        if position == len(buffer):
+            if eof:
+                break
+            buffer = stream.read(read_size)
+            position = 0
+            eof = not buffer
+            continue
+
+        if is_array is None:
+            is_array = buffer[position] == "["
+            if is_array:
+                position += 1
+                continue
+
+        if is_array and buffer[position] == "]":
+            return
+
+        try:
+            record, position = _DECODER.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # The record continues past the buffer. Grow the read so that very
+            # large records are not re-decoded once per chunk.
+            more = stream.read(read_size)
+            eof = not more
+            buffer = buffer[position:] + more
+            position = 0
+            read_size *= 2
+            continue
+
+        read_size = chunk_size
+        yield record
+
+    if is_array:
+        raise json.JSONDecodeError("Unterminated JSON array", buffer, position)
+
+
+def iter_publications(
+    stream: TextIO, shard: Optional[Tuple[int, int]] = None
+) -> Iterator[Union[models.RawPublication, records.Publication]]:
+    """
+    Yields the publications of an input stream one at a time.
+
+    Args:
+        stream: A text stream holding a JSON array or JSON Lines of publications.
+        shard: Optional (index, count) pair. Only every count-th record,
+            starting at index, is yielded.
+
+    Returns:
+        An iterator of RawPublication objects with unescaped texto, or of
+        records.Publication objects with FAST_RECORDS.
+    """
+    items = iter_records(stream)
+    if shard is not None:
+        items = itertools.islice(items, shard[0], None, shard[1])
+    for item in items:
+        if config.FAST_RECORDS:
+            yield records.decode_publication(item)
+        else:
+            yield models.RawPublication(
+                **{**item, "texto": records.unescape(item["texto"])}
+            )
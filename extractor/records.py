@@ -0,0 +1,94 @@
+import dataclasses
+import functools
+import html
+import json
+import re
+from typing import Any, Dict, Optional
+
+import models
+
+
+class ValidationError(ValueError):
+    """Raised when a record does not satisfy its model."""
+
+
+@dataclasses.dataclass(slots=True)
+class Publication:
+    """
+    Slotted counterpart of models.RawPublication, with the same fields.
+    """
+
+    codigo: str
+    titulo: str
+    data: str
+    entidade: str
+    categoria: str
+    link: str
+    texto: str
+    url: str
+    cod_registro_info_sfinge: Optional[str] = None
+    municipio: Optional[str] = None
+
+
+# The character references recognized by html.unescape.
+_CHARREF = re.compile(r"&(#[0-9]+;?|#[xX][0-9a-fA-F]+;?|[^\t\n\f <&#;]{1,32};?)")
+# A few dozen distinct references make up nearly all of the input, so each
+# is resolved by html.unescape once.
+_resolve = functools.lru_cache(maxsize=4096)(html.unescape)
+
+
+def unescape(text: str) -> str:
+    """
+    Equivalent to html.unescape, caching the replacement of every reference.
+    """
+    if "&" not in text:
+        return text
+    return _CHARREF.sub(lambda match: _resolve(match[0]), text)
+
+
+_PUBLICATION_FIELDS = [
+    (name, field.is_required())
+    for name, field in models.RawPublication.model_fields.items()
+]
+
+
+def decode_publication(
+    item: Dict[str, Any], unescape_texto: bool = True
+) -> Publication:
+    """
+    Builds a Publication from a decoded input record.
+
+    Accepts and rejects the same records as `RawPublication(**item)`: every
+    field must be a string, the optional ones may be null or absent, and
+    unknown keys are ignored. The texto is HTML-unescaped.
+
+    Args:
+        item: A record of the input.
+        unescape_texto: False for a record whose texto was already
+            unescaped, such as one stored with dump_publication.
+
+    Returns:
+        The Publication.
+    """
+    values = {}
+    for name, required in _PUBLICATION_FIELDS:
+        value = item.get(name)
+        if value is None:
+            if required:
+                raise ValidationError(f"{name}: field required")
+        elif not isinstance(value, str):
+            raise ValidationError(f"{name}: input should be a valid string")
+        values[name] = value
+    if unescape_texto:
+        values["texto"] = unescape(values["texto"])
+    return Publication(**values)
+
+
+def dump_publication(publication) -> str:
+    """
+    Encodes a Publication or a RawPublication as a JSON object.
+    """
+    return json.dumps(
+        {name: getattr(publication, name) for name, _ in _PUBLICATION_FIELDS},
+        ensure_ascii=False,
+    )
@@ -0,0 +1,166 @@
+import json
+import re
+from typing import Any, Callable, Dict, NamedTuple, Set, Tuple
+
+import pydantic
+
+import models
+import municipios
+import rules
+import window
+
+# Free text may be reworded by the LLM, so objeto and cargo only need this
+# share of their words in the text. Names must be found whole.
+_MIN_SHARED_WORDS = 0.5
+# Shorter words are articles and prepositions, found in any text.
+_MIN_WORD_CHARS = 3
+
+# Lines where each field is usually found, kept first in the text sent with a
+# re-extraction. Fields without a pattern rely on the head and tail kept by
+# window.fit.
+_FOCUS = {
+    "numero_do_processo_licitatorio": r"processo|\bproc\b|\d+/\d{2,4}",
+    "municipio": r"munic[ií]pio|prefeitura",
+    "modalidade": r"modalidade|preg[aã]o|dispensa|inexigibilidade|concorr[eê]ncia|"
+    r"tomada de pre[cç]os|convite|leil[aã]o|credenciamento",
+    "formato_da_modalidade": r"eletr[oô]nic|presencial",
+    "numero_da_modalidade": r"modalidade|preg[aã]o|dispensa|inexigibilidade|"
+    r"concorr[eê]ncia|tomada de pre[cç]os|convite|leil[aã]o|\d+/\d{2,4}",
+    "objeto": r"objeto",
+    "data_de_abertura": r"abertura|sess[aã]o|\d{1,2}/\d{1,2}/\d{4}",
+    "site_do_edital": r"https?://|www\.|edital",
+    "signatario": r"prefeit|secret[aá]ri|president|pregoeir|diretor",
+    "cargo_do_signatario": r"prefeit|secret[aá]ri|president|pregoeir|diretor",
+}
+
+
+class Checked(NamedTuple):
+    # The fields of the answer that pass the Licitacao constraints.
+    valid: Dict[str, Any]
+    # The fields missing from the answer or invalid.
+    invalid: Tuple[str, ...]
+    # The valid fields whose value is not found in the text.
+    ungrounded: Tuple[str, ...]
+
+    def failing(self, fields: Tuple[str, ...]) -> Tuple[str, ...]:
+        """Returns the invalid and ungrounded fields, in the order of fields."""
+        return tuple(f for f in fields if f in self.invalid or f in self.ungrounded)
+
+
+def _words(text: str) -> Set[str]:
+    return {word for word in text.split() if len(word) >= _MIN_WORD_CHARS}
+
+
+def _numero(value: str, text: str, words: Set[str]) -> bool:
+    numero, ano = value.split("/")
+    anos = {ano, ano[-2:]} if len(ano) == 4 else {ano, f"20{ano}"}
+    # An entity code may sit between the number and the year, as in 68/PMLM/2023.
+    pattern = rf"\b0*{int(numero)} (?:[a-z]{{2,10}} )?(?:{'|'.join(anos)})\b"
+    return re.search(pattern, text) is not None
+
+
+def _data(value: str, text: str, words: Set[str]) -> bool:
+    ano, mes, dia = value[:10].split("-")
+    mes_extenso = municipios.normalize(rules.MESES[int(mes) - 1])
+    pattern = rf"\b0?{int(dia)} (?:0?{int(mes)}|de {mes_extenso} de) {ano}\b"
+    return re.search(pattern, text) is not None
+
+
+def _site(value: str, text: str, words: Set[str]) -> bool:
+    site = re.sub(r"^https? ", "", municipios.normalize(value))
+    return f" {site} " in f" {text} "
+
+
+def _name(value: str, text: str, words: Set[str]) -> bool:
+    return _words(municipios.normalize(value)) <= words
+
+
+def _reworded(value: str, text: str, words: Set[str]) -> bool:
+    value_words = _words(municipios.normalize(value))
+    shared = len(value_words & words)
+    return shared >= _MIN_SHARED_WORDS * len(value_words)
+
+
+# The enums are inferred from the text rather than copied, so they are not
+# checked.
+_GROUNDING: Dict[str, Callable[[str, str, Set[str]], bool]] = {
+    "numero_do_processo_licitatorio": _numero,
+    "numero_da_modalidade": _numero,
+    "objeto": _reworded,
+    "data_de_abertura": _data,
+    "site_do_edital": _site,
+    "signatario": _name,
+    "cargo_do_signatario": _reworded,
+}
+
+
+def check(content: str, fields: Tuple[str, ...], text: str) -> Checked:
+    """
+    Validates an answer field by field and looks for the copied values in
+    the text.
+
+    Args:
+        content: The JSON returned by the LLM.
+        fields: The fields asked for.
+        text: The titulo and text sent to the LLM.
+
+    Returns:
+        The valid fields, the invalid ones and the ungrounded ones.
+    """
+    try:
+        data = json.loads(content)
+    except json.JSONDecodeError:
+        data = None
+    if not isinstance(data, dict):
+        return Checked({}, fields, ())
+
+    values = {field: data[field] for field in fields if field in data}
+    errors = set()
+    try:
+        models.partial_model(tuple(values)).model_validate_json(
+            json.dumps(values), strict=True
+        )
+    except pydantic.ValidationError as e:
+        errors = {error["loc"][0] for error in e.errors()}
+    valid = {field: value for field, value in values.items() if field not in errors}
+
+    normalized = municipios.normalize(text)
+    words = _words(normalized)
+    ungrounded = tuple(
+        field
+        for field, value in valid.items()
+        if isinstance(value, str)
+        and field in _GROUNDING
+        and not _GROUNDING[field](value, normalized, words)
+    )
+    return Checked(valid, tuple(f for f in fields if f not in valid), ungrounded)
+
+
+def focus(text: str, fields: Tuple[str, ...], budget: int) -> str:
+    """
+    Fits a text into a budget, keeping first the lines relevant to the given
+    fields.
+    """
+    patterns = [_FOCUS[field] for field in fields if field in _FOCUS]
+    relevant = (
+        re.compile("|".join(patterns), re.IGNORECASE) if patterns else window.RELEVANT
+    )
+    return window.fit(text, budget, relevant=relevant).text
+
+
+def settle(checked: Checked) -> Dict[str, Any]:
+    """
+    Settles the answer to a re-extraction.
+
+    Nullable fields still invalid or ungrounded become null. Ungrounded
+    required fields are kept, as the text may spell them differently, and
+    invalid ones are left out, so the document is left without a result.
+
+    Returns:
+        The settled fields.
+    """
+    values = dict(checked.valid)
+    for field in checked.invalid + checked.ungrounded:
+        if field not in rules.REQUIRED_FIELDS:
+            values[field] = None
+    return values
@@ -0,0 +1,143 @@
+import collections
+import json
+import math
+import pathlib
+import re
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import models
+import municipios
+
+# Below this many words the cleaned text cannot hold a procurement act.
+_MIN_WORDS = 5
+_IMAGE = re.compile(r"<img\b", re.IGNORECASE)
+# Only the beginning of the text is classified, where the kind of act is named.
+_CLASSIFIED_WORDS = 300
+
+# Titulos naming a procurement act, matched on normalized text. Such
+# publications are always kept, whatever the classifier says.
+_PROCUREMENT = re.compile(
+    r"\b(licita\w*|pregao|dispensa|inexigibilidade|homologa\w*|adjudica\w*|"
+    r"edital|tomada de precos|concorrencia|chamada publica|chamamento publico|"
+    r"credenciamento|registro de precos|leilao|convite|ratifica\w*|"
+    r"aditivo|apostilamento|contrato|errata|julgamento)\b"
+)
+
+
+class Model(NamedTuple):
+    """
+    Multinomial naive Bayes over the words of the titulo and the beginning
+    of the text, with log-probabilities indexed by [irrelevant, relevant].
+    """
+
+    priors: Tuple[float, float]
+    unknown: Tuple[float, float]
+    words: Dict[str, Tuple[float, float]]
+
+    def score(self, titulo: str, body: str) -> float:
+        """
+        Returns:
+            The probability that the publication yields a Licitacao.
+        """
+        irrelevant, relevant = self.priors
+        for word in features(titulo, body):
+            first, second = self.words.get(word, self.unknown)
+            irrelevant += first
+            relevant += second
+        return 1 / (1 + math.exp(min(irrelevant - relevant, 700)))
+
+    def save(self, path: pathlib.Path) -> None:
+        path.write_text(json.dumps(self._asdict(), ensure_ascii=False))
+
+
+def load(path: pathlib.Path) -> Model:
+    data = json.loads(path.read_text(encoding="utf-8"))
+    return Model(
+        tuple(data["priors"]),
+        tuple(data["unknown"]),
+        {word: tuple(values) for word, values in data["words"].items()},
+    )
+
+
+def features(titulo: str, body: str) -> List[str]:
+    # Titulo words are told apart from text words, as they weigh more.
+    words = [f"t:{word}" for word in municipios.normalize(titulo).split()]
+    return words + municipios.normalize(body).split()[:_CLASSIFIED_WORDS]
+
+
+def train(examples: Iterable[Tuple[str, str, bool]]) -> Model:
+    """
+    Trains the classifier with Laplace smoothing.
+
+    Args:
+        examples: The titulo, cleaned text and relevance of each publication.
+
+    Returns:
+        The trained Model.
+    """
+    documents = [0, 0]
+    counts = [collections.Counter(), collections.Counter()]
+    for titulo, body, relevant in examples:
+        documents[relevant] += 1
+        counts[relevant].update(features(titulo, body))
+    if not all(documents):
+        raise ValueError("Training needs relevant and irrelevant publications")
+
+    vocabulary = counts[0].keys() | counts[1].keys()
+    totals = [sum(count.values()) + len(vocabulary) + 1 for count in counts]
+    priors = tuple(math.log(count / sum(documents)) for count in documents)
+    unknown = tuple(-math.log(total) for total in totals)
+    words = {
+        word: tuple(
+            math.log((count[word] + 1) / total) for count, total in zip(counts, totals)
+        )
+        for word in sorted(vocabulary)
+    }
+    return Model(priors, unknown, words)
+
+
+class Filter:
+    """
+    Tells the publications that cannot yield a Licitacao, so they are not
+    sent to the LLM, and counts them by reason.
+    """
+
+    def __init__(self, categorias: List[str], model: Optional[Model], threshold: float):
+        """
+        Args:
+            categorias: The DOM categorias of procurement acts. Empty accepts
+                every categoria.
+            model: The classifier for titulos that name no procurement act,
+                or None to keep them.
+            threshold: Minimum score of a kept publication.
+        """
+        self.categorias = set(categorias)
+        self.model = model
+        self.threshold = threshold
+        self.skipped: Dict[str, int] = collections.Counter()
+
+    def check(self, publication: models.RawPublication, body: str) -> Optional[str]:
+        """
+        Checks a publication before its extraction.
+
+        Args:
+            publication: The publication.
+            body: Its cleaned text.
+
+        Returns:
+            Why the publication is irrelevant, or None when it is relevant.
+        """
+        reason = None
+        if len(body.split()) < _MIN_WORDS:
+            reason = "image-only" if _IMAGE.search(publication.texto) else "empty"
+        elif self.categorias and publication.categoria not in self.categorias:
+            reason = f"categoria {publication.categoria!r}"
+        elif self.model is not None and not _PROCUREMENT.search(
+            municipios.normalize(publication.titulo)
+        ):
+            score = self.model.score(publication.titulo, body)
+            if score < self.threshold:
+                reason = f"classifier score {score:.2f}"
+        if reason is not None:
+            self.skipped[reason.split(" ")[0]] += 1
+        return reason
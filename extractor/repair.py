@@ -0,0 +1,188 @@
+import enum
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple, get_args
+
+import pydantic
+
+import models
+import municipios
+import rules
+
+_FENCE = re.compile(r"^```(?:json)?|```$")
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+# Values the LLM writes for a field it did not find.
+_NULLS = {"", "null", "none", "n a", "nao informado", "nao consta"}
+
+_NUMERO = re.compile(r"(\d+)\s*[/.\-]\s*(\d{4}|\d{2})\b")
+_NUMERO_FIELDS = ("numero_do_processo_licitatorio", "numero_da_modalidade")
+# ISO dates with seconds or a time zone, or a space instead of the "T".
+_ISO_DATA = re.compile(r"^(\d{4})-(\d{2})-(\d{2})[T ](\d{1,2}):(\d{2})")
+_DATA = re.compile(r"^(\d{1,2})/(\d{1,2})/(\d{4})\D+(\d{1,2})\s*[:hH]\s*(\d{2})")
+
+
+def _enum(annotation) -> Optional[type]:
+    for candidate in (annotation, *get_args(annotation)):
+        if isinstance(candidate, type) and issubclass(candidate, enum.Enum):
+            return candidate
+    return None
+
+
+# The values of every enum field by their normalized spelling, with the
+# longest first, so a longer name wins a prefix match.
+_ENUMS: Dict[str, Dict[str, str]] = {
+    field: {
+        municipios.normalize(member.value): member.value
+        for member in sorted(choices, key=lambda m: len(m.value), reverse=True)
+    }
+    for field, info in models.Licitacao.model_fields.items()
+    if (choices := _enum(info.annotation)) is not None
+}
+
+
+def loads(content: str) -> Tuple[Any, bool]:
+    """
+    Parses a JSON answer, tolerating code fences, text around the object and
+    trailing commas.
+
+    Returns:
+        The parsed answer and whether its syntax had to be repaired.
+
+    Raises:
+        json.JSONDecodeError: When the answer cannot be repaired.
+    """
+    try:
+        return json.loads(content), False
+    except json.JSONDecodeError:
+        pass
+    text = _FENCE.sub("", content.strip())
+    start, end = text.find("{"), text.rfind("}")
+    text = _TRAILING_COMMA.sub(r"\1", text[start : end + 1] if start >= 0 else text)
+    return json.loads(text), True
+
+
+def _enum_value(field: str, value: str) -> Optional[str]:
+    names = _ENUMS[field]
+    normalized = municipios.normalize(value)
+    if normalized in names:
+        return names[normalized]
+    # "Pregão Eletrônico" is a Pregão.
+    for name, choice in names.items():
+        if normalized.startswith(f"{name} "):
+            return choice
+    return None
+
+
+def _data(value: str) -> Optional[str]:
+    match = _ISO_DATA.match(value.strip())
+    if match is not None:
+        ano, mes, dia, hora, minuto = match.groups()
+    elif match := _DATA.match(value.strip()):
+        dia, mes, ano, hora, minuto = match.groups()
+    else:
+        return None
+    return f"{ano}-{int(mes):02d}-{int(dia):02d}T{int(hora):02d}:{minuto}"
+
+
+def _numero(value: str) -> Optional[str]:
+    numeros = {f"{a}/{b}" for a, b in _NUMERO.findall(value)}
+    return numeros.pop() if len(numeros) == 1 else None
+
+
+def coerce_value(field: str, value: Any) -> Any:
+    """
+    Coerces a value of a field as coerce does, returning it as it is when
+    there is nothing to coerce.
+    """
+    if not isinstance(value, str):
+        return value
+    if field not in rules.REQUIRED_FIELDS and municipios.normalize(value) in _NULLS:
+        return None
+    if field in _ENUMS:
+        return _enum_value(field, value) or value
+    if field == "data_de_abertura":
+        return _data(value) or value
+    if field in _NUMERO_FIELDS:
+        return _numero(value) or value
+    return value
+
+
+def _invalid(values: Dict[str, Any], fields: Tuple[str, ...]) -> List[str]:
+    try:
+        models.partial_model(fields).model_validate_json(
+            json.dumps(values), strict=True
+        )
+    except pydantic.ValidationError as e:
+        return [error["loc"][0] for error in e.errors() if error["loc"]]
+    return []
+
+
+def coerce(values: Dict[str, Any], fields: Tuple[str, ...]) -> List[str]:
+    """
+    Coerces the invalid fields of an answer in place: enum values spelled
+    without accents or with extra words, dates with seconds or in dd/mm/yyyy,
+    numbers with prefixes or other separators and null written as text.
+    Valid fields are left as they are.
+
+    Returns:
+        A description of every coercion.
+    """
+    coercions = []
+    for field in _invalid(values, fields):
+        if field not in values:
+            continue
+        coerced = coerce_value(field, values[field])
+        if coerced != values[field]:
+            coercions.append(f"{field}: {values[field]!r} -> {coerced!r}")
+            values[field] = coerced
+    return coercions
+
+
+def repair(content: str, fields: Tuple[str, ...]) -> Tuple[str, List[str]]:
+    """
+    Repairs an answer before its validation.
+
+    Args:
+        content: The JSON returned by the LLM.
+        fields: The fields asked for.
+
+    Returns:
+        The repaired JSON, the content itself when nothing was repaired or
+        it cannot be parsed, and a description of every repair.
+    """
+    try:
+        values, repaired = loads(content)
+    except json.JSONDecodeError:
+        return content, []
+    if not isinstance(values, dict):
+        return content, []
+    coercions = ["JSON syntax"] if repaired else []
+    coercions += coerce(values, fields)
+    if not coercions:
+        return content, []
+    return json.dumps(values, ensure_ascii=False), coercions
+
+
+def repair_batch(content: str, fields: Tuple[str, ...]) -> Tuple[str, List[str]]:
+    """
+    Repairs the answer to a batch, item by item.
+
+    Returns:
+        The repaired JSON and a description of every repair, prefixed by the
+        codigo of its item.
+    """
+    try:
+        answer, repaired = loads(content)
+    except json.JSONDecodeError:
+        return content, []
+    items = answer.get("licitacoes") if isinstance(answer, dict) else None
+    if not isinstance(items, list):
+        return content, []
+    coercions = ["JSON syntax"] if repaired else []
+    for item in items:
+        if isinstance(item, dict):
+            codigo = item.get("codigo")
+            coercions += [f"{codigo} {c}" for c in coerce(item, fields)]
+    if not coercions:
+        return content, []
+    return json.dumps(answer, ensure_ascii=False), coercions
@@ -0,0 +1,233 @@
+import re
+import types
+import unicodedata
+from typing import Any, Dict, List, Optional, Union, get_args, get_origin
+
+import models
+from pydantic import ValidationError
+
+# Strips accents while keeping every offset, so a match on the folded text
+# can be sliced from the original one.
+_FOLD = str.maketrans(
+    {
+        chr(code): unicodedata.normalize("NFD", chr(code))[0]
+        for code in range(0xC0, 0x180)
+    }
+)
+
+_NUMERO = r"(?:N\s*[º°o.]*\s*)?(?:[A-Z]{2,10}\s*)?(\d+)\s*[/.\-]\s*(\d{4}|\d{2})\b"
+
+_MODALIDADES = {
+    models.Modalidade.PREGAO: r"\bPREGAO\b|\bP[EP]\b",
+    models.Modalidade.DISPENSA_DE_LICITACAO: r"\bDISPENSA\b",
+    models.Modalidade.INEXIGIBILIDADE: r"\bINEXIGIBILIDADE\b|\bINEX\b",
+    models.Modalidade.TOMADA_DE_PRECOS: r"\bTOMADA DE PRECOS\b|\bTP\b",
+    models.Modalidade.CONCORRENCIA: r"\bCONCORRENCIA\b",
+    models.Modalidade.LEILAO: r"\bLEILAO\b",
+    models.Modalidade.CONVITE: r"\bCONVITE\b",
+    models.Modalidade.CONCURSO: r"\bCONCURSO\b",
+}
+_MODALIDADE_PATTERNS = {
+    modalidade: re.compile(pattern, re.IGNORECASE)
+    for modalidade, pattern in _MODALIDADES.items()
+}
+_NUMERO_DA_MODALIDADE_PATTERNS = {
+    modalidade: re.compile(
+        rf"(?:{pattern})(?:\s+(?:ELETRONIC[OA]|PRESENCIAL|DE LICITACAO|POR LIMITE))*\s*{_NUMERO}",
+        re.IGNORECASE,
+    )
+    for modalidade, pattern in _MODALIDADES.items()
+}
+
+_FORMATO_PATTERNS = {
+    models.FormatoDaModalidade.ELETRONICA: re.compile(
+        r"\bELETRONIC[OA]\b", re.IGNORECASE
+    ),
+    models.FormatoDaModalidade.PRESENCIAL: re.compile(r"\bPRESENCIAL\b", re.IGNORECASE),
+}
+
+_TIPO_DO_DOCUMENTO_PATTERNS = {
+    tipo: re.compile(pattern, re.IGNORECASE)
+    for tipo, pattern in {
+        models.TipoDoDocumento.TERMO_DE_HOMOLOGACAO: r"\bHOMOLOGA(?:CAO|DO)\b",
+        models.TipoDoDocumento.AVISO_DE_LICITACAO: r"\bAVISO DE LICITACAO\b",
+        models.TipoDoDocumento.ERRATA: r"\bERRATA\b",
+        models.TipoDoDocumento.TERMO_ADITIVO: r"\bADITIVO\b",
+        models.TipoDoDocumento.CONTRATO: r"\bCONTRATO\b",
+        models.TipoDoDocumento.ATA_DE_REGISTRO_DE_PRECOS: r"\bATA DE REGISTRO DE PRECOS\b|\bARP\b",
+        models.TipoDoDocumento.APOSTILAMENTO: r"\bAPOSTILAMENTO\b",
+        models.TipoDoDocumento.AVISO_DE_SUSPENSAO: r"\bSUSPENSAO\b",
+        models.TipoDoDocumento.AVISO_DE_CANCELAMENTO: r"\bCANCELAMENTO\b",
+        models.TipoDoDocumento.ANULACAO: r"\bANULACAO\b",
+        models.TipoDoDocumento.RATIFICACAO: r"\bRATIFICACAO\b",
+        models.TipoDoDocumento.JULGAMENTO: r"\bJULGAMENTO\b",
+        models.TipoDoDocumento.RESULTADO: r"\bRESULTADO\b",
+        models.TipoDoDocumento.ADJUCACAO: r"\bADJUDICACAO\b",
+        models.TipoDoDocumento.EDITAL: r"\bEDITAL\b",
+    }.items()
+}
+
+_NUMERO_DO_PROCESSO_PATTERN = re.compile(
+    rf"\b(?:PROCESSO(?:\s+(?:LICITATORIO|ADMINISTRATIVO))?|PROC\.?(?:\s+LIC)?|PL)\s*{_NUMERO}",
+    re.IGNORECASE,
+)
+_SITE_PATTERN = re.compile(r"(?:https?://|www\.)[^\s,;()]+", re.IGNORECASE)
+_SITE_CONTEXT_PATTERN = re.compile(r"\bEDITA", re.IGNORECASE)
+
+# fmt: off
+MESES = [
+    "JANEIRO", "FEVEREIRO", "MARCO", "ABRIL", "MAIO", "JUNHO",
+    "JULHO", "AGOSTO", "SETEMBRO", "OUTUBRO", "NOVEMBRO", "DEZEMBRO",
+]
+# fmt: on
+_ABERTURA_PATTERN = re.compile(r"\bABERTURA\b[^\n]*", re.IGNORECASE)
+_DATA_PATTERN = re.compile(
+    rf"\b(\d{{1,2}})(?:/(\d{{1,2}})/|\s+DE\s+({'|'.join(MESES)})\s+DE\s+)(\d{{4}})\b",
+    re.IGNORECASE,
+)
+_HORA_PATTERN = re.compile(r"\b(\d{1,2})\s*(?::|H)\s*(\d{2})\b", re.IGNORECASE)
+
+
+def _fold(text: str) -> str:
+    return text.translate(_FOLD)
+
+
+def _unique(values: List[Any]) -> Optional[Any]:
+    """Returns the value only when every match agrees on it."""
+    distinct = set(values)
+    if len(distinct) == 1:
+        return distinct.pop()
+    return None
+
+
+def _numero(match: re.Match) -> str:
+    return f"{match.group(1)}/{match.group(2)}"
+
+
+def _modalidade(titulo: str) -> Optional[models.Modalidade]:
+    return _unique(
+        [m for m, pattern in _MODALIDADE_PATTERNS.items() if pattern.search(titulo)]
+    )
+
+
+def _numero_da_modalidade(titulo: str, modalidade: models.Modalidade) -> Optional[str]:
+    pattern = _NUMERO_DA_MODALIDADE_PATTERNS[modalidade]
+    return _unique([_numero(match) for match in pattern.finditer(titulo)])
+
+
+def _formato_da_modalidade(titulo: str) -> Optional[models.FormatoDaModalidade]:
+    return _unique(
+        [f for f, pattern in _FORMATO_PATTERNS.items() if pattern.search(titulo)]
+    )
+
+
+def _tipo_do_documento(titulo: str) -> Optional[models.TipoDoDocumento]:
+    return _unique(
+        [
+            t
+            for t, pattern in _TIPO_DO_DOCUMENTO_PATTERNS.items()
+            if pattern.search(titulo)
+        ]
+    )
+
+
+def _numero_do_processo_licitatorio(titulo: str) -> Optional[str]:
+    return _unique(
+        [_numero(match) for match in _NUMERO_DO_PROCESSO_PATTERN.finditer(titulo)]
+    )
+
+
+def _site_do_edital(texto: str) -> Optional[str]:
+    # Documents usually cite both the municipality site and the bidding
+    # portal, so a site is only taken when it is the only one in the text.
+    sites = [site.rstrip(".") for site in _SITE_PATTERN.findall(texto)]
+    site = _unique([site.lower() for site in sites])
+    if site is None:
+        return None
+    cited_for_edital = any(
+        _SITE_CONTEXT_PATTERN.search(_fold(line)) and site in line.lower()
+        for line in texto.splitlines()
+    )
+    if not cited_for_edital:
+        return None
+    # Keeps the spelling used in the document.
+    return next(s for s in sites if s.lower() == site)
+
+
+def _data_de_abertura(texto: str) -> Optional[str]:
+    datas = []
+    for line in _ABERTURA_PATTERN.findall(_fold(texto)):
+        data = _DATA_PATTERN.search(line)
+        hora = _HORA_PATTERN.search(line)
+        if data is None or hora is None:
+            continue
+        dia, mes, mes_extenso, ano = data.groups()
+        if mes_extenso:
+            mes = MESES.index(mes_extenso.upper()) + 1
+        datas.append(
+            f"{ano}-{int(mes):02d}-{int(dia):02d}T{int(hora.group(1)):02d}:{hora.group(2)}"
+        )
+    return _unique(datas)
+
+
+def _is_nullable(field: str) -> bool:
+    annotation = models.Licitacao.model_fields[field].annotation
+    if get_origin(annotation) not in (Union, types.UnionType):
+        return False
+    return type(None) in get_args(annotation)
+
+
+REQUIRED_FIELDS = tuple(f for f in models.Licitacao.model_fields if not _is_nullable(f))
+
+
+def apply(publication: models.RawPublication, texto: str) -> Dict[str, Any]:
+    """
+    Fills the Licitacao fields that follow fixed patterns, without the LLM.
+
+    A field is only filled when every match in the document agrees on its
+    value, and values that do not pass the Licitacao constraints are dropped,
+    so an ambiguous field is always left to the LLM.
+
+    Args:
+        publication: The publication being extracted.
+        texto: The cleaned text of the publication.
+
+    Returns:
+        A dictionary with the fields that could be resolved.
+    """
+    titulo = _fold(publication.titulo)
+    fields = {
+        "tipo_do_documento": _tipo_do_documento(titulo),
+        "numero_do_processo_licitatorio": _numero_do_processo_licitatorio(titulo),
+        "modalidade": _modalidade(titulo),
+        "formato_da_modalidade": _formato_da_modalidade(titulo),
+        "data_de_abertura": _data_de_abertura(texto),
+        "site_do_edital": _site_do_edital(texto),
+    }
+    if fields["modalidade"] is not None:
+        fields["numero_da_modalidade"] = _numero_da_modalidade(
+            titulo, fields["modalidade"]
+        )
+    fields = {field: value for field, value in fields.items() if value is not None}
+    return valid_fields(fields)
+
+
+def valid_fields(fields: Dict[str, Any]) -> Dict[str, Any]:
+    """Drops the fields that do not pass the Licitacao constraints."""
+    model = models.partial_model(tuple(fields))
+    try:
+        model.model_validate(fields)
+    except ValidationError as e:
+        for error in e.errors():
+            fields.pop(error["loc"][0], None)
+    return fields
+
+
+def missing_fields(fields: Dict[str, Any]) -> tuple:
+    """Returns the Licitacao fields, in order, that are not in fields."""
+    return tuple(f for f in models.Licitacao.model_fields if f not in fields)
+
+
+def is_complete(fields: Dict[str, Any]) -> bool:
+    """Tells whether every non-nullable Licitacao field has been resolved."""
+    return all(field in fields for field in REQUIRED_FIELDS)
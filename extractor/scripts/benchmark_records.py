@@ -0,0 +1,105 @@
+import html
+import json
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import models  # noqa: E402
+import records  # noqa: E402
+
+data_path = (
+    Path(__file__).resolve().parents[2] / "experiments/resources/ground_truth_data.json"
+)
+copies = 200
+repeats = 5
+
+
+def legacy_decode(item):
+    # Previous path of reader.iter_publications, kept here as the reference.
+    return models.RawPublication(**{**item, "texto": html.unescape(item["texto"])})
+
+
+def model_decode(item):
+    return models.RawPublication(**{**item, "texto": records.unescape(item["texto"])})
+
+
+paths = {
+    "legacy RawPublication": legacy_decode,
+    "RawPublication": model_decode,
+    "records.Publication": records.decode_publication,
+}
+
+
+def load():
+    return json.loads(data_path.read_text(encoding="utf-8"))
+
+
+def outcome(function, item):
+    try:
+        return records.dump_publication(function(item))
+    except (ValueError, TypeError):
+        # pydantic and records raise ValueErrors; html.unescape a TypeError
+        # for a null texto.
+        return "rejected"
+
+
+def mismatches(documents):
+    count = 0
+    for item in documents:
+        for mutated in [
+            item,
+            {**item, "municipio": None},
+            {key: value for key, value in item.items() if key != "url"},
+            {**item, "titulo": 1},
+            {**item, "texto": None},
+            {**item, "extra": "ignored"},
+        ]:
+            count += (
+                len({outcome(function, mutated) for function in paths.values()}) > 1
+            )
+    return count
+
+
+def measure(function, documents):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        # The publications are kept, as the pipeline queues keep them.
+        kept = [function(item) for item in documents]
+        timings.append(time.perf_counter() - start)
+        del kept
+    return statistics.median(timings)
+
+
+def peak_rss(name):
+    # Every path runs in its own process. The peak of a process survives
+    # exec on Linux, so this runs before the documents are loaded here.
+    output = subprocess.run(
+        [sys.executable, __file__, name], capture_output=True, text=True, check=True
+    )
+    return int(output.stdout) / 1024
+
+
+if len(sys.argv) > 1:
+    documents = load() * copies
+    kept = [paths[sys.argv[1]](item) for item in documents]
+    print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+    sys.exit()
+
+peaks = {name: peak_rss(name) for name in paths}
+documents = load()
+print(f"Documents: {len(documents)} x {copies}")
+print(f"Inputs decoded differently by the paths: {mismatches(documents)}")
+
+documents *= copies
+for name, function in paths.items():
+    elapsed = measure(function, documents)
+    print(
+        f"{name:>22}: {len(documents) / elapsed:8.0f} records/s, "
+        f"peak RSS {peaks[name]:6.1f} MB"
+    )
@@ -0,0 +1,106 @@
+import csv
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import models  # noqa: E402
+import municipios  # noqa: E402
+import rules  # noqa: E402
+import templates  # noqa: E402
+import utils  # noqa: E402
+
+# Cross-validates the template wrappers on the ground truth: they are induced
+# from the gold results of the other folds, as if those were validated LLM
+# outputs, and compared with the gold results of the held-out fold.
+resources = Path(__file__).resolve().parents[2] / "experiments/resources"
+gold_columns = {
+    "tipo_do_documento": "Tipo de Documento",
+    "numero_do_processo_licitatorio": "NrProLicitatório",
+    "municipio": "Município",
+    "modalidade": "Modalidade",
+    "formato_da_modalidade": "Formato",
+    "numero_da_modalidade": "NrModalidade",
+    "objeto": "Objeto",
+    "data_de_abertura": "Data Abertura Normalizada",
+    "site_do_edital": "Informacoes",
+    "signatario": "Signatário",
+    "cargo_do_signatario": "Cargo do Signatário",
+}
+folds = 5
+similarity_threshold = float(sys.argv[1]) if len(sys.argv) > 1 else 0.5
+min_support = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+min_confidence = float(sys.argv[3]) if len(sys.argv) > 3 else 0.9
+
+
+def gold_results():
+    with (resources / "ground_truth_gold.csv").open(encoding="utf-8") as stream:
+        for row in csv.DictReader(stream):
+            yield (
+                row["Código"],
+                {
+                    field: None if row[column] == "NULL" else row[column]
+                    for field, column in gold_columns.items()
+                },
+            )
+
+
+gold = dict(gold_results())
+publications = json.loads(
+    (resources / "ground_truth_data.json").read_text(encoding="utf-8")
+)
+examples = [
+    (
+        models.RawPublication(**publication),
+        publication["titulo"],
+        utils.clean_html_text(publication["texto"]),
+        gold[publication["codigo"]],
+    )
+    for publication in publications
+    if publication["codigo"] in gold
+]
+
+matched = bypassed = combined_bypassed = 0
+filled = {field: 0 for field in models.Licitacao.model_fields}
+correct = dict(filled)
+for fold in range(folds):
+    training = [
+        (titulo, text, result)
+        for i, (_, titulo, text, result) in enumerate(examples)
+        if i % folds != fold
+    ]
+    wrappers = templates.Wrappers(
+        templates.induce(training, similarity_threshold, min_support),
+        similarity_threshold,
+        min_confidence,
+    )
+    for publication, titulo, text, result in examples[fold::folds]:
+        template, fields = wrappers.extract(titulo, text)
+        matched += template >= 0
+        bypassed += rules.is_complete(fields)
+        # With USE_RULES and RESOLVE_MUNICIPIO, which run alongside.
+        combined = {**fields, **rules.apply(publication, text)}
+        if (municipio := municipios.resolve(publication, text)) is not None:
+            combined["municipio"] = municipio
+        combined_bypassed += rules.is_complete(combined)
+        for field, value in fields.items():
+            filled[field] += 1
+            expected = result[field]
+            correct[field] += expected is not None and municipios.normalize(
+                str(value)
+            ) == municipios.normalize(expected)
+
+total = len(examples)
+print(f"Documents: {total}, with a matching template: {matched}")
+print(f"Resolved without the LLM: {bypassed} (LLM hit rate {1 - bypassed / total:.0%})")
+print(
+    f"Resolved without the LLM with rules and municipio resolution: "
+    f"{combined_bypassed} (LLM hit rate {1 - combined_bypassed / total:.0%})"
+)
+for field in models.Licitacao.model_fields:
+    if filled[field]:
+        print(
+            f"{field:>31}: filled {filled[field]:3}, "
+            f"correct {correct[field] / filled[field]:.0%}"
+        )
@@ -0,0 +1,41 @@
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import config  # noqa: E402
+import reader  # noqa: E402
+import templates  # noqa: E402
+import utils  # noqa: E402
+
+# The validated results in the JSON outputs of OUTPUT_PATH are the examples
+# of the publications of INPUT_PATH. A template needs min_support of them.
+templates_path = Path(sys.argv[1]) if len(sys.argv) > 1 else Path("templates.json")
+min_support = 5
+
+
+def examples():
+    for name, stream in reader.iter_sources(config.INPUT_PATH):
+        output_path = config.OUTPUT_PATH / f"{name}.json"
+        if not output_path.exists():
+            print(f"Skipping {name}, which has no JSON output")
+            continue
+        results = json.loads(output_path.read_text(encoding="utf-8"))
+        for publication in reader.iter_publications(stream):
+            result = results.get(publication.codigo)
+            if result is not None:
+                text = utils.clean_html_text(publication.texto)
+                yield publication.titulo, text, result
+
+
+induced = templates.induce(examples(), config.TEMPLATE_SIMILARITY, min_support)
+templates.save(templates_path, induced)
+print(f"Wrote {len(induced)} templates to {templates_path}")
+for i, template in enumerate(induced):
+    confident = [
+        field
+        for field, rule in template.rules.items()
+        if rule.confidence >= config.TEMPLATE_MIN_CONFIDENCE
+    ]
+    print(f"Template {i} ({template.examples} examples): {confident}")
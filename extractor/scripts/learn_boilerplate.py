@@ -0,0 +1,34 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import compress  # noqa: E402
+import config  # noqa: E402
+import reader  # noqa: E402
+import utils  # noqa: E402
+import window  # noqa: E402
+
+# A line is boilerplate when it is found in at least min_share of the
+# publications of INPUT_PATH, and in no fewer than min_documents of them.
+boilerplate_path = Path(sys.argv[1]) if len(sys.argv) > 1 else Path("boilerplate.json")
+min_share = 0.05
+min_documents = 5
+
+
+def cleaned_texts():
+    for _, stream in reader.iter_sources(config.INPUT_PATH):
+        for publication in reader.iter_publications(stream):
+            yield utils.clean_html_text(publication.texto)
+
+
+boilerplate = compress.learn(cleaned_texts(), min_share, min_documents)
+compress.save(boilerplate_path, boilerplate)
+print(f"Wrote {len(boilerplate)} boilerplate lines to {boilerplate_path}")
+
+compressor = compress.Compressor(boilerplate, collapse_item_tables=True)
+tokens = saved = 0
+for text in cleaned_texts():
+    tokens += window.count_tokens(text)
+    saved += compressor.compress(text).tokens_saved
+print(f"Estimated tokens saved with item tables collapsed: {saved} of {tokens}")
@@ -0,0 +1,163 @@
+import datetime
+import http.server
+import itertools
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import config  # noqa: E402
+
+# A local LLM server for running the extractor offline, with both the Ollama
+# API (point OLLAMA_HOSTS at http://localhost:<port>) and the OpenAI chat
+# completions API (set BACKEND = "openai" and OPENAI_HOSTS to
+# http://localhost:<port>/v1). Every answer is the first value that the
+# requested JSON schema allows, streamed a few characters at a time, waiting
+# token_seconds before each piece. Arrays are left empty, so batches fall back
+# to single documents.
+port = int(sys.argv[1]) if len(sys.argv) > 1 else 11434
+token_seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+served = [config.MODEL]
+piece_chars = 4
+
+# Values tried, in order, for strings with a pattern.
+_PATTERN_EXAMPLES = ["1/2024", "2024-01-01T09:00"]
+
+
+def example(schema, defs):
+    if "$ref" in schema:
+        return example(defs[schema["$ref"].split("/")[-1]], defs)
+    if "anyOf" in schema:
+        options = [option for option in schema["anyOf"] if option.get("type") != "null"]
+        return example(options[0], defs) if options else None
+    if "enum" in schema:
+        return schema["enum"][0]
+    kind = schema.get("type")
+    if kind == "object":
+        properties = schema.get("properties", {})
+        return {name: example(value, defs) for name, value in properties.items()}
+    if kind == "array":
+        return []
+    if kind == "string":
+        pattern = schema.get("pattern")
+        if pattern is None:
+            return "stub"
+        return next((e for e in _PATTERN_EXAMPLES if re.search(pattern, e)), "")
+    return {"integer": 0, "number": 0, "boolean": False}.get(kind)
+
+
+def answer(schema) -> str:
+    if not schema:
+        return "{}"
+    value = example(schema, schema.get("$defs", {}))
+    return json.dumps(value, ensure_ascii=False)
+
+
+def pieces(text):
+    for i in range(0, len(text), piece_chars):
+        time.sleep(token_seconds)
+        yield text[i : i + piece_chars]
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, status, body, content_type="application/json"):
+        data = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, content_type, lines):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for line in lines:
+            data = line.encode()
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_GET(self):
+        if self.path in ("/api/tags", "/api/ps"):
+            models = [{"name": model, "model": model} for model in served]
+            self._send(200, json.dumps({"models": models}))
+        elif self.path == "/v1/models":
+            models = [{"id": model, "object": "model"} for model in served]
+            self._send(200, json.dumps({"object": "list", "data": models}))
+        else:
+            self._send(404, json.dumps({"error": "not found"}))
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if request.get("model") not in served:
+            error = f"model '{request.get('model')}' not found"
+            self._send(404, json.dumps({"error": error}))
+        elif self.path == "/api/chat":
+            self._ollama_chat(request)
+        elif self.path == "/v1/chat/completions":
+            response_format = request.get("response_format") or {}
+            self._openai_chat(request, response_format.get("json_schema", {}))
+        else:
+            self._send(404, json.dumps({"error": "not found"}))
+
+    def _ollama_chat(self, request):
+        content = answer(request.get("format"))
+        created_at = datetime.datetime.now(datetime.UTC).isoformat()
+
+        def chunk(piece, done):
+            return {
+                "model": request["model"],
+                "created_at": created_at,
+                "message": {"role": "assistant", "content": piece},
+                "done": done,
+            }
+
+        if not request.get("stream", True):
+            self._send(200, json.dumps(chunk(content, True)))
+            return
+        lines = (json.dumps(chunk(piece, False)) + "\n" for piece in pieces(content))
+        done = [json.dumps({**chunk("", True), "done_reason": "stop"}) + "\n"]
+        self._stream("application/x-ndjson", itertools.chain(lines, done))
+
+    def _openai_chat(self, request, json_schema):
+        content = answer(json_schema.get("schema"))
+        created = int(time.time())
+
+        def chunk(delta, finish_reason=None):
+            return {
+                "id": f"chatcmpl-{created}",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": request["model"],
+                "choices": [
+                    {"index": 0, "delta": delta, "finish_reason": finish_reason}
+                ],
+            }
+
+        if not request.get("stream"):
+            message = {"role": "assistant", "content": content}
+            completion = {
+                **chunk({}, "stop"),
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+            }
+            self._send(200, json.dumps(completion))
+            return
+        lines = (
+            f"data: {json.dumps(chunk({'content': piece}))}\n\n"
+            for piece in pieces(content)
+        )
+        done = [f"data: {json.dumps(chunk({}, 'stop'))}\n\n", "data: [DONE]\n\n"]
+        self._stream("text/event-stream", itertools.chain(lines, done))
+
+
+server = http.server.ThreadingHTTPServer(("localhost", port), Handler)
+print(f"Serving {served} on http://localhost:{port} (Ollama) and /v1 (OpenAI)")
+server.serve_forever()
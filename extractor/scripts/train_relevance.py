@@ -0,0 +1,65 @@
+import json
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import config  # noqa: E402
+import reader  # noqa: E402
+import relevance  # noqa: E402
+import utils  # noqa: E402
+
+# Publications of the inputs in INPUT_PATH are labeled by their JSON outputs
+# in OUTPUT_PATH: those with a result are relevant, the others are not. The
+# ground truth publications of the experiments are all relevant.
+ground_truth_path = (
+    Path(__file__).resolve().parents[2] / "experiments/resources/ground_truth_data.json"
+)
+model_path = Path(sys.argv[1]) if len(sys.argv) > 1 else Path("relevance.json")
+folds = 5
+
+
+def labeled_publications():
+    seen = set()
+    for name, stream in reader.iter_sources(config.INPUT_PATH):
+        output_path = config.OUTPUT_PATH / f"{name}.json"
+        if not output_path.exists():
+            print(f"Skipping {name}, which has no JSON output")
+            continue
+        results = json.loads(output_path.read_text(encoding="utf-8"))
+        for publication in reader.iter_publications(stream):
+            seen.add(publication.codigo)
+            yield publication, results.get(publication.codigo) is not None
+    if ground_truth_path.exists():
+        with ground_truth_path.open(encoding="utf-8") as stream:
+            for publication in reader.iter_publications(stream):
+                if publication.codigo not in seen:
+                    yield publication, True
+
+
+examples = [
+    (publication.titulo, utils.clean_html_text(publication.texto), relevant)
+    for publication, relevant in labeled_publications()
+]
+relevant = sum(example[2] for example in examples)
+print(f"Examples: {relevant} relevant, {len(examples) - relevant} irrelevant")
+
+# Cross-validation shows how many relevant publications the threshold loses.
+random.Random(42).shuffle(examples)
+lost = skipped = 0
+for fold in range(folds):
+    model = relevance.train(
+        example for i, example in enumerate(examples) if i % folds != fold
+    )
+    for titulo, body, is_relevant in examples[fold::folds]:
+        if model.score(titulo, body) < config.RELEVANCE_THRESHOLD:
+            skipped += 1
+            lost += is_relevant
+print(
+    f"Cross-validation at threshold {config.RELEVANCE_THRESHOLD}: "
+    f"{skipped} skipped, {lost} of them relevant"
+)
+
+relevance.train(examples).save(model_path)
+print(f"Wrote {model_path}")
@@ -0,0 +1,138 @@
+import datetime
+import json
+import os
+import pathlib
+import shutil
+from typing import Any, Dict, Iterable, List
+
+import config
+import models
+
+SUFFIXES = {"json": ".json", "parquet": ".parquet"}
+
+# Enum fields, stored as dictionary-encoded columns in Parquet.
+_DICTIONARY_FIELDS = {
+    "tipo_do_documento",
+    "municipio",
+    "modalidade",
+    "formato_da_modalidade",
+}
+# Hive's name for the partition of rows without a value.
+_NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+
+def write_json(path: pathlib.Path, entries: Iterable[Dict[str, Any]]) -> None:
+    """
+    Writes the entries as a single `{codigo: result}` JSON object.
+    """
+    results = {entry["codigo"]: entry["result"] for entry in entries}
+    path.write_text(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+def _parquet_schema():
+    import pyarrow as pa
+
+    fields = [
+        pa.field("codigo", pa.string(), nullable=False),
+        pa.field("publicado_em", pa.timestamp("s")),
+    ]
+    for name in models.Licitacao.model_fields:
+        if name in _DICTIONARY_FIELDS:
+            fields.append(pa.field(name, pa.dictionary(pa.int16(), pa.string())))
+        else:
+            fields.append(pa.field(name, pa.string()))
+    return pa.schema(fields)
+
+
+def _row(entry: Dict[str, Any]) -> Dict[str, Any]:
+    data = entry.get("data")
+    return {
+        "codigo": entry["codigo"],
+        "publicado_em": datetime.datetime.fromisoformat(data) if data else None,
+        **entry["result"],
+    }
+
+
+def write_parquet(
+    path: pathlib.Path,
+    entries: Iterable[Dict[str, Any]],
+    batch_size: int = config.PARQUET_BATCH_SIZE,
+    compression: str = config.PARQUET_COMPRESSION,
+) -> None:
+    """
+    Writes the entries as a Parquet dataset partitioned by publication date.
+
+    Rows are buffered per partition and written as record batches of
+    batch_size rows to `path/data=<YYYY-MM-DD>/part-0.parquet`.
+
+    Args:
+        path: The dataset directory, which must not exist.
+        entries: Checkpoint entries with codigo, data and result.
+        batch_size: Number of rows of each record batch.
+        compression: Parquet compression codec.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as error:
+        raise ImportError(
+            'OUTPUT_FORMAT = "parquet" requires pyarrow: uv sync --extra parquet'
+        ) from error
+
+    schema = _parquet_schema()
+    writers = {}
+    buffers: Dict[str, List[Dict[str, Any]]] = {}
+
+    def flush(partition: str) -> None:
+        if partition not in writers:
+            directory = path / f"data={partition}"
+            directory.mkdir(parents=True)
+            writers[partition] = pq.ParquetWriter(
+                directory / "part-0.parquet", schema, compression=compression
+            )
+        batch = pa.RecordBatch.from_pylist(buffers.pop(partition), schema=schema)
+        writers[partition].write_batch(batch)
+
+    path.mkdir()
+    try:
+        for entry in entries:
+            partition = (entry.get("data") or "")[:10] or _NULL_PARTITION
+            buffers.setdefault(partition, []).append(_row(entry))
+            if len(buffers[partition]) >= batch_size:
+                flush(partition)
+        for partition in list(buffers):
+            flush(partition)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+
+_WRITERS = {"json": write_json, "parquet": write_parquet}
+
+
+def write(
+    path: pathlib.Path, entries: Iterable[Dict[str, Any]], output_format: str
+) -> None:
+    """
+    Writes the output of an input source in the given format.
+
+    The output is written to a temporary path and renamed, so it is either
+    complete or absent.
+
+    Args:
+        path: The output file (JSON) or directory (Parquet).
+        entries: Checkpoint entries with codigo, data and result.
+        output_format: One of SUFFIXES.
+    """
+    tmp_path = path.with_name(path.name + ".tmp")
+    _remove(tmp_path)
+    _WRITERS[output_format](tmp_path, entries)
+    _remove(path)
+    os.replace(tmp_path, path)
+
+
+def _remove(path: pathlib.Path) -> None:
+    if path.is_dir():
+        shutil.rmtree(path)
+    else:
+        path.unlink(missing_ok=True)
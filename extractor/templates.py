@@ -0,0 +1,319 @@
+import collections
+import json
+import pathlib
+import re
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import models
+import municipios
+import rules
+
+# A label is a short text ending in ":" at the start of a line, such as
+# "a) Nr. Processo:" in the documents of IPM Atende.Net.
+_LABEL = re.compile(r"^\s*([^:\n]{2,40}):[ \t]*(.*)$")
+_MAX_LABEL_WORDS = 5
+TITULO = "#titulo"
+
+_NUMERO = re.compile(r"(\d+)\s*[/.\-]\s*(\d{4}|\d{2})\b")
+_DATA = re.compile(r"\b(\d{1,2})/(\d{1,2})/(\d{4})\b")
+_HORA = re.compile(r"\b(\d{1,2})\s*(?::|h)\s*(\d{2})\b", re.IGNORECASE)
+
+
+class Rule(NamedTuple):
+    label: str
+    transform: str
+    confidence: float
+    support: int
+
+
+class Template(NamedTuple):
+    labels: List[str]
+    examples: int
+    rules: Dict[str, Rule]
+
+
+def _label(text: str) -> Optional[str]:
+    # Digits are dropped, as item letters and numbers change between copies.
+    words = [
+        "0" if any(c.isdigit() for c in word) else word
+        for word in municipios.normalize(text).split()
+    ]
+    if not words or len(words) > _MAX_LABEL_WORDS:
+        return None
+    return " ".join(words)
+
+
+def _is_label(line: str) -> bool:
+    match = _LABEL.match(line)
+    return match is not None and _label(match.group(1)) is not None
+
+
+def label_values(titulo: str, text: str) -> Dict[str, str]:
+    """
+    Reads the labeled values of a document.
+
+    A value is the rest of its label line or, when that is empty, the first
+    line below it, followed in both cases by the lines that continue it up to
+    a blank line, the next label or the end of a sentence.
+
+    Returns:
+        The value of the first occurrence of every label, in document order,
+        and the titulo under TITULO.
+    """
+    values = {TITULO: titulo.strip()}
+    lines = text.splitlines()
+    for i, line in enumerate(lines):
+        match = _LABEL.match(line)
+        label = match and _label(match.group(1))
+        if not label or label in values:
+            continue
+        parts = [match.group(2).strip()] if match.group(2).strip() else []
+        for following in lines[i + 1 :]:
+            if _is_label(following) or (parts and not following.strip()):
+                break
+            if following.strip():
+                parts.append(following.strip())
+            if parts and parts[-1].endswith((".", ";")):
+                break
+        values[label] = " ".join(parts)
+    return values
+
+
+def layout(values: Dict[str, str]) -> List[str]:
+    """
+    Returns:
+        The fingerprint of the layout of a document: its labels.
+    """
+    return [label for label in values if label != TITULO]
+
+
+def _text(value: str) -> Optional[str]:
+    return value or None
+
+
+def _numero(value: str) -> Optional[str]:
+    match = _NUMERO.search(value)
+    return match and f"{match.group(1)}/{match.group(2)}"
+
+
+def _data(value: str) -> Optional[str]:
+    data = _DATA.search(value)
+    hora = _HORA.search(value[data.end() :]) if data else None
+    if hora is None:
+        return None
+    dia, mes, ano = data.groups()
+    return (
+        f"{ano}-{int(mes):02d}-{int(dia):02d}T{int(hora.group(1)):02d}:{hora.group(2)}"
+    )
+
+
+def _enum(choices) -> Callable[[str], Optional[str]]:
+    names = {municipios.normalize(choice.value): choice.value for choice in choices}
+    # Longer names first, so "Pregão Eletrônico" is not read as "Pregão".
+    pattern = re.compile(
+        r"\b(" + "|".join(sorted(map(re.escape, names), key=len, reverse=True)) + r")\b"
+    )
+
+    def transform(value: str) -> Optional[str]:
+        found = {names[name] for name in pattern.findall(municipios.normalize(value))}
+        return found.pop() if len(found) == 1 else None
+
+    return transform
+
+
+TRANSFORMS: Dict[str, Callable[[str], Optional[str]]] = {
+    "text": _text,
+    "numero": _numero,
+    "data": _data,
+    "tipo_do_documento": _enum(models.TipoDoDocumento),
+    "municipio": _enum(models.Municipio),
+    "modalidade": _enum(models.Modalidade),
+    "formato_da_modalidade": _enum(models.FormatoDaModalidade),
+}
+
+_FIELD_TRANSFORMS = {
+    "tipo_do_documento": "tipo_do_documento",
+    "numero_do_processo_licitatorio": "numero",
+    "municipio": "municipio",
+    "modalidade": "modalidade",
+    "formato_da_modalidade": "formato_da_modalidade",
+    "numero_da_modalidade": "numero",
+    "objeto": "text",
+    "data_de_abertura": "data",
+    "site_do_edital": "text",
+    "signatario": "text",
+    "cargo_do_signatario": "text",
+}
+
+
+def _same(first: Optional[str], second: Any) -> bool:
+    return (
+        first is not None
+        and isinstance(second, str)
+        and municipios.normalize(first) == municipios.normalize(second)
+    )
+
+
+def similarity(first: List[str], second: List[str]) -> float:
+    union = set(first) | set(second)
+    return len(set(first) & set(second)) / len(union) if union else 0.0
+
+
+def match(templates: List[Template], labels: List[str], threshold: float) -> int:
+    """
+    Returns:
+        The index of the template most similar to a layout, or -1 when none
+        reaches the threshold.
+    """
+    best, best_value = -1, threshold
+    for i, template in enumerate(templates):
+        value = similarity(template.labels, labels)
+        if value >= best_value:
+            best, best_value = i, value
+    return best
+
+
+def _induce_rules(
+    examples: List[Tuple[Dict[str, str], Dict[str, Any]]], min_support: int
+) -> Dict[str, Rule]:
+    rules_by_field = {}
+    for field, transform_name in _FIELD_TRANSFORMS.items():
+        transform = TRANSFORMS[transform_name]
+        known = [
+            (values, result[field]) for values, result in examples if result.get(field)
+        ]
+        if len(known) < min_support:
+            continue
+        hits: collections.Counter = collections.Counter()
+        for values, expected in known:
+            for label, value in values.items():
+                if _same(transform(value), expected):
+                    hits[label] += 1
+        if not hits:
+            continue
+        # Ties go to the label found first, usually the header.
+        label, support = hits.most_common(1)[0]
+        # Values read where the result is null count against the wrapper.
+        applied = sum(
+            bool(result.get(field))
+            or (label in values and transform(values[label]) is not None)
+            for values, result in examples
+        )
+        if support >= min_support:
+            rules_by_field[field] = Rule(
+                label, transform_name, support / applied, support
+            )
+    return rules_by_field
+
+
+def induce(
+    examples: Iterable[Tuple[str, str, Dict[str, Any]]],
+    similarity_threshold: float,
+    min_support: int,
+) -> List[Template]:
+    """
+    Clusters documents by layout and induces the wrappers of every cluster.
+
+    A document joins the cluster with the most similar layout, or starts a
+    new one when none is similar enough. For every field, the wrapper of a cluster is the label
+    whose value, read as the field, most often equals the validated result.
+    Its confidence is the share of the cluster documents where it reads the
+    result: a value read where the result is null counts as a miss.
+
+    Args:
+        examples: The titulo, cleaned text and validated result of past
+            publications.
+        similarity_threshold: Minimum Jaccard similarity of the labels of a
+            document and a cluster.
+        min_support: Minimum number of results reproduced by a wrapper, and
+            of documents in a kept cluster.
+
+    Returns:
+        The templates with at least one wrapper.
+    """
+    clusters: List[Tuple[List[str], List[Tuple[Dict[str, str], Dict[str, Any]]]]] = []
+    for titulo, text, result in examples:
+        values = label_values(titulo, text)
+        labels = layout(values)
+        if not labels:
+            continue
+        templates = [Template(cluster[0], 0, {}) for cluster in clusters]
+        i = match(templates, labels, similarity_threshold)
+        if i < 0:
+            i = len(clusters)
+            clusters.append((labels, []))
+        clusters[i][1].append((values, result))
+
+    templates = []
+    for labels, members in clusters:
+        if len(members) < min_support:
+            continue
+        induced = _induce_rules(members, min_support)
+        if induced:
+            templates.append(Template(labels, len(members), induced))
+    return templates
+
+
+def save(path: pathlib.Path, templates: List[Template]) -> None:
+    data = [
+        {
+            "labels": template.labels,
+            "examples": template.examples,
+            "rules": {field: rule._asdict() for field, rule in template.rules.items()},
+        }
+        for template in templates
+    ]
+    path.write_text(json.dumps(data, indent=2, ensure_ascii=False))
+
+
+def load(path: pathlib.Path) -> List[Template]:
+    return [
+        Template(
+            item["labels"],
+            item["examples"],
+            {field: Rule(**rule) for field, rule in item["rules"].items()},
+        )
+        for item in json.loads(path.read_text(encoding="utf-8"))
+    ]
+
+
+class Wrappers:
+    """
+    Fills fields with the wrappers of the template of a document.
+    """
+
+    def __init__(
+        self,
+        templates: List[Template],
+        similarity_threshold: float,
+        min_confidence: float,
+    ):
+        """
+        Args:
+            templates: The induced templates.
+            similarity_threshold: Minimum similarity of a document and the
+                layout of its template.
+            min_confidence: Minimum confidence of a wrapper that is used.
+        """
+        self.templates = templates
+        self.similarity_threshold = similarity_threshold
+        self.min_confidence = min_confidence
+
+    def extract(self, titulo: str, text: str) -> Tuple[int, Dict[str, Any]]:
+        """
+        Returns:
+            The index of the template of the document, -1 when it has none,
+            and the valid fields filled by its confident wrappers.
+        """
+        values = label_values(titulo, text)
+        i = match(self.templates, layout(values), self.similarity_threshold)
+        if i < 0:
+            return i, {}
+        fields = {}
+        for field, rule in self.templates[i].rules.items():
+            if rule.confidence < self.min_confidence or rule.label not in values:
+                continue
+            value = TRANSFORMS[rule.transform](values[rule.label])
+            if value is not None:
+                fields[field] = value
+        return i, rules.valid_fields(fields)
@@ -2,14 +2,88 @@ import functools
 import html
 import re
 import time
+from html.parser import HTMLParser
 
 import log
-from bs4 import BeautifulSoup
 from pydantic import ValidationError
 
 logger = log.get_logger(__name__)
 
 
+_INVISIBLE_TAGS = frozenset({"script", "style", "template"})
+_PRESERVE_WHITESPACE_TAGS = frozenset({"pre", "textarea"})
+_ASCII_SPACES = re.compile(r"[ \t\n\r\f]*")
+_REMOVED_CHARS = str.maketrans({"\x00": None, "\ufffd": None})
+_NEW_LINES = re.compile(r"\n{2,}")
+_SPACES = re.compile(r" +")
+
+
+class _TextExtractor(HTMLParser):
+    """
+    Collects the visible text of an HTML document in a single pass, the same
+    way BeautifulSoup(text, "html.parser").get_text() does, without building
+    a tree.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._data = []
+        self._invisible = 0
+        self._preserve_whitespace = 0
+
+    def _end_data(self):
+        if not self._data:
+            return
+        data = "".join(self._data)
+        self._data = []
+        if self._invisible:
+            return
+        # Like BeautifulSoup, a run of whitespace between two tags becomes a
+        # single newline or space.
+        if not self._preserve_whitespace and _ASCII_SPACES.fullmatch(data):
+            data = "\n" if "\n" in data else " "
+        self.parts.append(data)
+
+    def handle_starttag(self, tag, attrs):
+        self._end_data()
+        if tag in _INVISIBLE_TAGS:
+            self._invisible += 1
+        elif tag in _PRESERVE_WHITESPACE_TAGS:
+            self._preserve_whitespace += 1
+
+    def handle_startendtag(self, tag, attrs):
+        self._end_data()
+
+    def handle_endtag(self, tag):
+        self._end_data()
+        if tag in _INVISIBLE_TAGS and self._invisible:
+            self._invisible -= 1
+        elif tag in _PRESERVE_WHITESPACE_TAGS and self._preserve_whitespace:
+            self._preserve_whitespace -= 1
+
+    def handle_data(self, data):
+        self._data.append(data)
+
+    def handle_comment(self, data):
+        self._end_data()
+
+    def handle_decl(self, decl):
+        self._end_data()
+
+    def handle_pi(self, data):
+        self._end_data()
+
+    def unknown_decl(self, data):
+        self._end_data()
+        if data.startswith("CDATA["):
+            self.parts.append(data[len("CDATA[") :])
+
+    def close(self):
+        super().close()
+        self._end_data()
+
+
 def clean_html_text(input_text: str) -> str:
     """
     Cleans HTML text by removing tags and normalizing whitespace.
@@ -20,10 +94,13 @@ def clean_html_text(input_text: str) -> str:
     Returns:
         The cleaned text.
     """
-    text_without_html = BeautifulSoup(input_text, "html.parser").get_text()
-    text_unescaped = html.unescape(text_without_html)
-    text_normalized_x00 = re.sub(r"\x00", "", text_unescaped)
-    text_normalized_fffd = re.sub(r"\uFFFD", "", text_normalized_x00)
-    text_normalized_new_lines = re.sub(r"\n{2, }", "\n\n", text_normalized_fffd)
-    text_normalized_spaces = re.sub(r" +", " ", text_normalized_new_lines)
-    return text_normalized_spaces.strip().strip("\n").strip("\r")
+    parser = _TextExtractor()
+    parser.feed(input_text)
+    parser.close()
+    text = "".join(parser.parts)
+    if "&" in text:
+        text = html.unescape(text)
+    text = text.translate(_REMOVED_CHARS)
+    text = _NEW_LINES.sub("\n\n", text)
+    text = _SPACES.sub(" ", text)
+    return text.strip()
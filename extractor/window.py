@@ -0,0 +1,142 @@
+import re
+from typing import List, NamedTuple, Pattern, Tuple
+
+_PIECES = re.compile(r"\w+|[^\w\s]")
+_UNITS = re.compile(r"[^\n]*\n|[^\n]+$")
+_MAX_UNIT_CHARS = 800
+
+# Lines that mention these usually carry the extracted fields, so they are the
+# last ones dropped from the middle of a document.
+RELEVANT = re.compile(
+    r"objeto|abertura|edital|modalidade|processo|preg[aã]o|licita|dispensa|"
+    r"inexigibilidade|homologa|munic[ií]pio|data|prazo|sess[aã]o|https?://|www\.|"
+    r"\d{1,2}/\d{1,2}/\d{4}|\d+/\d{4}",
+    re.IGNORECASE,
+)
+
+MARKER = "[...]\n"
+
+
+class Window(NamedTuple):
+    text: str
+    tokens: int
+    dropped_tokens: int
+    dropped_lines: List[Tuple[int, int]]
+
+
+def count_tokens(text: str) -> int:
+    """
+    Estimates the number of tokens of a text.
+
+    Every word or punctuation mark counts as one token per four characters,
+    rounded up, which stays close to the Llama tokenizer on Portuguese text
+    and never exceeds the number of characters.
+
+    Args:
+        text: The text to measure.
+
+    Returns:
+        The estimated number of tokens.
+    """
+    return sum((len(piece) + 3) // 4 for piece in _PIECES.findall(text))
+
+
+def _split_units(text: str) -> List[str]:
+    units = []
+    for line in _UNITS.findall(text):
+        # Very long lines (text without line breaks) are cut at spaces so
+        # that they can still be partially kept.
+        while len(line) > _MAX_UNIT_CHARS:
+            cut = line.rfind(" ", 0, _MAX_UNIT_CHARS) + 1 or _MAX_UNIT_CHARS
+            units.append(line[:cut])
+            line = line[cut:]
+        units.append(line)
+    return units
+
+
+def fit(
+    text: str,
+    budget: int,
+    head_share: float = 0.5,
+    tail_share: float = 0.25,
+    relevant: Pattern = RELEVANT,
+) -> Window:
+    """
+    Fits a document into a token budget.
+
+    The head of the document (header, process numbers) and its tail
+    (signatário, cargo) are kept, and the budget left in between goes to the
+    middle lines that look most relevant. Every dropped run of lines is
+    replaced by a marker.
+
+    Args:
+        text: The cleaned text of the document.
+        budget: Maximum number of tokens for the text.
+        head_share: Share of the budget reserved for the beginning.
+        tail_share: Share of the budget reserved for the end.
+        relevant: Pattern of the relevant lines, the most matching ones kept
+            first.
+
+    Returns:
+        A Window with the fitted text, its estimated tokens, the tokens
+        dropped and the (first, last) line numbers of every dropped run.
+    """
+    # An estimate never exceeds the number of characters, so short texts
+    # are returned without being counted.
+    if len(text) <= budget:
+        return Window(text, len(text), 0, [])
+    total = count_tokens(text)
+    if total <= budget:
+        return Window(text, total, 0, [])
+
+    units = _split_units(text)
+    costs = [count_tokens(unit) for unit in units]
+    keep = [False] * len(units)
+    marker_cost = count_tokens(MARKER)
+    # One marker is always needed for the gap after the head; every middle
+    # unit that is kept may open one more gap.
+    available = budget - marker_cost
+
+    used = 0
+    head_end = 0
+    while head_end < len(units) and used + costs[head_end] <= available * head_share:
+        used += costs[head_end]
+        keep[head_end] = True
+        head_end += 1
+
+    tail_start = len(units)
+    tail_used = 0
+    while (
+        tail_start > head_end
+        and tail_used + costs[tail_start - 1] <= available * tail_share
+    ):
+        tail_start -= 1
+        tail_used += costs[tail_start]
+        keep[tail_start] = True
+    used += tail_used
+
+    middle = sorted(
+        range(head_end, tail_start),
+        key=lambda i: (-len(relevant.findall(units[i])), i),
+    )
+    for i in middle:
+        if used + costs[i] + marker_cost <= available:
+            keep[i] = True
+            used += costs[i] + marker_cost
+
+    parts = []
+    dropped_lines = []
+    line = 1
+    for i, unit in enumerate(units):
+        if keep[i]:
+            parts.append(unit)
+        elif i == 0 or keep[i - 1]:
+            parts.append(MARKER)
+            dropped_lines.append((line, line))
+        else:
+            dropped_lines[-1] = (dropped_lines[-1][0], line)
+        line += unit.count("\n")
+
+    fitted = "".join(parts)
+    tokens = count_tokens(fitted)
+    return Window(fitted, tokens, total - tokens, dropped_lines)